@@ -0,0 +1,115 @@
+import threading
+import csv
+import os
+
+MESSAGES_F = r'MESSAGES.csv'
+
+SIGN = 'Sign'            # запрос подписи транзакции получателю и ответ (User.__perform)
+SUBMIT = 'Submit'        # передача блока в очередь узла-хранилища (Storage.add_new_block)
+BROADCAST = 'Broadcast'  # рассылка блока другому узлу-хранилищу на шаге 1 (Storage.send_shared)
+NOTIFY = 'Notify'        # уведомление участника о внедрённом или отклонённом блоке на шаге 2
+KINDS = (SIGN, SUBMIT, BROADCAST, NOTIFY)
+
+FIELDS = ['Performed', 'Storage'] + [f for kind in KINDS for f in (kind, f"{kind}Bytes")]
+
+
+class Accountant:
+    """
+    Учёт логических сообщений протокола и их размера в сериализованном виде (JSON блока или
+    транзакции) по узлам-хранилищам. Сообщение относится к узлу-хранилищу, который его отправляет
+    (для подписи - к узлу отправителя транзакции, для передачи в очередь - к узлу-получателю).
+    На границе итерации счётчики дописываются в MESSAGES.csv строкой на узел-хранилище и обнуляются,
+    итоги всех запусков модели (messages, формат summary) попадают в сводку модели (Model.manifest).
+    Счётчики защищены блокировкой: при -E async --threads узлы-хранилища считают сообщения из потоков
+    """
+
+    def __init__(self, path_to_dir: str, stgs: list):
+        """
+        :param path_to_dir: путь к дирректории модели
+        :param stgs: узлы-хранилища модели
+        """
+        self.index = {s: i for i, s in enumerate(stgs)}
+        path = os.path.join(path_to_dir, MESSAGES_F)
+        new = not os.path.isfile(path) or os.path.getsize(path) == 0
+        self.file = open(path, "a", newline='')
+        self.writer = csv.DictWriter(self.file, FIELDS)
+        if new:
+            self.writer.writeheader()
+        self.current = [dict.fromkeys(FIELDS[2:], 0) for _ in stgs]
+        self.totals = dict.fromkeys(FIELDS[2:], 0)
+        # итоги предыдущих запусков читаются один раз
+        self.messages = (None if new else summary(path_to_dir)) or \
+            {"iterations": 0, "kinds": {kind: [0, 0] for kind in KINDS}, "storages": []}
+        self.messages["storages"].extend([0, 0] for _ in range(len(stgs) - len(self.messages["storages"])))
+        self.lock = threading.Lock()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def count(self, stg, kind: str, size: int, n: int = 1):
+        """
+        :param stg: узел-хранилище, к которому относятся сообщения
+        :param kind: вид сообщений (KINDS)
+        :param size: суммарный размер сообщений, байт
+        :param n: количество сообщений
+        """
+        row = self.current[self.index[stg]]
+        with self.lock:
+            row[kind] += n
+            row[f"{kind}Bytes"] += size
+
+    def iteration(self, performed: int):
+        """
+        Запись счётчиков завершённой итерации
+        :param performed: номер итерации
+        """
+        kinds, storages = self.messages["kinds"], self.messages["storages"]
+        with self.lock:
+            for i, row in enumerate(self.current):
+                self.writer.writerow({'Performed': performed, 'Storage': i, **row})
+                for kind in KINDS:
+                    n, size = row[kind], row[f"{kind}Bytes"]
+                    kinds[kind][0] += n
+                    kinds[kind][1] += size
+                    storages[i][0] += n
+                    storages[i][1] += size
+                for k, v in row.items():
+                    self.totals[k] += v
+                    row[k] = 0
+            self.messages["iterations"] += 1
+        self.file.flush()
+
+    def get_stat(self):
+        stat = {"Messages": sum(self.totals[kind] for kind in KINDS),
+                "MsgBytes": sum(self.totals[f"{kind}Bytes"] for kind in KINDS)}
+        stat.update({f"{kind}Msgs": self.totals[kind] for kind in KINDS})
+        return stat
+
+
+def summary(path_to_dir: str):
+    """
+    Итоги MESSAGES.csv модели
+    :param path_to_dir: путь к дирректории модели
+    :return: {"iterations", "kinds": {вид: [сообщений, байт]}, "storages": [[сообщений, байт]]}
+    или None, если учёт сообщений не включался
+    """
+    path = os.path.join(path_to_dir, MESSAGES_F)
+    if not os.path.isfile(path):
+        return None
+    kinds = {kind: [0, 0] for kind in KINDS}
+    storages = []
+    iterations = set()
+    with open(path, "r", newline='') as file:
+        for row in csv.DictReader(file):
+            iterations.add(int(row['Performed']))
+            i = int(row['Storage'])
+            storages.extend([0, 0] for _ in range(i + 1 - len(storages)))
+            for kind in KINDS:
+                n, size = int(row[kind]), int(row[f"{kind}Bytes"])
+                kinds[kind][0] += n
+                kinds[kind][1] += size
+                storages[i][0] += n
+                storages[i][1] += size
+    return {"iterations": len(iterations), "kinds": kinds, "storages": storages}
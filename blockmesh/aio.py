@@ -0,0 +1,248 @@
+import asyncio
+import threading
+import time
+import blockmesh.node as node
+
+BLOCK = 0    # блок от участника
+SHARE = 1    # блок, разосланный на шаге 1
+STEP_1 = 2   # шаг 1 раунда консенсуса
+STEP_2 = 3   # шаг 2 раунда консенсуса
+STOP = 4
+
+
+class Channel:
+    """
+    Односторонний канал связи с задержкой и ограниченной пропускной способностью
+    """
+
+    def __init__(self, delay: float = 0.0, bandwidth: float = None):
+        """
+        :param delay: задержка доставки сообщения, с
+        :param bandwidth: пропускная способность, байт/с (None - без ограничений)
+        """
+        if delay < 0:
+            raise ValueError(f"Delay must be >= 0: {delay}")
+        if bandwidth is not None and bandwidth <= 0:
+            raise ValueError(f"Bandwidth must be > 0: {bandwidth}")
+        self.delay = delay
+        self.bandwidth = bandwidth
+        self.free_at = 0.0
+        self.messages = 0
+        self.bytes = 0
+
+    async def transfer(self, size: int):
+        """
+        Передача сообщения: сообщения одного канала передаются последовательно
+        :param size: размер сообщения, байт
+        """
+        now = asyncio.get_running_loop().time()
+        start = max(now, self.free_at)
+        self.free_at = start + (size / self.bandwidth if self.bandwidth else 0)
+        self.messages += 1
+        self.bytes += size
+        await asyncio.sleep(self.free_at - now + self.delay)
+
+
+class StorageTask:
+    """
+    Узел-хранилище как asyncio-задача с входящей очередью сообщений.
+    Полученные блоки применяются на границах шагов в каноническом порядке,
+    поэтому результат не зависит от задержек каналов
+    """
+
+    def __init__(self, stg, index: int, runtime):
+        self.stg = stg
+        self.index = index
+        self.runtime = runtime
+        self.inbox = asyncio.Queue()
+        self.blocks = []
+        self.shared = []
+        self.max_depth = 0
+        self.error = None
+
+    async def serve(self):
+        while True:
+            kind, payload = await self.inbox.get()
+            try:
+                if kind == STOP:
+                    return
+                self.handle(kind, payload)
+                if kind == STEP_2:
+                    if self.runtime.threads:
+                        await asyncio.to_thread(self.stg.perform_step_2, payload)
+                    else:
+                        self.stg.perform_step_2(payload)
+            except Exception as e:
+                self.error = e
+            finally:
+                self.inbox.task_done()
+
+    def put(self, kind: int, payload=None):
+        self.inbox.put_nowait((kind, payload))
+        self.max_depth = max(self.max_depth, self.inbox.qsize())
+
+    def handle(self, kind: int, payload):
+        if kind == BLOCK:
+            self.blocks.append(payload)
+        elif kind == SHARE:
+            self.shared.append(payload)
+        elif kind == STEP_1:
+            self.blocks.sort(key=lambda msg: msg[0])
+            for _, block in self.blocks:
+                if self.stg.available:
+                    self.stg.add_new_block(block)
+                else:
+                    self.runtime.dropped += 1
+            self.blocks.clear()
+            self.runtime.origin = self.index
+            self.stg.perform_step_1()
+            # собственные блоки узла встают в общий порядок рассылки
+            own = self.stg.shared_blocks
+            entries = own.items() if isinstance(own, dict) else [(block, None) for block in own]
+            for block, count in entries:
+                self.shared.append(((self.index, self.runtime.next_seq()), block, count))
+            own.clear()
+        elif kind == STEP_2:
+            self.shared.sort(key=lambda msg: msg[0])
+            for _, block, count in self.shared:
+                self.stg.receive_shared(block, count)
+            self.shared.clear()
+
+
+class AsyncRuntime:
+    """
+    Режим моделирования, в котором узлы-хранилища - asyncio-задачи, обменивающиеся
+    сообщениями через каналы связи с задержкой и пропускной способностью
+    """
+
+    def __init__(self, delay: float = 0.0, bandwidth: float = None, threads: bool = False):
+        """
+        :param delay: задержка каналов, с
+        :param bandwidth: пропускная способность каналов, байт/с
+        :param threads: выполнять шаг 2 (запись блоков на диск) в потоках, перекрывая ввод-вывод узлов.
+        Общее для узлов состояние (справочник, арена, учёт) меняется под Storage.lock
+        """
+        self.delay = delay
+        self.bandwidth = bandwidth
+        self.threads = threads
+        self.channels = {}
+        self.nodes = {}
+        self.pending = set()
+        self.loop = None
+        self.origin = None
+        self.seq = 0
+        self.dropped = 0
+        self.wall = 0.0
+        self.model = None
+
+    def get_stat(self):
+        messages = sum(ch.messages for ch in self.channels.values())
+        size = sum(ch.bytes for ch in self.channels.values())
+        blocks = self.model.stgs[0].block_count if self.model else 0
+        return {"Messages": messages,
+                "Bytes": size,
+                "Dropped": self.dropped,
+                "MaxInbox": max([n.max_depth for n in self.nodes.values()], default=0),
+                "Wall": round(self.wall, 3),
+                "BlocksPerSec": round(blocks / self.wall, 1) if self.wall else 0}
+
+    def next_seq(self):
+        self.seq += 1
+        return self.seq
+
+    def channel(self, src, dst):
+        key = (src, dst)
+        if key not in self.channels:
+            self.channels[key] = Channel(self.delay, self.bandwidth)
+        return self.channels[key]
+
+    def run(self, m):
+        """
+        Моделирование сценария модели m
+        :param m: model.Model
+        """
+        self.model = m
+        asyncio.run(self.__run(m))
+
+    async def __run(self, m):
+        self.loop = asyncio.get_running_loop()
+        self.nodes = {stg: StorageTask(stg, i, self) for i, stg in enumerate(m.stgs)}
+        tasks = [asyncio.create_task(n.serve()) for n in self.nodes.values()]
+        lock = threading.Lock() if self.threads else node.NO_LOCK
+        for stg in m.stgs:
+            stg.link = self.share
+            stg.lock = lock
+        for usr in m.usrs:
+            usr.link = self.submit
+        start = time.perf_counter()
+        try:
+            await asyncio.to_thread(m.simulate, self.__iteration)
+        finally:
+            self.wall = time.perf_counter() - start
+            for stg in m.stgs:
+                stg.link = None
+                stg.lock = node.NO_LOCK
+            for usr in m.usrs:
+                usr.link = None
+            for n in self.nodes.values():
+                n.put(STOP)
+            await asyncio.gather(*tasks)
+
+    def __iteration(self, scenario):
+        """
+        Итерация моделирования (выполняется вне цикла событий)
+        """
+        m = self.model
+        m.usr_step(scenario)
+        rounds, duration, last = m.stg_rounds()
+        for _ in range(rounds):
+            m.trace_round(m.performed + 1)
+            asyncio.run_coroutine_threadsafe(self.__round(m.performed + 1), self.loop).result()
+            m.round_done()
+            m.model_time.tick(duration)
+        m.model_time.tick(last)
+
+    async def __round(self, i):
+        await self.__step(STEP_1)
+        await self.__step(STEP_2, i)
+
+    async def __step(self, kind, payload=None):
+        await self.__barrier()
+        for n in self.nodes.values():
+            n.put(kind, payload)
+        await self.__barrier()
+        for n in self.nodes.values():
+            if n.error is not None:
+                error, n.error = n.error, None
+                raise error
+
+    async def __barrier(self):
+        while True:
+            if self.pending:
+                await asyncio.gather(*list(self.pending))
+            await asyncio.gather(*(n.inbox.join() for n in self.nodes.values()))
+            if not self.pending:
+                return
+
+    def submit(self, user, stg, block):
+        """
+        Канал связи участник -> узел-хранилище (вызывается из потока моделирования)
+        """
+        msg = (self.next_seq(), block)
+        self.loop.call_soon_threadsafe(self.__post, self.channel(user, stg), stg, BLOCK, msg, len(block.dumps()))
+
+    def share(self, stg, peer, block, count=None):
+        """
+        Канал связи узел-хранилище -> узел-хранилище (вызывается из цикла событий на шаге 1)
+        """
+        msg = ((self.origin, self.next_seq()), block, count)
+        self.__post(self.channel(stg, peer), peer, SHARE, msg, len(block.dumps()))
+
+    def __post(self, channel, dst, kind, msg, size):
+        task = asyncio.ensure_future(self.__deliver(channel, dst, kind, msg, size))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def __deliver(self, channel, dst, kind, msg, size):
+        await channel.transfer(size)
+        self.nodes[dst].put(kind, msg)
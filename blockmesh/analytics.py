@@ -0,0 +1,165 @@
+from blockmesh.block import Block, GENESIS_BLOCK
+import blockmesh.model as model
+import blockmesh.codec as codec
+import blockmesh.node as node
+import blockmesh.store as store
+import numpy as np
+import json
+import csv
+import os
+
+PERCENTILES = (50, 90, 99)
+
+
+class Analytics:
+    """
+    Анализ завершённого моделирования: строки RESULT.csv и метаданные блоков узла-хранилища
+    загружаются в массивы NumPy, показатели считаются по массивам целиком
+    """
+
+    def __init__(self, path_to_dir: str, storage: int = 0):
+        """
+        :param path_to_dir: путь к дирректории модели
+        :param storage: номер узла-хранилища, блоки которого анализируются
+        """
+        self.path = os.path.abspath(path_to_dir)
+        with open(os.path.join(self.path, model.MODEL_F), "r") as file:
+            data = json.load(file)
+        self.mod = data['mod']
+        self.usr_num = data['num'][1]
+        self.load_results()
+        self.load_blocks(os.path.join(self.path, model.STG_DIR, f"{model.STG_NODE}{storage}"))
+
+    def load_results(self):
+        """
+        RESULT.csv: performed, global_bm - (строки), local_bm - (строки, участники), queues - (строки, узлы)
+        """
+        performed, global_bm, local_bm, queues = [], [], [], []
+        with open(os.path.join(self.path, model.RESULT_F), "r", newline='') as file:
+            for row in csv.DictReader(file):
+                performed.append(int(row["Performed"]))
+                global_bm.append(int(row["GlobalBM"]))
+                local_bm.append(json.loads(row["LocalBM"]))
+                queues.append(json.loads(row["Queues"]))
+        if not performed:
+            raise RuntimeError(f"There are no results in {self.path}")
+        self.performed = np.array(performed, dtype=np.int64)
+        self.global_bm = np.array(global_bm, dtype=np.int64)
+        self.local_bm = np.array(local_bm, dtype=np.int64)
+        self.queues = np.array(queues, dtype=np.int64)
+
+    def load_blocks(self, path):
+        """
+        Метаданные блоков: sender, on_iter - (блоки); parents, children - (ссылки на различных родителей)
+        номера родителя и блока; addrs - адреса участников в порядке номеров
+        """
+        with open(os.path.join(path, node.HEAD_FILE), "r") as file:
+            head = json.load(file)
+        self.addrs = sorted(head['heads'], key=lambda addr: (len(addr), addr))
+        self.heads = head['heads']
+        users = {addr: i for i, addr in enumerate(self.addrs)}
+        codec.BlockCodec.load(self.path)
+        ids = {GENESIS_BLOCK: 0}
+        sender, on_iter, links = [], [], []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.name == node.HEAD_FILE or store.is_temp(entry.name) or not entry.is_file():
+                    continue
+                with open(entry.path, "rb") as file:
+                    block = Block.loads(file.read())
+                child = ids.setdefault(entry.name, len(ids))
+                sender.append(users[block.sender()])
+                on_iter.append(block.on_iter)
+                links.extend((ids.setdefault(parent, len(ids)), child) for parent in set(block.parents.values()))
+        self.sender = np.array(sender, dtype=np.int64)
+        self.on_iter = np.array(on_iter, dtype=np.int64)
+        links = np.array(links, dtype=np.int64).reshape(-1, 2)
+        self.parents, self.children = links[:, 0], links[:, 1]
+
+    def throughput(self):
+        """
+        :return: {адрес: {"sent": блоков на итерацию как отправитель, "committed": прирост цепочки на итерацию}}
+        """
+        span = max(int(self.performed[-1] - self.performed[0]), 1)
+        sent = np.bincount(self.sender, minlength=len(self.addrs)) / span
+        committed = (self.local_bm[-1] - self.local_bm[0]) / span
+        return {addr: {"sent": round(float(s), 4), "committed": round(float(c), 4)}
+                for addr, s, c in zip(self.addrs, sent, committed)}
+
+    def queue_depth(self):
+        """
+        :return: перцентили глубины очередей узлов-хранилищ по итерациям и за весь прогон
+        """
+        series = np.percentile(self.queues, PERCENTILES, axis=1)
+        overall = np.percentile(self.queues, PERCENTILES)
+        result = {f"p{p}": [round(float(x), 2) for x in s] for p, s in zip(PERCENTILES, series)}
+        result["max"] = self.queues.max(axis=1).tolist()
+        result["overall"] = {f"p{p}": round(float(x), 2) for p, x in zip(PERCENTILES, overall)}
+        result["overall"]["max"] = int(self.queues.max())
+        return result
+
+    def forks(self):
+        """
+        Блок, участники которого ссылаются на разных родителей, объединяет разошедшиеся
+        ветви (форк); блок с одним общим родителем всех участников - синхронизация
+        :return: {"forks", "syncs", "ratio"}
+        """
+        distinct = np.bincount(self.children)
+        forks = int(np.count_nonzero(distinct > 1))
+        syncs = int(np.count_nonzero(distinct == 1))
+        return {"forks": forks, "syncs": syncs, "ratio": round(forks / syncs, 4) if syncs else None}
+
+    def convergence(self):
+        """
+        :return: итерация, начиная с которой очереди пусты и блокмеш больше не растёт (None - не сошёлся)
+        """
+        done = (self.queues.sum(axis=1) == 0) & (self.global_bm == self.global_bm[-1])
+        if not done[-1]:
+            return None
+        pending = np.flatnonzero(~done)
+        return int(self.performed[pending[-1] + 1] if pending.size else self.performed[0])
+
+    def report(self):
+        """
+        :return: dict - все показатели прогона
+        """
+        throughput = self.throughput()
+        return {"path": self.path,
+                "mod": self.mod,
+                "iterations": int(self.performed[-1]),
+                "blocks": int(self.global_bm[-1]),
+                "sync_heads": len(set(self.heads.values())),
+                "convergence": self.convergence(),
+                "fork_sync": self.forks(),
+                "queue_depth": self.queue_depth(),
+                "throughput": throughput}
+
+
+def summary(report: dict):
+    """
+    :return: скалярные показатели отчёта (строка CSV)
+    """
+    sent = [t["sent"] for t in report["throughput"].values()]
+    committed = [t["committed"] for t in report["throughput"].values()]
+    row = {k: report[k] for k in ("path", "mod", "iterations", "blocks", "sync_heads", "convergence")}
+    row.update({f"fork_sync_{k}": v for k, v in report["fork_sync"].items()})
+    row.update({f"queue_{k}": v for k, v in report["queue_depth"]["overall"].items()})
+    row.update({"sent_mean": round(float(np.mean(sent)), 4),
+                "sent_min": min(sent),
+                "sent_max": max(sent),
+                "committed_mean": round(float(np.mean(committed)), 4),
+                "committed_min": min(committed),
+                "committed_max": max(committed)})
+    return row
+
+
+def write_csv(reports: list, out):
+    """
+    Запись отчётов в CSV: одна строка скалярных показателей на модель
+    :param reports: список отчётов Analytics.report
+    :param out: открытый файл
+    """
+    rows = [summary(r) for r in reports]
+    writer = csv.DictWriter(out, list(rows[0].keys()))
+    writer.writeheader()
+    writer.writerows(rows)
@@ -0,0 +1,191 @@
+from multiprocessing import shared_memory, resource_tracker
+import multiprocessing
+import weakref
+import struct
+import sys
+import os
+
+ARENA_FILE = r'ARENA'
+MAGIC = b'BMA1'
+CREATED = set()  # сегменты, созданные этим процессом (наследуется при fork вместе с resource_tracker)
+
+
+def _release(shm, owner):
+    if owner:
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+    try:
+        shm.close()
+    except BufferError:
+        # остались внешние memoryview - отображение освободится вместе с ними
+        pass
+
+
+class BlockArena:
+    """
+    Арена блоков в разделяемой памяти: закодированные блоки лежат по фиксированным смещениям,
+    таблица хэш -> (смещение, длина) с открытой адресацией. Запись выполняется под блокировкой,
+    чтение - без блокировок и без копирования (memoryview), в том числе из других процессов
+    """
+    HEADER = struct.Struct('<4sIQQ')   # magic, slots, used, count
+    SLOT = struct.Struct('<32sQI')     # digest, offset, length
+    EMPTY = bytes(32)
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool, lock=None):
+        """
+        :param shm: сегмент разделяемой памяти
+        :param owner: владелец сегмента (создатель)
+        :param lock: блокировка записи (None - арена только для чтения)
+        """
+        self.shm = shm
+        self.owner = owner
+        self.lock = lock
+        magic, self.slots, _, _ = self.HEADER.unpack_from(shm.buf, 0)
+        if magic != MAGIC:
+            raise RuntimeError(f"Not a block arena: {shm.name}")
+        self.data_at = self.HEADER.size + self.slots * self.SLOT.size
+        self.hits = 0
+        self.misses = 0
+        self.overflow = 0
+        self.finalizer = weakref.finalize(self, _release, shm, owner)
+
+    @staticmethod
+    def create(size: int = 64 * 2 ** 20, slots: int = 2 ** 16, name: str = None):
+        """
+        Создание арены (владелец удаляет сегмент при закрытии или завершении процесса)
+        :param size: размер области данных, байт
+        :param slots: размер таблицы хэшей
+        :param name: имя сегмента разделяемой памяти
+        :return: BlockArena
+        """
+        if size < 1 or slots < 1:
+            raise ValueError(f"Wrong arena size: {size} bytes, {slots} slots")
+        total = BlockArena.HEADER.size + slots * BlockArena.SLOT.size + size
+        shm = shared_memory.SharedMemory(name=name, create=True, size=total)
+        CREATED.add(shm.name)
+        BlockArena.HEADER.pack_into(shm.buf, 0, MAGIC, slots, 0, 0)
+        return BlockArena(shm, True, multiprocessing.Lock())
+
+    @staticmethod
+    def attach(name: str, lock=None):
+        """
+        Подключение к существующей арене из другого процесса.
+        Процессы, созданные через fork, наследуют арену владельца вместе с блокировкой записи.
+        Сегмент не ставится на учёт resource_tracker подключившегося процесса: иначе при его
+        завершении сегмент был бы удалён вместе с данными владельца
+        :param name: имя сегмента
+        :param lock: блокировка записи владельца (None - только чтение)
+        :return: BlockArena
+        """
+        if sys.version_info >= (3, 13):
+            return BlockArena(shared_memory.SharedMemory(name=name, track=False), False, lock)
+        shm = shared_memory.SharedMemory(name=name)
+        # после fork resource_tracker общий с владельцем: снятие с учёта отменило бы и его учёт
+        if name not in CREATED:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return BlockArena(shm, False, lock)
+
+    @staticmethod
+    def cleanup(path_to_dir):
+        """
+        Удаление сегмента, оставшегося после аварийного завершения прошлого запуска
+        :param path_to_dir: путь к дирректории модели
+        """
+        path = os.path.join(path_to_dir, ARENA_FILE)
+        if not os.path.isfile(path):
+            return
+        with open(path, "r") as file:
+            name = file.read().strip()
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+            shm.close()
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+        os.remove(path)
+
+    def register(self, path_to_dir):
+        """
+        Запись имени сегмента в дирректорию модели для очистки после сбоя
+        """
+        with open(os.path.join(path_to_dir, ARENA_FILE), "w") as file:
+            file.write(self.shm.name)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def close(self):
+        """
+        Закрыть арену (владелец удаляет сегмент)
+        """
+        self.finalizer()
+
+    def __len__(self):
+        return self.HEADER.unpack_from(self.shm.buf, 0)[3]
+
+    def used(self):
+        return self.HEADER.unpack_from(self.shm.buf, 0)[2]
+
+    def get_stat(self):
+        return {"ArenaBlocks": len(self),
+                "ArenaBytes": self.used(),
+                "ArenaHits": self.hits,
+                "ArenaMisses": self.misses,
+                "ArenaOverflow": self.overflow}
+
+    def __find(self, digest: bytes):
+        """
+        :return: номер слота с digest или первого пустого слота, найденный ли digest
+        """
+        start = int.from_bytes(digest[:8], 'little') % self.slots
+        for k in range(self.slots):
+            slot = (start + k) % self.slots
+            at = self.HEADER.size + slot * self.SLOT.size
+            stored = bytes(self.shm.buf[at:at + 32])
+            if stored == digest:
+                return slot, True
+            if stored == self.EMPTY:
+                return slot, False
+        return None, False
+
+    def view(self, block_id: str):
+        """
+        :param block_id: хэш блока
+        :return: memoryview закодированного блока или None
+        """
+        slot, found = self.__find(bytes.fromhex(block_id))
+        if not found:
+            self.misses += 1
+            return None
+        self.hits += 1
+        _, offset, length = self.SLOT.unpack_from(self.shm.buf, self.HEADER.size + slot * self.SLOT.size)
+        return self.shm.buf[self.data_at + offset:self.data_at + offset + length]
+
+    def put(self, block_id: str, data: bytes):
+        """
+        Добавление закодированного блока
+        :param block_id: хэш блока
+        :param data: закодированный блок
+        :return: True если блок находится в арене
+        """
+        if self.lock is None:
+            raise RuntimeError(f"Block arena {self.name} is read-only")
+        digest = bytes.fromhex(block_id)
+        with self.lock:
+            slot, found = self.__find(digest)
+            if found:
+                return True
+            magic, slots, used, count = self.HEADER.unpack_from(self.shm.buf, 0)
+            if slot is None or count + 1 > slots * 3 // 4 or self.data_at + used + len(data) > self.shm.size:
+                self.overflow += 1
+                return False
+            self.shm.buf[self.data_at + used:self.data_at + used + len(data)] = data
+            at = self.HEADER.size + slot * self.SLOT.size
+            # digest записывается последним - слот публикуется для читателей только с готовыми данными
+            self.SLOT.pack_into(self.shm.buf, at, self.EMPTY, used, len(data))
+            self.shm.buf[at:at + 32] = digest
+            self.HEADER.pack_into(self.shm.buf, 0, magic, slots, used + len(data), count + 1)
+            return True
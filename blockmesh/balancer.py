@@ -0,0 +1,110 @@
+from blockmesh.node import Mod
+
+THRESHOLD = 1.25
+
+
+class Balancer:
+    """
+    Перераспределение участников между узлами-хранилищами на границе итерации (Model.persist).
+    Нагрузка узла - глубина очереди на одного подключённого участника (в Modified узел рассылает
+    за раунд не больше блоков, чем у него участников). Пока наибольшая нагрузка превышает среднюю
+    в threshold раз и больше одного раунда рассылки, участник с наибольшим числом блоков в очереди
+    перегруженного узла переводится (User.change_stg) на наименее нагруженный, если оценка нагрузки
+    обоих узлов после перевода ниже текущего максимума. Поставленные в очередь блоки участника
+    (в Modified - его подтверждения) переводятся вместе с ним (Storage.hand_over)
+    """
+
+    def __init__(self, budget: int = 1, threshold: float = THRESHOLD):
+        """
+        :param budget: максимальное количество переводов за итерацию
+        :param threshold: отношение наибольшей нагрузки к средней, при котором начинаются переводы
+        """
+        if budget < 1:
+            raise ValueError(f"Budget must be > 0: {budget}")
+        if threshold < 1:
+            raise ValueError(f"Threshold must be >= 1: {threshold}")
+        self.budget = budget
+        self.threshold = threshold
+        self.migrations = 0
+        self.balanced = 0   # итераций с переводами
+        self.imbalance = 1.0
+        self.peak = 1.0
+        self.users = []     # участников на узлах-хранилищах после последней проверки
+
+    def get_stat(self):
+        return {"Migrations": self.migrations,
+                "BalancedIters": self.balanced,
+                "Imbalance": round(self.imbalance, 3),
+                "PeakImbalance": round(self.peak, 3),
+                "UsersPerStg": self.users}
+
+    def pressure(self, stg):
+        return stg.queue_len() / max(len(stg.user_map), 1)
+
+    @staticmethod
+    def load(stg):
+        """
+        :return: {адрес участника узла: количество блоков очереди узла, переводимых вместе с ним}
+        """
+        load = dict.fromkeys(stg.user_map, 0)
+        for block in stg.queue:
+            for addr in (block.sender(),) if stg.mod == Mod.Classic else block.participants():
+                if addr in load:
+                    load[addr] += 1
+        return load
+
+    def measure(self, stgs):
+        """
+        :return: отношение наибольшей нагрузки к средней (1 - очереди пусты)
+        """
+        pressures = [self.pressure(s) for s in stgs]
+        mean = sum(pressures) / len(pressures)
+        return max(pressures) / mean if mean else 1.0
+
+    def candidate(self, src, dst, moved=()):
+        """
+        :return: участник src, перевод которого на dst снижает наибольшую нагрузку двух узлов
+        (или None)
+        :param moved: участники, уже переведённые в этой проверке
+        """
+        queued, users = src.queue_len(), len(src.user_map)
+        best, best_peak = None, queued / users
+        for addr, n in self.load(src).items():
+            # головы узлов совпадают между итерациями; иначе участник потерял бы свою цепочку
+            if addr in moved or src.block_mesh.get(addr) != dst.block_mesh.get(addr):
+                continue
+            peak = max((queued - n) / (users - 1), (dst.queue_len() + n) / (len(dst.user_map) + 1))
+            if peak < best_peak:
+                best, best_peak = src.user_map[addr], peak
+        return best
+
+    def rebalance(self, m):
+        """
+        Переводы участников модели в пределах бюджета
+        :param m: model.Model
+        :return: количество переводов
+        """
+        stgs = [s for s in m.stgs if s.available]
+        moved = set()
+        while len(stgs) > 1 and len(moved) < self.budget:
+            self.imbalance = self.measure(stgs)
+            self.peak = max(self.peak, self.imbalance)
+            if self.imbalance < self.threshold:
+                break
+            src = max(stgs, key=self.pressure)
+            dst = min(stgs, key=self.pressure)
+            # короткие очереди дренируются за раунд: их перекос - шум, а не перегрузка
+            if len(src.user_map) < 2 or self.pressure(src) <= 1:
+                break
+            user = self.candidate(src, dst, moved)
+            if user is None:
+                break
+            user.change_stg(dst)
+            src.hand_over(user.addr, dst)
+            moved.add(user.addr)
+        if moved:
+            self.imbalance = self.measure(stgs)
+            self.balanced += 1
+        self.migrations += len(moved)
+        self.users = [len(s.user_map) for s in m.stgs]
+        return len(moved)
@@ -1,20 +1,33 @@
 import json
 import os.path
+import sys
+import threading
 from hashlib import sha256
+import blockmesh.codec as codec
 
 NOT_SIGNED = None
+DISK = {'reads': 0, 'writes': 0}  # счётчики чтений и записей файлов блоков
+DISK_LOCK = threading.Lock()  # файлы пишутся и из потоков (store.AsyncBlockWriter, aio --threads)
 GENESIS_BLOCK = sha256(bytes(json.dumps({'header': {'version': '0.01a',
                                                     'timestamp': 0,
                                                     'parents': 'GENESIS'}}), 'utf-8')).hexdigest()
 
 
+def disk_count(kind: str):
+    """
+    Учёт чтения или записи файла блока
+    :param kind: 'reads' или 'writes'
+    """
+    with DISK_LOCK:
+        DISK[kind] += 1
+
+
 class Transaction:
     """
-    Транзакция
+    Транзакция. Участники хранятся компактно: кортеж адресов и список подписей
+    (подписи в hex - байтами), словарь participants собирается по запросу
     """
-    sender = None
-    participants = None
-    data = {}
+    __slots__ = ('sender', 'addrs', 'signs', 'data')
 
     def __init__(self, **kwargs):
         """
@@ -27,20 +40,40 @@ class Transaction:
             :param receivers: список адресов получателей
         :param data: данные
         """
+        self.sender = None
+        self.addrs = None
+        self.signs = None
+        self.data = {}
         if any(kwargs) is False:
             return
-        self.sender = kwargs['sender_addr']
+        self.sender = sys.intern(kwargs['sender_addr'])
         if 'participants' in kwargs:
             self.participants = kwargs['participants']
         else:
-            self.participants = {kwargs['sender_addr']: kwargs['sender_sign']}
+            participants = {kwargs['sender_addr']: kwargs['sender_sign']}
             if 'receivers' in kwargs:
                 for recv in kwargs['receivers']:
-                    self.participants[recv] = NOT_SIGNED
+                    participants[recv] = NOT_SIGNED
+            self.participants = participants
         self.data = kwargs['data'] if 'data' in kwargs else dict()
 
+    @property
+    def participants(self):
+        """
+        :return: словарь адрес: подпись
+        """
+        if self.addrs is None:
+            return None
+        return dict(zip(self.addrs, map(unpack_sign, self.signs)))
+
+    @participants.setter
+    def participants(self, participants: dict):
+        self.addrs = tuple(sys.intern(addr) for addr in participants)
+        self.signs = [pack_sign(sign) for sign in participants.values()]
+
     def __eq__(self, other):
-        return self.sender == other.sender and self.participants == other.participants and self.data == other.data
+        return self.sender == other.sender and self.addrs == other.addrs and \
+               self.signs == other.signs and self.data == other.data
 
     def __str__(self):
         return f"[TX: {self.dumps()}]"
@@ -64,28 +97,34 @@ class Transaction:
         :param addr: адрес участника
         :param sign: подпись участника
         """
-        if addr not in self.participants:
+        if addr not in self.addrs:
             raise RuntimeError(f"'{addr}' could not sign {str(self)}")
-        if self.participants[addr] != NOT_SIGNED:
-            raise RuntimeError(f"'{addr}' already signed -> {addr}: {self.participants[addr]}")
-        self.participants[addr] = sign
+        k = self.addrs.index(addr)
+        if self.signs[k] != NOT_SIGNED:
+            raise RuntimeError(f"'{addr}' already signed -> {addr}: {unpack_sign(self.signs[k])}")
+        self.signs[k] = pack_sign(sign)
 
     def is_ready(self):
         """
         Проверка готовности транзакции
         """
-        if self.sender is None or self.participants is None:
+        if self.sender is None or self.addrs is None:
             return False
-        for sign in self.participants.values():
-            if sign == NOT_SIGNED:
-                return False
-        return True
+        return NOT_SIGNED not in self.signs
+
+    def digest(self):
+        """
+        :return: хэш подписываемого содержимого транзакции (без подписей)
+        """
+        return sha256(bytes(json.dumps({'send': self.sender,
+                                        'participants': list(self.addrs),
+                                        'data': self.data}, sort_keys=True), 'utf-8')).hexdigest()
 
     def get_participants(self):
         """
         :return: Список участников транзакции
         """
-        return tuple(self.participants.keys())
+        return self.addrs
 
     def dumps(self):
         """
@@ -96,11 +135,28 @@ class Transaction:
                            'data': self.data})
 
 
+def pack_sign(sign):
+    """
+    :return: подпись в hex как bytes (вдвое компактнее), остальные подписи без изменений
+    """
+    if isinstance(sign, str) and len(sign) == 64 and sign == sign.lower():
+        try:
+            return bytes.fromhex(sign)
+        except ValueError:
+            pass
+    return sign
+
+
+def unpack_sign(sign):
+    return sign.hex() if isinstance(sign, bytes) else sign
+
+
 class Block:
     """
     Блок транзакции
     """
-    version = '0.01'  # версия
+    __slots__ = ('tx', 'parents', 'timestamp', 'approved', 'on_iter', 'version')
+    VERSION = '0.01'  # версия
 
     def __init__(self, transaction: Transaction, timestamp: int = None, parents: dict = None):
         """
@@ -116,6 +172,7 @@ class Block:
         self.timestamp = timestamp
         self.approved = None
         self.on_iter = 1
+        self.version = self.VERSION
 
     def __hash__(self):
         return int(self.hashs(), 16)
@@ -148,7 +205,7 @@ class Block:
             self.parents[parent] = hsh
 
     def participants(self):
-        return tuple(self.tx.participants.keys())
+        return self.tx.addrs
 
     def sender(self):
         return self.tx.sender
@@ -167,16 +224,18 @@ class Block:
     def loads(data):
         """
         Чтение блока транзакции из строки
-        :param data: строка содержащая дамп Block
+        :param data: строка содержащая дамп Block (или сжатый дамп, см. codec)
         :return: Block
         """
-        data = json.loads(data)
+        data = json.loads(codec.decode(data))
         return Block.l(data)
 
-    def save(self, path_to_dir):
+    def save(self, path_to_dir, writer=None, block_codec=None):
         """
         Запись блока транзакции в файл
         :param path_to_dir: путь до файла
+        :param writer: store.BlockWriter для отложенной записи (None - запись сразу)
+        :param block_codec: codec.BlockCodec для сжатия файла (None - без сжатия)
         """
         if not self.tx.is_ready():
             raise RuntimeError(f"WTF - block is not ready")
@@ -185,25 +244,36 @@ class Block:
         if not os.path.abspath(path_to_dir):
             os.makedirs(path_to_dir)
         fname = self.hashs()
-        with open(os.path.join(path_to_dir, fname), "w") as out:
-            out.write(self.dumps())
+        data = self.dumps() if block_codec is None else block_codec.encode(self.dumps())
+        if writer is not None:
+            writer.write(os.path.join(path_to_dir, fname), data)
+            return fname
+        with open(os.path.join(path_to_dir, fname), "w" if block_codec is None else "wb") as out:
+            out.write(data)
+        disk_count('writes')
         return fname
 
     @staticmethod
-    def load(path_to_file):
+    def load(path_to_file, writer=None):
         """
         Чтение блока транзакции из файла и создание объекта
         :param path_to_file: путь до файла
+        :param writer: store.BlockWriter, в котором блок может ожидать записи
         :return: Block
         """
         path_to_file = os.path.abspath(path_to_file)
         if path_to_file is None:
             raise RuntimeError(f"Could not load Block: {path_to_file} does not exist")
+        if writer is not None:
+            data = writer.read(path_to_file)
+            if data is not None:
+                return Block.loads(data)
         if not os.path.isfile(path_to_file):
             raise RuntimeError(f"Could not load Block: {path_to_file} not file")
-        with open(path_to_file, "r") as json_file:
-            data = json.load(json_file)
-            return Block.l(data)
+        with open(path_to_file, "rb") as file:
+            data = file.read()
+        disk_count('reads')
+        return Block.loads(data)
 
     @staticmethod
     def l(data):
@@ -0,0 +1,165 @@
+from collections import Counter
+from hashlib import sha256
+import blockmesh.store as store
+import zlib
+import re
+import os
+
+DICT_F = r'ZDICT'
+MAGIC = b'\x00BMZ'   # файлы блоков в JSON не начинаются с нулевого байта
+MAX_DICT = 32 * 2 ** 10
+
+CODECS = {}  # id словаря: BlockCodec
+
+TOKEN = re.compile(rb'"[^"]*"|[^"]+')
+
+
+class BlockCodec:
+    """
+    Сжатие файлов блоков zlib с общим предустановленным словарём, обученным на образцах блоков.
+    Формат: MAGIC, 4 байта id словаря, deflate-поток
+    """
+
+    def __init__(self, zdict: bytes, level: int = 9):
+        """
+        :param zdict: предустановленный словарь (не более 32 КБ)
+        :param level: уровень сжатия zlib
+        """
+        if not zdict or len(zdict) > MAX_DICT:
+            raise ValueError(f"Wrong dictionary size: {len(zdict)}")
+        if not 0 <= level <= 9:
+            raise ValueError(f"Wrong compression level: {level}")
+        self.zdict = zdict
+        self.level = level
+        self.id = sha256(zdict).digest()[:4]
+        CODECS[self.id] = self
+
+    @staticmethod
+    def train(samples, size: int = MAX_DICT, level: int = 9):
+        """
+        Обучение словаря: самые выгодные повторяющиеся токены JSON и шаблон блока.
+        zlib ищет совпадения с конца словаря, поэтому более ценные части располагаются ближе к концу
+        :param samples: закодированные в JSON блоки (str или bytes)
+        :param size: размер словаря, байт
+        :param level: уровень сжатия zlib
+        :return: BlockCodec
+        """
+        samples = [s.encode('utf-8') if isinstance(s, str) else bytes(s) for s in samples]
+        if not samples:
+            raise ValueError("No samples to train block dictionary")
+        size = min(size, MAX_DICT)
+        counts = Counter()
+        for sample in samples:
+            counts.update(set(TOKEN.findall(sample)))
+        tokens = [t for t, c in counts.items() if c > 1 and len(t) > 2]
+        tokens.sort(key=lambda t: (counts[t] * len(t), t))
+        zdict = samples[0][-size:]
+        for token in reversed(tokens):
+            if len(zdict) + len(token) > size:
+                break
+            zdict = token + zdict
+        return BlockCodec(zdict, level)
+
+    def encode(self, data) -> bytes:
+        """
+        :param data: дамп блока (str)
+        :return: сжатый дамп
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        comp = zlib.compressobj(self.level, zlib.DEFLATED, -15, zdict=self.zdict)
+        return MAGIC + self.id + comp.compress(data) + comp.flush()
+
+    def decompress(self, data) -> bytes:
+        decomp = zlib.decompressobj(-15, zdict=self.zdict)
+        return decomp.decompress(data[len(MAGIC) + 4:]) + decomp.flush()
+
+    def save(self, path_to_dir, current: bool = True):
+        """
+        Запись словаря в дирректорию модели под его id (ZDICT.<id>) и, если current, как словаря
+        новых блоков (ZDICT). Словари под id читаются все: блоки, сжатые прежним словарём, остаются
+        читаемыми, пока перезапись (recode) не завершена
+        :param path_to_dir: путь к дирректории модели
+        :param current: сжимать этим словарём новые блоки модели
+        """
+        data = bytes([self.level]) + self.zdict
+        store.replace_file(os.path.join(path_to_dir, f"{DICT_F}.{self.id.hex()}"), data)
+        if current:
+            store.replace_file(os.path.join(path_to_dir, DICT_F), data)
+
+    @staticmethod
+    def read(path):
+        with open(path, "rb") as file:
+            data = file.read()
+        return BlockCodec(data[1:], data[0])
+
+    @staticmethod
+    def load(path_to_dir):
+        """
+        Регистрация всех словарей модели
+        :param path_to_dir: путь к дирректории модели
+        :return: BlockCodec словаря новых блоков или None, если сжатие не включено
+        """
+        with os.scandir(path_to_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith(f"{DICT_F}.") and not store.is_temp(entry.name):
+                    BlockCodec.read(entry.path)
+        path = os.path.join(path_to_dir, DICT_F)
+        if not os.path.isfile(path):
+            return None
+        return BlockCodec.read(path)
+
+
+def prune(path_to_dir, keep: BlockCodec = None):
+    """
+    Удаление словарей, которыми не сжат ни один блок (после завершения recode)
+    :param path_to_dir: путь к дирректории модели
+    :param keep: словарь новых блоков (None - сжатие выключено, ZDICT тоже удаляется)
+    """
+    with os.scandir(path_to_dir) as entries:
+        for entry in entries:
+            if entry.name.startswith(f"{DICT_F}.") and (keep is None or entry.name != f"{DICT_F}.{keep.id.hex()}"):
+                os.remove(entry.path)
+    if keep is None and os.path.isfile(os.path.join(path_to_dir, DICT_F)):
+        os.remove(os.path.join(path_to_dir, DICT_F))
+
+
+def is_compressed(data):
+    return isinstance(data, (bytes, bytearray, memoryview)) and bytes(data[:len(MAGIC)]) == MAGIC
+
+
+def decode(data):
+    """
+    Распаковка дампа блока (несжатые данные возвращаются без изменений)
+    :param data: содержимое файла блока (memoryview арены читается без копирования в bytes)
+    :return: JSON блока
+    """
+    if not is_compressed(data):
+        return str(data, 'utf-8') if isinstance(data, memoryview) else data
+    dict_id = bytes(data[len(MAGIC):len(MAGIC) + 4])
+    codec = CODECS.get(dict_id)
+    if codec is None:
+        raise RuntimeError(f"Unknown block dictionary: {dict_id.hex()}")
+    return codec.decompress(data)
+
+
+def recode(paths, codec: BlockCodec = None):
+    """
+    Перезапись файлов блоков в сжатом (codec) или несжатом (None) виде.
+    Словарь codec сохраняется (BlockCodec.save) до перезаписи
+    :param paths: пути к файлам блоков
+    :param codec: BlockCodec
+    :return: (байт до, байт после)
+    """
+    before = after = 0
+    for path in paths:
+        with open(path, "rb") as file:
+            data = file.read()
+        plain = decode(data)
+        out = codec.encode(plain) if codec else plain
+        before += len(data)
+        after += len(out)
+        if out != data:
+            # замена целиком: прерванная перезапись не оставляет обрезанных файлов
+            store.replace_file(path, out)
+    return before, after
@@ -0,0 +1,242 @@
+from progress.bar import IncrementalBar
+import blockmesh.model as model
+import heapq
+import random
+import csv
+import os
+
+
+class Latency:
+    """
+    Распределение задержки канала связи (в единицах модельного времени)
+    """
+    kinds = ('const', 'uniform', 'exp')
+
+    def __init__(self, kind: str = 'const', a: float = 0, b: float = 0, seed: int = 0):
+        """
+        :param kind: const - постоянная a; uniform - равномерная на [a, b]; exp - экспоненциальная со средним a
+        :param a: параметр распределения
+        :param b: параметр распределения
+        :param seed: зерно генератора случайных чисел
+        """
+        if kind not in self.kinds:
+            raise ValueError(f"Unknown latency distribution: {kind}")
+        if a < 0 or b < 0 or (kind == 'uniform' and b < a):
+            raise ValueError(f"Wrong latency parameters: {kind}:{a}:{b}")
+        self.kind = kind
+        self.a = a
+        self.b = b
+        self.rng = random.Random(seed)
+
+    def __str__(self):
+        return f"{self.kind}:{self.a}:{self.b}" if self.kind == 'uniform' else f"{self.kind}:{self.a}"
+
+    @staticmethod
+    def parse(spec: str, seed: int = 0):
+        """
+        :param spec: 'const:1', 'uniform:1:5' или 'exp:2'
+        :param seed: зерно генератора случайных чисел
+        :return: Latency
+        """
+        kind, *params = spec.split(':')
+        params = [float(p) for p in params] + [0, 0]
+        return Latency(kind, params[0], params[1], seed)
+
+    def sample(self):
+        if self.kind == 'const':
+            value = self.a
+        elif self.kind == 'uniform':
+            value = self.rng.uniform(self.a, self.b)
+        else:
+            value = self.rng.expovariate(1 / self.a) if self.a > 0 else 0
+        return int(round(value))
+
+
+class EventEngine:
+    """
+    Событийный движок моделирования: очередь событий с приоритетом по модельному времени.
+    Периоды простоя пропускаются, раунды консенсуса выполняются только при наличии работы.
+    Задержка канала узла-хранилища относится и к блокам участников, и к рассылке шага 1 от других
+    узлов-хранилищ; шаг 2 раунда начинается после доставки всех разосланных блоков
+    """
+    TX = 0        # генерация транзакции участником
+    ARRIVAL = 1   # доставка блока узлу-хранилищу
+    STEP_1 = 2    # шаг 1 раунда консенсуса
+    SHARE = 3     # доставка блока, разосланного на шаге 1
+    STEP_2 = 4    # шаг 2 раунда консенсуса
+
+    def __init__(self, latency: Latency = None, links: dict = None):
+        """
+        :param latency: задержка каналов к узлам-хранилищам по умолчанию
+        :param links: {индекс узла-хранилища: Latency} - задержки каналов к отдельным узлам-хранилищам
+        """
+        self.latency = latency if latency else Latency()
+        self.links = links if links else {}
+        self.events = []
+        self.seq = 0
+        self.model = None
+        self.stg_index = {}
+        self.scenario = {}
+        self.waiting = set()
+        self.round_at = None
+        self.step_2_at = None
+        self.arrived = []   # доставленные блоки шага 1: (номер отправки, узел-получатель, блок, подтверждения)
+        self.started = {}   # {узел-хранилище: номер первой отправки его шага 1}
+        self.delivered = 0
+        self.shared = 0
+        self.dropped = 0
+        self.rounds = 0
+
+    def get_stat(self):
+        return {"Rounds": self.rounds,
+                "Delivered": self.delivered,
+                "Shared": self.shared,
+                "Dropped": self.dropped}
+
+    def push(self, time: int, kind: int, payload=None):
+        heapq.heappush(self.events, (time, kind, self.seq, payload))
+        self.seq += 1
+
+    def period(self):
+        """
+        :return: период раундов консенсуса: весь второй этап (Classic) или 3 единицы времени (Modified)
+        """
+        _, duration, _ = self.model.stg_rounds()
+        return max(1, duration)
+
+    def run(self, m):
+        """
+        Моделирование сценария модели m
+        :param m: model.Model
+        """
+        self.model = m
+        self.stg_index = {stg: i for i, stg in enumerate(m.stgs)}
+        self.scenario = m.scenario()
+        for stg in m.stgs:
+            stg.link = self.share
+        for usr in m.usrs:
+            usr.link = self.submit
+        start = m.model_time.time
+        for sender in self.scenario:
+            self.push(start + sender, self.TX, sender)
+        if any(stg.queue_len() for stg in m.stgs):
+            self.schedule_round(start)
+        header = list(m.get_stat().keys())
+        cur = m.stgs[0].block_count
+        bar = IncrementalBar('Blocks in blockmesh', max=m.usr_num * (m.usr_num - 1) + cur)
+        bar.next(cur)
+        try:
+            with open(os.path.join(m.path, model.RESULT_F), 'a', newline='') as csv_file:
+                writer = csv.DictWriter(csv_file, header)
+                if m.performed == 0:
+                    writer.writeheader()
+                    writer.writerow(m.get_stat())
+                while self.events:
+                    time, kind, _, payload = heapq.heappop(self.events)
+                    m.model_time.advance(time)
+                    if kind == self.TX:
+                        self.on_tx(payload)
+                    elif kind == self.ARRIVAL:
+                        self.on_arrival(*payload)
+                    elif kind == self.STEP_1:
+                        self.on_step_1()
+                    elif kind == self.SHARE:
+                        self.on_share(*payload)
+                    elif kind == self.STEP_2:
+                        self.on_step_2()
+                        writer.writerow(m.get_stat())
+                        m.persist(csv_file)
+                        bar.next(m.stgs[0].block_count - cur)
+                        cur = m.stgs[0].block_count
+        finally:
+            for stg in m.stgs:
+                stg.link = None
+            for usr in m.usrs:
+                usr.link = None
+        bar.finish()
+
+    def submit(self, user, stg, block):
+        """
+        Канал связи участник -> узел-хранилище: блок доставляется через случайную задержку
+        """
+        latency = self.links.get(self.stg_index[stg], self.latency).sample()
+        self.push(self.model.model_time.time + latency, self.ARRIVAL, (stg, block))
+
+    def share(self, stg, peer, block, count=None):
+        """
+        Канал связи узел-хранилище -> узел-хранилище (шаг 1): задержка канала узла-получателя
+        """
+        time = self.model.model_time.time + self.links.get(self.stg_index[peer], self.latency).sample()
+        self.step_2_at = max(self.step_2_at, time)
+        self.push(time, self.SHARE, (self.seq, peer, block, count))
+
+    def schedule_round(self, time: int):
+        if self.round_at is not None:
+            return
+        period = self.period()
+        self.round_at = time + (-time % period)
+        self.push(self.round_at, self.STEP_1)
+
+    def on_tx(self, sender: int):
+        for receiver in list(self.scenario[sender]):
+            if not self.model.usr_perform(sender, [receiver]):
+                self.waiting.add(sender)
+                return
+            self.scenario[sender].remove(receiver)
+        self.scenario.pop(sender)
+
+    def on_arrival(self, stg, block):
+        if not stg.available:
+            self.dropped += 1
+            return
+        stg.add_new_block(block)
+        self.delivered += 1
+        self.schedule_round(self.model.model_time.time)
+
+    def on_step_1(self):
+        self.step_2_at = self.round_at + min(1, self.period() - 1)
+        for stg in self.model.stgs:
+            if stg.queue_len():
+                self.started[stg] = self.seq
+                stg.perform_step_1()
+        self.push(self.step_2_at, self.STEP_2)
+
+    def on_share(self, sent, peer, block, count):
+        # узел, отключившийся после рассылки, блок не получает
+        if not peer.available:
+            self.dropped += 1
+            return
+        self.arrived.append((sent, peer, block, count))
+        self.shared += 1
+
+    def on_step_2(self):
+        m = self.model
+        # шаг 2 упорядочивает блоки по метке времени устойчивой сортировкой: узлы получают блоки
+        # в порядке рассылки, а не доставки, иначе блоки с равными метками внедрялись бы по-разному.
+        # Собственные блоки узла встают на место его шага 1
+        inbox = {}
+        for stg, start in self.started.items():
+            shared = stg.shared_blocks
+            own = shared.items() if isinstance(shared, dict) else ((block, None) for block in shared)
+            inbox[stg] = [((start, j), block, count) for j, (block, count) in enumerate(own)]
+            shared.clear()
+        for sent, peer, block, count in self.arrived:
+            inbox.setdefault(peer, []).append(((sent, -1), block, count))
+        for peer, blocks in inbox.items():
+            blocks.sort(key=lambda b: b[0])
+            for _, block, count in blocks:
+                peer.receive_shared(block, count)
+        self.arrived = []
+        self.started = {}
+        for stg in m.stgs:
+            stg.perform_step_2(m.performed + 1)
+        m.round_done()
+        m.performed += 1
+        self.rounds += 1
+        time = m.model_time.time
+        self.round_at = None
+        for sender in [s for s in self.waiting if m.usrs[s].generation_allowed is not False]:
+            self.waiting.remove(sender)
+            self.push(time + 1, self.TX, sender)
+        if any(stg.queue_len() for stg in m.stgs):
+            self.schedule_round(time + 1)
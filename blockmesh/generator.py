@@ -0,0 +1,200 @@
+from progress.bar import IncrementalBar
+from collections import deque
+from blockmesh.block import Block, Transaction, GENESIS_BLOCK, NOT_SIGNED
+import blockmesh.model as model
+import blockmesh.signature as signature
+import blockmesh.node as node
+import multiprocessing
+import random
+import json
+import time
+import os
+
+BATCH = 4096  # блоков в одном задании записи
+
+
+class Generator:
+    """
+    Синтетическая модель без моделирования: случайные транзакции внедряются прямо в блокмеш
+    (родители - текущие головы участников), файлы блоков пачками записываются в дирректории
+    узлов-хранилищ и участников в нескольких процессах, затем пишутся HEAD-файлы и MODEL.
+    Хэши блоков зависят от голов, поэтому сами блоки строятся в основном процессе последовательно
+    """
+
+    def __init__(self, mod: node.Mod, path_to_dir: str, stg_num: int, usr_num: int, blocks: int,
+                 duration_1: int, duration_2: int, receivers: int = 1, seed: int = 0, workers: int = None,
+                 batch: int = BATCH):
+        """
+        :param mod: режим модели
+        :param path_to_dir: дирректория новой модели
+        :param stg_num: количество узлов-хранилищ
+        :param usr_num: количество участников
+        :param blocks: количество блоков
+        :param duration_1: длительность первого этапа итерации (для последующих run)
+        :param duration_2: длительность второго этапа итерации
+        :param receivers: количество получателей транзакции
+        :param seed: зерно генератора случайных чисел
+        :param workers: количество процессов записи (None - по числу ядер, 1 - запись в основном процессе)
+        :param batch: блоков в одном задании записи
+        """
+        if blocks < 0:
+            raise ValueError(f"Wrong number of blocks: {blocks} >= 0")
+        if receivers < 1 or receivers >= usr_num:
+            raise ValueError(f"Wrong number of receivers: 0 < {receivers} < {usr_num}")
+        if workers is not None and workers < 1:
+            raise ValueError(f"Workers must be > 0: {workers}")
+        if batch < 1:
+            raise ValueError(f"Batch must be > 0: {batch}")
+        # проверка параметров и создание дирректории - как у модели
+        self.model = model.Model(mod, path_to_dir, stg_num, usr_num, duration_1, duration_2)
+        if os.path.isfile(os.path.join(self.model.path, model.MODEL_F)):
+            raise RuntimeError(f"There is a blockmesh model in {self.model.path} already")
+        self.blocks = blocks
+        self.receivers = receivers
+        self.seed = seed
+        self.workers = workers if workers else multiprocessing.cpu_count()
+        self.batch = batch
+        self.stg_dirs = [node.mkdir(os.path.join(self.model.path, model.STG_DIR, f"{model.STG_NODE}{i}"))
+                         for i in range(stg_num)]
+        self.usr_dirs = [node.mkdir(os.path.join(self.model.path, model.USR_DIR, f"{model.USR_NODE}{i}"))
+                         for i in range(usr_num)]
+        self.addrs = [f"user{i}" for i in range(usr_num)]
+        self.signs = [f"sign{i}" for i in range(usr_num)]
+        self.heads = [GENESIS_BLOCK] * usr_num
+        self.lengths = [1] * usr_num  # как User.length: цепочка вместе с генезисом
+        self.files = 0
+        self.bytes = 0
+        self.build_time = 0.0
+        self.wall = 0.0
+
+    def get_stat(self):
+        return {"Blocks": self.blocks,
+                "Files": self.files,
+                "Bytes": self.bytes,
+                "Workers": self.workers,
+                "BuildTime": round(self.build_time, 4),
+                "GenerateWall": round(self.wall, 4),
+                "Blocks/s": round(self.blocks / self.wall, 1) if self.wall else 0}
+
+    def batches(self):
+        """
+        Построение блоков
+        :return: генератор пачек [(хэш, дамп, номера участников)]
+        """
+        rng = random.Random(self.seed)
+        usr_num = self.model.usr_num
+        batch = []
+        for i in range(self.blocks):
+            start = time.perf_counter()
+            sender = rng.randrange(usr_num)
+            receivers = [r + (r >= sender) for r in rng.sample(range(usr_num - 1), self.receivers)]
+            users = [sender] + receivers
+            # как Model.usr_perform и User.perform: данные транзакции и подписи всех участников
+            tx = Transaction(sender_addr=self.addrs[sender], sender_sign=NOT_SIGNED,
+                             receivers=[self.addrs[r] for r in receivers],
+                             data={"ypos": sender, "info": f"{sender} -> {receivers}"})
+            digest = tx.digest()
+            for u in users:
+                tx.sign(self.addrs[u], signature.sign(self.signs[u], digest))
+            # как Storage.__check_and_insert: родители - головы участников
+            block = Block(tx, i + 1, {self.addrs[u]: self.heads[u] for u in users})
+            block.on_iter = i // usr_num + 1
+            name = block.hashs()
+            for u in users:
+                self.heads[u] = name
+                self.lengths[u] += 1
+            batch.append((name, block.dumps(), users))
+            self.build_time += time.perf_counter() - start
+            if len(batch) == self.batch:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    @staticmethod
+    def write(stg_dirs, usr_dirs, batch):
+        """
+        Запись пачки блоков: в каждое узел-хранилище и в дирректории участников блока
+        :return: (количество файлов, байт)
+        """
+        files = size = 0
+        for name, data, users in batch:
+            for path in stg_dirs + [usr_dirs[u] for u in users]:
+                with open(os.path.join(path, name), "w") as out:
+                    out.write(data)
+                files += 1
+                size += len(data)
+        return files, size
+
+    def run(self):
+        """
+        Генерация модели
+        """
+        start = time.perf_counter()
+        bar = IncrementalBar('Generate blocks', max=max(1, -(-self.blocks // self.batch)))
+        if self.workers == 1:
+            for batch in self.batches():
+                self.count(self.write(self.stg_dirs, self.usr_dirs, batch))
+                bar.next()
+        else:
+            with multiprocessing.Pool(self.workers) as pool:
+                # не более двух заданий на процесс: пачки не копятся в памяти
+                pending = deque()
+                for batch in self.batches():
+                    pending.append(pool.apply_async(self.write, (self.stg_dirs, self.usr_dirs, batch)))
+                    while len(pending) > 2 * self.workers:
+                        self.count(pending.popleft().get())
+                        bar.next()
+                while pending:
+                    self.count(pending.popleft().get())
+                    bar.next()
+        bar.finish()
+        self.save()
+        self.wall = time.perf_counter() - start
+
+    def count(self, written):
+        self.files += written[0]
+        self.bytes += written[1]
+
+    def save(self):
+        """
+        HEAD-файлы узлов (в формате Storage.save и User.save) и MODEL - после записи всех блоков
+        """
+        m = self.model
+        for path in self.stg_dirs:
+            with open(os.path.join(path, node.HEAD_FILE), "w") as file:
+                json.dump({'mod': m.mod.name,
+                           'heads': dict(zip(self.addrs, self.heads)),
+                           'available': True,
+                           'queue': [] if m.mod == node.Mod.Classic else {},
+                           'blocks': self.blocks + 1,
+                           'base': [],
+                           'base_count': 0}, file)
+        for path, addr, sign, head, length in zip(self.usr_dirs, self.addrs, self.signs, self.heads, self.lengths):
+            with open(os.path.join(path, node.HEAD_FILE), "w") as file:
+                json.dump({"head": head, "addr": addr, "sign": sign, "mod": m.mod.name,
+                           "base": GENESIS_BLOCK, "base_count": 0, "length": length,
+                           "digest": node.head_digest(addr, head, GENESIS_BLOCK, length, 0)}, file)
+        # итерации моделирования не выполнялись: run начнёт RESULT.csv с заголовка
+        with open(os.path.join(m.path, model.MODEL_F), 'w') as out:
+            json.dump({"mod": m.mod.name,
+                       "num": [m.stg_num, m.usr_num],
+                       "dur": m.duration,
+                       "ts": model.ModelTime(self.blocks + 1).dumps(),
+                       "perf": 0,
+                       "net": None}, out)
+
+    def check(self):
+        """
+        Загрузка сгенерированной модели с проверками Storage.load и User.load (с обходом цепочек)
+        и запись MANIFEST
+        :return: model.Model
+        """
+        m = model.Model.load(self.model.path, walk=True)
+        for i, s in enumerate(m.stgs):
+            count = len(s.index_blocks()) + s.base_count
+            if count != s.block_count:
+                raise RuntimeError(f"Storage {i} does not match its HEAD: "
+                                   f"{count} blocks in blockmesh, {s.block_count} in HEAD")
+        m.save_manifest()
+        return m
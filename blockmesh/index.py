@@ -0,0 +1,262 @@
+from blockmesh.block import Block, GENESIS_BLOCK
+import blockmesh.model as model
+import blockmesh.codec as codec
+import blockmesh.node as node
+import blockmesh.store as store
+import sqlite3
+import heapq
+import json
+import time
+import os
+
+INDEX_F = r'INDEX.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS blocks (id TEXT PRIMARY KEY, pos INTEGER NOT NULL UNIQUE, timestamp INTEGER,
+                                   iter INTEGER, sender TEXT, data TEXT) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS parents (block TEXT, addr TEXT, parent TEXT, seq INTEGER,
+                                    PRIMARY KEY (block, addr)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS parents_chain ON parents (addr, seq);
+CREATE INDEX IF NOT EXISTS parents_parent ON parents (parent);
+"""
+
+
+class BlockIndex:
+    """
+    Постоянный индекс блоков узла-хранилища в SQLite (файл INDEX.db в дирректории модели):
+    блоки с топологическим номером pos (родитель всегда раньше потомка), ссылки на родителей
+    и номер блока в цепочке каждого участника. Индекс дополняется новыми файлами блоков по
+    количеству блоков в HEAD узла и перестраивается, если узел или снимок изменились
+    """
+
+    def __init__(self, path_to_dir: str, storage: int = 0):
+        """
+        :param path_to_dir: путь к дирректории модели
+        :param storage: номер индексируемого узла-хранилища
+        """
+        self.path = os.path.abspath(path_to_dir)
+        if not os.path.isfile(os.path.join(self.path, model.MODEL_F)):
+            raise FileNotFoundError(f"There is no blockmesh model in {self.path}")
+        self.stg_path = os.path.join(self.path, model.STG_DIR, f"{model.STG_NODE}{storage}")
+        if not os.path.isdir(self.stg_path):
+            raise ValueError(f"There is no storage-node {storage} in {self.path}")
+        self.storage = storage
+        self.db = sqlite3.connect(os.path.join(self.path, INDEX_F))
+        self.db.executescript(SCHEMA)
+        self.added = 0
+        self.rebuilt = False
+        self.elapsed = 0.0
+
+    def close(self):
+        self.db.close()
+
+    def get_stat(self):
+        return {"Indexed": self.db.execute("SELECT COUNT(*) FROM blocks").fetchone()[0],
+                "Added": self.added,
+                "Rebuilt": self.rebuilt,
+                "IndexTime": round(self.elapsed, 4)}
+
+    def meta(self, key, default=None):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def update(self, rebuild: bool = False):
+        """
+        Приведение индекса к состоянию узла-хранилища на диске
+        :param rebuild: перестроить индекс целиком
+        :return: количество добавленных блоков
+        """
+        start = time.perf_counter()
+        with open(os.path.join(self.stg_path, node.HEAD_FILE), "r") as file:
+            head = json.load(file)
+        state = {'storage': self.storage, 'base_count': head.get('base_count', 0)}
+        if rebuild or self.meta('state') != state:
+            # после снимка часть блоков удалена - номера в цепочках пересчитываются
+            self.db.executescript("DELETE FROM blocks; DELETE FROM parents; DELETE FROM meta;")
+            self.rebuilt = True
+        elif self.meta('blocks') == head['blocks']:
+            return 0
+        codec.BlockCodec.load(self.path)
+        known = {row[0] for row in self.db.execute("SELECT id FROM blocks")}
+        new = {}
+        with os.scandir(self.stg_path) as entries:
+            for entry in entries:
+                if entry.name == node.HEAD_FILE or store.is_temp(entry.name) or entry.name in known or \
+                        not entry.is_file():
+                    continue
+                with open(entry.path, "rb") as file:
+                    new[entry.name] = Block.loads(file.read())
+        self.insert(new)
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                                [('state', json.dumps(state)), ('blocks', json.dumps(head['blocks']))])
+        self.added += len(new)
+        self.elapsed += time.perf_counter() - start
+        return len(new)
+
+    def insert(self, blocks: dict):
+        """
+        Добавление блоков в топологическом порядке
+        :param blocks: {хэш: Block} новых блоков
+        """
+        pos = self.db.execute("SELECT COALESCE(MAX(pos), 0) FROM blocks").fetchone()[0]
+        waiting = {}
+        children = {}
+        for block_id, block in blocks.items():
+            links = {parent for parent in block.parents.values() if parent in blocks}
+            waiting[block_id] = len(links)
+            for parent in links:
+                children.setdefault(parent, []).append(block_id)
+        ready = sorted(block_id for block_id, n in waiting.items() if n == 0)
+        seqs = {}  # (хэш, адрес): номер в цепочке участника для новых блоков
+        with self.db:
+            while ready:
+                block_id = ready.pop()
+                block = blocks[block_id]
+                pos += 1
+                self.db.execute("INSERT INTO blocks VALUES (?, ?, ?, ?, ?, ?)",
+                                (block_id, pos, block.timestamp, block.on_iter, block.sender(),
+                                 json.dumps(block.tx.data)))
+                for addr, parent in block.parents.items():
+                    seq = self.seq(parent, addr, seqs) + 1
+                    seqs[(block_id, addr)] = seq
+                    self.db.execute("INSERT INTO parents VALUES (?, ?, ?, ?)", (block_id, addr, parent, seq))
+                for child in children.get(block_id, ()):
+                    waiting[child] -= 1
+                    if waiting[child] == 0:
+                        ready.append(child)
+        if any(n > 0 for n in waiting.values()):
+            raise RuntimeError("Parent links of stored blocks form a cycle")
+
+    def seq(self, block_id, addr, seqs):
+        """
+        :return: номер блока в цепочке участника (генезис и блоки ниже снимка - 0)
+        """
+        if block_id == GENESIS_BLOCK:
+            return 0
+        if (block_id, addr) in seqs:
+            return seqs[(block_id, addr)]
+        row = self.db.execute("SELECT seq FROM parents WHERE block = ? AND addr = ?", (block_id, addr)).fetchone()
+        return row[0] if row else 0
+
+    def resolve(self, prefix: str):
+        """
+        :param prefix: хэш блока или его однозначное начало
+        :return: хэш блока
+        """
+        if prefix == GENESIS_BLOCK:
+            return prefix
+        rows = self.db.execute("SELECT id FROM blocks WHERE id >= ? AND id < ? LIMIT 2",
+                               (prefix, prefix + "g")).fetchall()
+        if not rows:
+            raise ValueError(f"Unknown block: {prefix}")
+        if len(rows) > 1:
+            raise ValueError(f"Ambiguous block prefix: {prefix}")
+        return rows[0][0]
+
+    def pos(self, block_id):
+        row = self.db.execute("SELECT pos FROM blocks WHERE id = ?", (block_id,)).fetchone()
+        return row[0] if row else 0
+
+    def block(self, block_id: str):
+        """
+        :param block_id: хэш блока (или его начало)
+        :return: dict - заголовок блока, родители, потомки и номера в цепочках участников
+        """
+        block_id = self.resolve(block_id)
+        if block_id == GENESIS_BLOCK:
+            raise ValueError("Genesis block is not stored")
+        _, pos, timestamp, on_iter, sender, data = self.db.execute(
+            "SELECT * FROM blocks WHERE id = ?", (block_id,)).fetchone()
+        links = self.db.execute("SELECT addr, parent, seq FROM parents WHERE block = ?", (block_id,)).fetchall()
+        children = self.db.execute("SELECT DISTINCT block FROM parents WHERE parent = ?", (block_id,)).fetchall()
+        return {"id": block_id,
+                "pos": pos,
+                "timestamp": timestamp,
+                "iter": on_iter,
+                "sender": sender,
+                "data": json.loads(data),
+                "parents": {addr: parent for addr, parent, _ in links},
+                "seq": {addr: seq for addr, _, seq in links},
+                "children": sorted(child for child, in children)}
+
+    def chain(self, addr: str, first: int = None, last: int = None):
+        """
+        Цепочка блоков участника
+        :param addr: адрес участника
+        :param first: номер первого блока цепочки (с 1)
+        :param last: номер последнего блока цепочки
+        :return: [{seq, id, timestamp, iter, sender}] по возрастанию номера
+        """
+        rows = self.db.execute("SELECT p.seq, b.id, b.timestamp, b.iter, b.sender FROM parents p "
+                               "JOIN blocks b ON b.id = p.block WHERE p.addr = ? AND p.seq BETWEEN ? AND ? "
+                               "ORDER BY p.seq",
+                               (addr, first if first is not None else 0,
+                                last if last is not None else 2 ** 62)).fetchall()
+        return [{"seq": seq, "id": block_id, "timestamp": timestamp, "iter": on_iter, "sender": sender}
+                for seq, block_id, timestamp, on_iter, sender in rows]
+
+    def walk(self, heads: dict, stop: int = 0):
+        """
+        Обход предков по убыванию топологического номера: блок выдаётся после всех своих
+        потомков из обхода, поэтому к моменту выдачи известны все стартовые блоки, от которых он достижим
+        :param heads: {хэш: метка} стартовых блоков
+        :param stop: не спускаться к блокам с номером меньше stop
+        :return: генератор (хэш, номер, множество меток)
+        """
+        marks = {}
+        queue = []
+        for block_id, mark in heads.items():
+            marks.setdefault(block_id, set()).add(mark)
+            if len(marks[block_id]) == 1:
+                heapq.heappush(queue, (-self.pos(block_id), block_id))
+        while queue:
+            pos, block_id = heapq.heappop(queue)
+            yield block_id, -pos, marks[block_id]
+            for parent, parent_pos in self.db.execute(
+                    "SELECT p.parent, b.pos FROM parents p JOIN blocks b ON b.id = p.parent "
+                    "WHERE p.block = ? AND b.pos >= ?", (block_id, stop)):
+                if parent not in marks:
+                    marks[parent] = set()
+                    heapq.heappush(queue, (-parent_pos, parent))
+                marks[parent] |= marks[block_id]
+
+    def ancestors(self, block_id: str, limit: int = None):
+        """
+        :param block_id: хэш блока
+        :param limit: максимальное количество предков
+        :return: [{id, pos}] предков по убыванию топологического номера
+        """
+        block_id = self.resolve(block_id)
+        result = []
+        for ancestor, pos, _ in self.walk({block_id: 0}):
+            if ancestor == block_id:
+                continue
+            if limit is not None and len(result) >= limit:
+                break
+            result.append({"id": ancestor, "pos": pos})
+        return result
+
+    def is_ancestor(self, ancestor: str, block_id: str):
+        """
+        :return: Bool - ancestor является предком block_id
+        """
+        ancestor, block_id = self.resolve(ancestor), self.resolve(block_id)
+        if ancestor == GENESIS_BLOCK:
+            return block_id != GENESIS_BLOCK
+        stop = self.pos(ancestor)
+        return any(found == ancestor for found, _, _ in self.walk({block_id: 0}, stop) if found != block_id)
+
+    def common_ancestor(self, first: str, second: str):
+        """
+        :return: хэш ближайшего (с наибольшим топологическим номером) общего предка
+        двух блоков (сам блок считается своим предком); GENESIS_BLOCK, если общих хранимых предков нет
+        """
+        first, second = self.resolve(first), self.resolve(second)
+        if first == second:
+            return first
+        for block_id, _, marks in self.walk({first: 1, second: 2}):
+            if len(marks) == 2:
+                return block_id
+        return GENESIS_BLOCK
@@ -0,0 +1,205 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple
+from blockmesh.block import Block, GENESIS_BLOCK
+import blockmesh.model as model
+import blockmesh.codec as codec
+import blockmesh.node as node
+import blockmesh.store as store
+import json
+import time
+import os
+
+VERIFIED_F = r'VERIFIED'
+
+Problem = namedtuple('Problem', ['path', 'kind', 'detail'])
+
+
+def check_file(path: str, rehash: bool = True):
+    """
+    Пересчёт хэша блока из файла
+    :param path: путь к файлу блока
+    :param rehash: пересчитывать хэш (False - только прочитать родителей)
+    :return: (родители блока или None, описание ошибки или None)
+    """
+    try:
+        with open(path, "rb") as file:
+            data = file.read()
+        block = Block.loads(data)
+    except Exception as e:
+        return None, f"unreadable block: {e!r}"
+    if not rehash:
+        return block.parents, None
+    name = os.path.basename(path)
+    hsh = block.hashs()
+    if hsh != name:
+        return block.parents, f"hash mismatch: content hashes to {hsh}"
+    return block.parents, None
+
+
+class IntegrityChecker:
+    """
+    Проверка целостности модели на диске: хэши всех файлов блоков (параллельно, в потоках),
+    ссылки на родителей, количество блоков и согласованность HEAD узлов-хранилищ и участников.
+    В инкрементальном режиме хэши пересчитываются только для файлов, изменённых после
+    последней успешной проверки (отметка в файле VERIFIED); ссылки на родителей проверяются
+    для всех файлов, поэтому удаление старого блока тоже обнаруживается
+    """
+
+    def __init__(self, path_to_dir: str, threads: int = None, incremental: bool = False):
+        """
+        :param path_to_dir: путь к дирректории модели
+        :param threads: количество потоков хеширования (None - по умолчанию ThreadPoolExecutor)
+        :param incremental: пересчитывать хэши только блоков, изменённых после последней проверки
+        """
+        if threads is not None and threads < 1:
+            raise ValueError(f"Threads must be > 0: {threads}")
+        self.path = os.path.abspath(path_to_dir)
+        self.threads = threads
+        self.incremental = incremental
+        self.problems = []
+        self.checked = 0
+        self.skipped = 0
+        self.wall = 0.0
+
+    def get_stat(self):
+        return {"Checked": self.checked,
+                "Skipped": self.skipped,
+                "Problems": len(self.problems),
+                "Wall": round(self.wall, 3)}
+
+    def watermark(self):
+        """
+        :return: время последней успешной проверки, нс (0 - проверок не было)
+        """
+        path = os.path.join(self.path, VERIFIED_F)
+        if not self.incremental or not os.path.isfile(path):
+            return 0
+        with open(path, "r") as file:
+            return json.load(file)['time']
+
+    def report(self, path, kind, detail):
+        self.problems.append(Problem(os.path.relpath(path, self.path), kind, detail))
+
+    def run(self):
+        """
+        :return: список найденных повреждений (Problem)
+        """
+        start = time.perf_counter()
+        started = time.time_ns()
+        with open(os.path.join(self.path, model.MODEL_F), "r") as file:
+            data = json.load(file)
+        stg_num, usr_num = data['num']
+        codec.BlockCodec.load(self.path)
+        since = self.watermark()
+        stgs = [os.path.join(self.path, model.STG_DIR, f"{model.STG_NODE}{i}") for i in range(stg_num)]
+        usrs = [os.path.join(self.path, model.USR_DIR, f"{model.USR_NODE}{i}") for i in range(usr_num)]
+        with ThreadPoolExecutor(self.threads, thread_name_prefix="bm-verify") as executor:
+            stg_heads = [self.check_storage(path, since, executor) for path in stgs]
+            usr_heads = [self.check_user(path, since, executor) for path in usrs]
+        self.check_heads(stgs, stg_heads, usrs, usr_heads)
+        self.wall = time.perf_counter() - start
+        if not self.problems:
+            with open(os.path.join(self.path, VERIFIED_F), "w") as file:
+                json.dump({'time': started, 'checked': self.checked}, file)
+        return self.problems
+
+    def read_head(self, path):
+        try:
+            with open(os.path.join(path, node.HEAD_FILE), "r") as file:
+                return json.load(file)
+        except (OSError, ValueError) as e:
+            self.report(os.path.join(path, node.HEAD_FILE), "head", f"unreadable: {e!r}")
+            return None
+
+    def check_dir(self, path, since, executor):
+        """
+        Пересчёт хэшей файлов блоков дирректории узла (изменённых после since)
+        :return: (имена всех файлов блоков, {имя файла: родители})
+        """
+        names = set()
+        files = []
+        rehash = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.name == node.HEAD_FILE or store.is_temp(entry.name) or not entry.is_file():
+                    continue
+                names.add(entry.name)
+                files.append(entry.path)
+                rehash.append(entry.stat().st_mtime_ns >= since)
+        parents = {}
+        for file, changed, (links, error) in zip(files, rehash, executor.map(check_file, files, rehash)):
+            if changed:
+                self.checked += 1
+            else:
+                self.skipped += 1
+            if error is not None:
+                self.report(file, "block", error)
+            if links is not None:
+                parents[os.path.basename(file)] = links
+        return names, parents
+
+    def check_storage(self, path, since, executor):
+        """
+        :return: HEAD узла-хранилища или None
+        """
+        head = self.read_head(path)
+        names, parents = self.check_dir(path, since, executor)
+        base = set(head.get('base', [])) if head else set()
+        for name, links in parents.items():
+            if name in base:
+                continue
+            for addr, parent in links.items():
+                if parent != GENESIS_BLOCK and parent not in names:
+                    self.report(os.path.join(path, name), "parent", f"missing parent of {addr}: {parent}")
+        if head is None:
+            return None
+        if len(names) + 1 + head.get('base_count', 0) != head['blocks']:
+            self.report(os.path.join(path, node.HEAD_FILE), "count",
+                        f"{head['blocks']} blocks in HEAD, {len(names) + 1} stored, "
+                        f"{head.get('base_count', 0)} below snapshot")
+        for addr, block_id in head['heads'].items():
+            if block_id != GENESIS_BLOCK and block_id not in names:
+                self.report(os.path.join(path, node.HEAD_FILE), "head", f"missing head of {addr}: {block_id}")
+        return head
+
+    def check_user(self, path, since, executor):
+        """
+        :return: HEAD узла-участника или None
+        """
+        head = self.read_head(path)
+        names, parents = self.check_dir(path, since, executor)
+        if head is None:
+            return None
+        addr = head['addr']
+        for name, links in parents.items():
+            if name == head.get('base'):
+                continue
+            parent = links.get(addr)
+            if parent is None:
+                self.report(os.path.join(path, name), "parent", f"block has no parent of {addr}")
+            elif parent != GENESIS_BLOCK and parent not in names:
+                self.report(os.path.join(path, name), "parent", f"missing parent: {parent}")
+        if head['head'] != GENESIS_BLOCK and head['head'] not in names:
+            self.report(os.path.join(path, node.HEAD_FILE), "head", f"missing head: {head['head']}")
+        return head
+
+    def check_heads(self, stgs, stg_heads, usrs, usr_heads):
+        """
+        Сравнение HEAD доступных узлов-хранилищ между собой и с HEAD участников
+        """
+        available = [(path, head) for path, head in zip(stgs, stg_heads) if head and head['available']]
+        if not available:
+            return
+        base_path, base = available[0]
+        for path, head in available[1:]:
+            for addr in set(base['heads']) | set(head['heads']):
+                if base['heads'].get(addr) != head['heads'].get(addr):
+                    self.report(os.path.join(path, node.HEAD_FILE), "mesh",
+                                f"head of {addr}: {head['heads'].get(addr)} != "
+                                f"{os.path.relpath(base_path, self.path)}: {base['heads'].get(addr)}")
+        for path, head in zip(usrs, usr_heads):
+            if head is None:
+                continue
+            if base['heads'].get(head['addr']) != head['head']:
+                self.report(os.path.join(path, node.HEAD_FILE), "mesh",
+                            f"head {head['head']} != storage head {base['heads'].get(head['addr'])}")
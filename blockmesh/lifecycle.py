@@ -0,0 +1,154 @@
+import json
+import os
+
+LIFECYCLE_F = r'LIFECYCLE.json'
+
+
+class Histogram:
+    """
+    Гистограмма целых значений с корзинами по степеням двойки: 0, 1, 2, 3-4, 5-8, ...
+    """
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = []
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value: int):
+        bucket = max(int(value) - 1, 0).bit_length() + (value > 0)
+        if bucket >= len(self.counts):
+            self.counts.extend([0] * (bucket + 1 - len(self.counts)))
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    @staticmethod
+    def bound(bucket: int):
+        """
+        :return: верхняя граница корзины
+        """
+        return 0 if bucket == 0 else 2 ** (bucket - 1)
+
+    def percentile(self, p: float):
+        """
+        :return: верхняя граница корзины, в которую попадает перцентиль p
+        """
+        rank = p / 100 * self.count
+        seen = 0
+        for bucket, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return min(self.bound(bucket), self.max)
+        return self.max
+
+    def get_stat(self):
+        return {"count": self.count,
+                "mean": round(self.total / self.count, 3) if self.count else 0,
+                "p50": self.percentile(50),
+                "p90": self.percentile(90),
+                "p99": self.percentile(99),
+                "max": self.max,
+                "buckets": {f"<={self.bound(b)}": n for b, n in enumerate(self.counts) if n}}
+
+
+class Lifecycle:
+    """
+    Жизненный цикл блоков (ключ - дайджест транзакции, общий для всех копий блока): постановка
+    в очередь, одобрение на шаге 1, отложения из-за конфликта участников на шаге 2, раунды без
+    полного набора подтверждений (Modified) и внедрение на каждом узле-хранилище.
+    Отложения и раунды без подтверждений считаются в среднем на узел-хранилище.
+    Завершённые блоки сразу сворачиваются в гистограммы, файл пишется один раз в конце
+    """
+
+    def __init__(self, clock, stgs: list):
+        """
+        :param clock: модельное время (model.ModelTime)
+        :param stgs: узлы-хранилища модели - блок завершён, когда внедрён на всех доступных
+        """
+        self.clock = clock
+        self.stgs = stgs
+        self.blocks = {}  # дайджест: [создан, в очереди, одобрен, отложен, без подтверждений, внедрён, первое внедрение]
+        self.rejected = 0
+        self.histograms = {"queue_wait": Histogram(),
+                           "to_first_insert": Histogram(),
+                           "to_mesh": Histogram(),
+                           "deferrals": Histogram(),
+                           "unconfirmed_rounds": Histogram()}
+
+    def enqueue(self, block):
+        key = block.tx.digest()
+        if key not in self.blocks:
+            self.blocks[key] = [block.timestamp, self.clock.time, None, 0, 0, 0, None]
+
+    def approve(self, block):
+        state = self.blocks.get(block.tx.digest())
+        if state is not None and state[2] is None:
+            state[2] = self.clock.time
+
+    def reject(self, block):
+        if self.blocks.pop(block.tx.digest(), None) is not None:
+            self.rejected += 1
+
+    def defer(self, block):
+        state = self.blocks.get(block.tx.digest())
+        if state is not None:
+            state[3] += 1
+
+    def unconfirmed(self, block):
+        state = self.blocks.get(block.tx.digest())
+        if state is not None:
+            state[4] += 1
+
+    def insert(self, block):
+        key = block.tx.digest()
+        state = self.blocks.get(key)
+        if state is None:
+            return
+        now = self.clock.time
+        state[5] += 1
+        if state[6] is None:
+            state[6] = now
+        if state[5] >= sum(s.available for s in self.stgs):
+            created, enqueued, approved, deferred, unconfirmed, inserted, first = self.blocks.pop(key)
+            h = self.histograms
+            h["queue_wait"].add((approved if approved is not None else first) - enqueued)
+            h["to_first_insert"].add(first - created)
+            h["to_mesh"].add(now - created)
+            # отложения и отсутствие подтверждений отмечает каждый узел - в пересчёте на узел
+            h["deferrals"].add(round(deferred / inserted))
+            h["unconfirmed_rounds"].add(round(unconfirmed / inserted))
+
+    def get_stat(self):
+        to_mesh = self.histograms["to_mesh"].get_stat()
+        return {"LifecycleBlocks": to_mesh["count"],
+                "InFlight": len(self.blocks),
+                "AvgToMesh": to_mesh["mean"],
+                "P90ToMesh": to_mesh["p90"],
+                "AvgDeferrals": self.histograms["deferrals"].get_stat()["mean"]}
+
+    def report(self):
+        """
+        :return: гистограммы (в единицах модельного времени, счётчики - в штуках)
+        """
+        return {"blocks": self.histograms["to_mesh"].count,
+                "in_flight": len(self.blocks),
+                "rejected": self.rejected,
+                "histograms": {k: h.get_stat() for k, h in self.histograms.items()}}
+
+    def save(self, path_to_dir: str, mod: str):
+        """
+        Запись отчёта в LIFECYCLE.json дирректории модели под ключом режима
+        :param path_to_dir: путь к дирректории модели
+        :param mod: режим модели
+        """
+        path = os.path.join(path_to_dir, LIFECYCLE_F)
+        data = {}
+        if os.path.isfile(path):
+            with open(path, "r") as file:
+                data = json.load(file)
+        data[mod] = self.report()
+        with open(path, "w") as file:
+            json.dump(data, file, indent=2)
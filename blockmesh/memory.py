@@ -0,0 +1,38 @@
+import tracemalloc
+import os
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def start(frames: int = 32):
+    """
+    Начать учёт выделений памяти
+    :param frames: глубина стека, по которой выделение относится к подсистеме
+    """
+    tracemalloc.start(frames)
+
+
+def report():
+    """
+    Использование памяти по подсистемам: выделение относится к ближайшему по стеку
+    модулю blockmesh (остальное - other)
+    :return: {подсистема: байт} по убыванию, Total и Peak - текущий и пиковый объём
+    """
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("Memory tracing is not started")
+    usage = {}
+    for trace in tracemalloc.take_snapshot().traces:
+        name = "other"
+        for frame in reversed(trace.traceback):
+            if os.path.dirname(frame.filename) == PACKAGE_DIR:
+                name = os.path.splitext(os.path.basename(frame.filename))[0]
+                break
+        if name == __name__.rsplit('.', 1)[-1]:
+            # собственные выделения отчёта
+            continue
+        usage[name] = usage.get(name, 0) + trace.size
+    current, peak = tracemalloc.get_traced_memory()
+    stat = dict(sorted(usage.items(), key=lambda item: -item[1]))
+    stat["Total"] = current
+    stat["Peak"] = peak
+    return stat
@@ -0,0 +1,138 @@
+from blockmesh.block import DISK
+from blockmesh.store import replace_file
+import json
+import time
+
+
+def ratio(hits, misses):
+    return round(hits / (hits + misses), 4) if hits + misses else 0.0
+
+
+class Metrics:
+    """
+    Метрики работающего моделирования без сетевых сервисов: файл в текстовом формате Prometheus
+    (обновляется после каждого раунда консенсуса, перезаписывается не чаще interval секунд,
+    подходит для node_exporter textfile collector) и поток JSON-строк (одна строка на итерацию).
+    При шардированном исполнении обращения к диску и кэшам процессов шардов учитываются
+    через их дельты счётчиков (parallel.apply) до снятия метрик основным процессом
+    """
+
+    def __init__(self, prom_path: str = None, jsonl_path: str = None, interval: float = 1.0):
+        """
+        :param prom_path: путь к файлу метрик Prometheus
+        :param jsonl_path: путь к файлу потока JSON-строк (дописывается)
+        :param interval: минимальный интервал перезаписи файла Prometheus, с
+        """
+        if interval < 0:
+            raise ValueError(f"Interval must be >= 0: {interval}")
+        self.prom_path = prom_path
+        self.jsonl_path = jsonl_path
+        self.interval = interval
+        self.stream = open(jsonl_path, "a") if jsonl_path else None
+        self.written_at = None
+        self.last_at = None
+        self.last_blocks = None
+        self.iterations = 0
+        self.latency_sum = 0.0
+        self.sample = {}
+
+    def close(self):
+        """
+        Финальная запись метрик
+        """
+        if self.sample and self.prom_path:
+            replace_file(self.prom_path, self.prometheus())
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+    def observe(self, m):
+        """
+        Снятие метрик на границе итерации
+        :param m: model.Model
+        """
+        now = time.perf_counter()
+        blocks = m.stgs[0].block_count if m.stgs else 0
+        if self.last_at is None:
+            # первое наблюдение - начало отсчёта
+            self.last_at, self.last_blocks, self.written_at = now, blocks, now
+            return
+        latency = now - self.last_at
+        self.iterations += 1
+        self.latency_sum += latency
+        sample = {"time": round(time.time(), 3),
+                  "iteration": m.performed,
+                  "blocks": blocks,
+                  "blocks_per_sec": round((blocks - self.last_blocks) / latency, 2) if latency else 0.0,
+                  "iteration_seconds": round(latency, 6)}
+        sample.update(self.gauges(m))
+        self.sample = sample
+        self.last_at, self.last_blocks = now, blocks
+        if self.stream:
+            self.stream.write(json.dumps(sample) + "\n")
+            self.stream.flush()
+        self.write(now)
+
+    def refresh(self, m):
+        """
+        Обновление текущих значений после шага 2 раунда консенсуса (Model.round_done), чтобы файл
+        Prometheus не устаревал на всю итерацию. Поток JSON-строк дописывается только в observe
+        :param m: model.Model
+        """
+        if not self.prom_path or self.last_at is None:
+            return
+        sample = self.sample or {"time": 0, "iteration": m.performed, "blocks_per_sec": 0.0, "iteration_seconds": 0.0}
+        sample.update(time=round(time.time(), 3), blocks=m.stgs[0].block_count if m.stgs else 0, **self.gauges(m))
+        self.sample = sample
+        self.write(time.perf_counter())
+
+    @staticmethod
+    def gauges(m):
+        """
+        :return: очереди, обращения к диску и доли попаданий в кэши
+        """
+        sample = {"queues": [s.queue_len() for s in m.stgs],
+                  "disk_reads": DISK['reads'],
+                  "disk_writes": DISK['writes'],
+                  "cache_hit_ratio": {}}
+        if m.arena is not None:
+            sample["cache_hit_ratio"]["arena"] = ratio(m.arena.hits, m.arena.misses)
+        if m.writer is not None:
+            sample["cache_hit_ratio"]["pending"] = ratio(m.writer.read_hits, m.writer.read_misses)
+        sample["cache_hit_ratio"]["verify"] = ratio(m.verifier.cache_hits, m.verifier.verified)
+        return sample
+
+    def write(self, now):
+        """
+        Перезапись файла Prometheus, если с прошлой записи прошло не меньше interval секунд
+        """
+        if self.prom_path and now - self.written_at >= self.interval:
+            replace_file(self.prom_path, self.prometheus())
+            self.written_at = now
+
+    def prometheus(self):
+        """
+        :return: последний срез метрик в текстовом формате Prometheus
+        """
+        s = self.sample
+        lines = []
+
+        def metric(name, kind, doc, values):
+            lines.append(f"# HELP bm_{name} {doc}")
+            lines.append(f"# TYPE bm_{name} {kind}")
+            for labels, value in values:
+                lines.append(f"bm_{name}{labels} {value}")
+
+        metric("iterations_total", "counter", "Performed iterations", [("", s["iteration"])])
+        metric("blocks", "gauge", "Blocks in the blockmesh", [("", s["blocks"])])
+        metric("blocks_per_second", "gauge", "Blocks inserted per second during the last iteration",
+               [("", s["blocks_per_sec"])])
+        metric("iteration_seconds", "summary", "Wall time of iterations",
+               [("_sum", round(self.latency_sum, 6)), ("_count", self.iterations)])
+        metric("queue_depth", "gauge", "Blocks waiting in storage queues",
+               [(f'{{storage="{i}"}}', q) for i, q in enumerate(s["queues"])])
+        metric("disk_reads_total", "counter", "Block files read from disk", [("", s["disk_reads"])])
+        metric("disk_writes_total", "counter", "Block files written to disk", [("", s["disk_writes"])])
+        metric("cache_hit_ratio", "gauge", "Hit ratio of block caches",
+               [(f'{{cache="{k}"}}', v) for k, v in s["cache_hit_ratio"].items()])
+        return "\n".join(lines) + "\n"
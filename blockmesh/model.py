@@ -1,5 +1,11 @@
 from progress.bar import IncrementalBar
 import blockmesh.node as node
+import blockmesh.topology as topology
+import blockmesh.store as store
+import blockmesh.signature as signature
+import blockmesh.codec as codec
+import blockmesh.pending as pending
+import blockmesh.accounting as accounting
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
 import networkx as nx
@@ -12,6 +18,7 @@ import os
 STG_DIR = r'Storages'
 USR_DIR = r'Users'
 MODEL_F = r'MODEL'
+MANIFEST_F = r'MANIFEST'
 RESULT_F = r'RESULT.csv'
 USR_NODE = r'usr_'
 STG_NODE = r'stg_'
@@ -54,6 +61,15 @@ class ModelTime:
         data = json.loads(data)
         return ModelTime(data["time"], data["step"])
 
+    def advance(self, time: int):
+        """
+        Перевести время вперёд
+        :param time: новое время
+        """
+        if time < self.time:
+            raise ValueError(f"Time could not go back: {time} < {self.time}")
+        self.time = time
+
     def tick(self, mul: int = 1):
         """
         Увеличить время
@@ -70,13 +86,14 @@ class Model:
     """
 
     def __init__(self, mod: node.Mod, path_to_dir: str, stg_num: int, usr_num: int,
-                 duration_1: int, duration_2: int):
+                 duration_1: int, duration_2: int, overlay: topology.Overlay = None):
         """
         :param path_to_dir:
         :param stg_num:
         :param usr_num:
         :param duration_1:
         :param duration_2:
+        :param overlay: оверлейная сеть узлов-хранилищ (None - полный граф)
         """
         if mod != node.Mod.Classic and mod != node.Mod.Modified:
             raise ValueError(f"Unknown mod: {mod.name}")
@@ -93,63 +110,346 @@ class Model:
         self.usrs = []
         self.model_time = None
         self.performed = 0
+        self.overlay = overlay
+        self.directory = node.Directory()
+        self.arena = None
+        self.writer = None
+        self.codec = None
+        self.metrics = None
+        self.recorder = None
+        self.tracker = None
+        self.pipeline = None
+        self.balancer = None
+        self.accountant = None
+        self.messages = None  # итоги учёта сообщений прежних запусков (accounting.summary)
+        self.verifier = signature.Verifier()
 
     def init(self, ts=None):
         self.model_time = ts if ts else ModelTime()
         self.stgs = [node.Storage(self.mod, os.path.join(self.path, STG_DIR, f"{STG_NODE}{i}"),
-                                  self.model_time) for i in range(self.stg_num)]
+                                  self.model_time, self.directory) for i in range(self.stg_num)]
         for i in range(len(self.stgs) - 1):
             self.stgs[i + 1].join_bm(self.stgs[i])
+        if self.overlay:
+            self.overlay.build(self.stgs)
         self.usrs = [node.User(self.mod, os.path.join(self.path, USR_DIR, f"{USR_NODE}{i}"),
                                f"user{i}", f"sign{i}", self.stgs[i % self.stg_num]) for i in range(self.usr_num)]
+        self.use_verifier(self.verifier)
+
+    def use_verifier(self, verifier: signature.Verifier):
+        """
+        Подключить общую для модели проверку подписей ко всем узлам-хранилищам
+        :param verifier: signature.Verifier
+        """
+        self.verifier = verifier
+        for s in self.stgs:
+            s.verifier = verifier
+
+    def use_codec(self, block_codec: codec.BlockCodec = None):
+        """
+        Подключить сжатие файлов блоков ко всем узлам модели
+        :param block_codec: codec.BlockCodec (None - без сжатия)
+        """
+        self.codec = block_codec
+        for s in self.stgs:
+            s.codec = block_codec
+        for u in self.usrs:
+            u.codec = block_codec
+
+    def block_files(self):
+        """
+        :return: пути ко всем файлам блоков узлов модели
+        """
+        files = []
+        for n in self.stgs + self.usrs:
+            with os.scandir(n.path_to_dir) as entries:
+                files.extend(e.path for e in entries
+                             if e.is_file() and e.name != node.HEAD_FILE and not store.is_temp(e.name))
+        return files
+
+    def use_queue_policy(self, policy: str):
+        """
+        Политика выборки блоков из очередей узлов-хранилищ (только Modified)
+        :param policy: pending.INSERTION, pending.OLDEST или pending.CONFIRMATIONS
+        """
+        if policy not in pending.POLICIES:
+            raise ValueError(f"Unknown drain policy: {policy}")
+        if self.mod != node.Mod.Modified:
+            if policy != pending.INSERTION:
+                raise RuntimeError(f"Drain policy {policy} requires Modified mod")
+            return
+        for s in self.stgs:
+            s.queue.policy = policy
+
+    def get_queue_stat(self):
+        """
+        :return: статистика ожидания блоков в очередях (модельное время от поступления до внедрения)
+        и их отложений на шаге 2 (ожидание к моменту отложения)
+        """
+        if self.mod != node.Mod.Modified:
+            return {}
+        stats = [s.queue.get_stat() for s in self.stgs]
+        drained = sum(st["Drained"] for st in stats)
+        deferred = sum(st["Deferred"] for st in stats)
+        return {"QueuePolicy": self.stgs[0].queue.policy if self.stgs else pending.INSERTION,
+                "Drained": drained,
+                "AvgWait": round(sum(st["WaitSum"] for st in stats) / drained, 2) if drained else 0,
+                "MaxWait": max([st["MaxWait"] for st in stats], default=0),
+                "Deferred": deferred,
+                "AvgDeferWait": round(sum(st["DeferWaitSum"] for st in stats) / deferred, 2) if deferred else 0,
+                "MaxDeferWait": max([st["MaxDeferWait"] for st in stats], default=0)}
+
+    def use_metrics(self, metrics):
+        """
+        Подключить экспорт метрик: срез снимается на каждой границе итерации (persist)
+        :param metrics: metrics.Metrics
+        """
+        self.metrics = metrics
+        metrics.observe(self)
+
+    def use_pipeline(self, enabled: bool = True):
+        """
+        Конвейерные раунды консенсуса (только Modified): шаг 1 следующего раунда выполняется
+        по очередям до шага 2 текущего, блоки ещё не завершённого раунда повторно не рассылаются
+        :param enabled: включить конвейер
+        """
+        if enabled and self.mod != node.Mod.Modified:
+            raise RuntimeError("Pipelined rounds require Modified mod")
+        self.pipeline = pending.InFlight() if enabled else None
+        for s in self.stgs:
+            s.in_flight = self.pipeline
+
+    def use_balancer(self, balancer):
+        """
+        Подключить перераспределение участников между узлами-хранилищами на границах итераций
+        :param balancer: balancer.Balancer
+        """
+        self.balancer = balancer
+
+    def use_accountant(self, accountant):
+        """
+        Подключить учёт сообщений протокола ко всем узлам-хранилищам
+        :param accountant: accounting.Accountant
+        """
+        self.accountant = accountant
+        for s in self.stgs:
+            s.accountant = accountant
+
+    def use_tracker(self, tracker):
+        """
+        Подключить учёт жизненного цикла блоков ко всем узлам-хранилищам
+        :param tracker: lifecycle.Lifecycle
+        """
+        self.tracker = tracker
+        for s in self.stgs:
+            s.tracker = tracker
+
+    def use_recorder(self, recorder):
+        """
+        Подключить запись трассы: вызовы usr_perform, раунды узлов-хранилищ и границы итераций
+        :param recorder: trace.TraceWriter
+        """
+        self.recorder = recorder
+
+    def trace_round(self, i: int):
+        """
+        Отметка начала раунда консенсуса (шаги 1 и 2 всех узлов-хранилищ) в трассе
+        :param i: номер итерации
+        """
+        if self.recorder is not None:
+            self.recorder.round(self.model_time.time, i)
+
+    def round_done(self):
+        """
+        Завершение раунда консенсуса (после шага 2 всех узлов-хранилищ): обновление текущих метрик
+        """
+        if self.metrics is not None:
+            self.metrics.refresh(self)
+
+    def use_writer(self, writer: store.BlockWriter):
+        """
+        Подключить отложенную запись блоков ко всем узлам модели
+        :param writer: store.BlockWriter
+        """
+        self.writer = writer
+        for s in self.stgs:
+            s.writer = writer
+        for u in self.usrs:
+            u.writer = writer
+
+    def persist(self, results=None):
+        """
+        Завершение итерации: сброс отложенных записей блоков. В режимах с fsync дополнительно
+        сохраняется состояние модели, поэтому при сбое теряется не более текущей итерации
+        :param results: открытый файл результатов
+        """
+        if self.metrics is not None:
+            self.metrics.observe(self)
+        if self.recorder is not None:
+            self.recorder.iteration(self.model_time.time, self.performed)
+        if self.accountant is not None:
+            self.accountant.iteration(self.performed)
+        if self.balancer is not None:
+            self.balancer.rebalance(self)
+        if self.writer is None:
+            return
+        self.writer.flush()
+        if self.writer.durability != store.NONE:
+            self.save()
+            if results:
+                results.flush()
+                os.fsync(results.fileno())
+
+    def snapshot(self, archive: bool = True):
+        """
+        Снимок блокмеша: текущие головы узлов становятся новой базой, более старые блоки
+        удаляются (или переносятся в archive), обходы останавливаются на базе
+        :param archive: перенести удаляемые блоки в поддиректории archive узлов
+        :return: {"Storages": удалено у узлов-хранилищ, "Users": удалено у участников}
+        """
+        unavailable = [i for i, s in enumerate(self.stgs) if not s.available]
+        if unavailable:
+            raise RuntimeError(f"Snapshot requires all storages to be available: {unavailable}")
+        self.save()
+        pruned = {"Storages": sum(s.snapshot(archive) for s in self.stgs),
+                  "Users": sum(u.snapshot(archive) for u in self.usrs)}
+        self.save()
+        return pruned
 
     def save(self):
+        """
+        Сохранение состояния: HEAD-файлы и MODEL заменяются атомарно, в режимах надёжной записи
+        (store.PER_ITERATION, store.PER_BLOCK_FSYNC) - с fsync
+        """
+        sync = self.writer is not None and self.writer.durability != store.NONE
+        if self.writer:
+            self.writer.flush()
         for s in self.stgs:
-            s.save()
+            s.save(sync)
         for u in self.usrs:
-            u.save()
-        with open(os.path.join(self.path, MODEL_F), 'w') as out:
-            json.dump({"mod": self.mod.name,
-                       "num": [self.stg_num, self.usr_num],
-                       "dur": self.duration,
-                       "ts": self.model_time.dumps() if self.model_time else None,
-                       "perf": self.performed}, out)
+            u.save(sync)
+        store.replace_file(os.path.join(self.path, MODEL_F),
+                           json.dumps({"mod": self.mod.name,
+                                       "num": [self.stg_num, self.usr_num],
+                                       "dur": self.duration,
+                                       "ts": self.model_time.dumps() if self.model_time else None,
+                                       "perf": self.performed,
+                                       "net": self.overlay.dumps() if self.overlay else None,
+                                       "usr_stg": [self.stgs.index(u.stg) for u in self.usrs]}), sync)
+        self.save_manifest(sync)
+
+    def manifest(self):
+        """
+        :return: сводка состояния модели для bm.py status без загрузки узлов
+        """
+        queues = [s.queue_len() for s in self.stgs]
+        return {"mod": self.mod.name,
+                "num": [self.stg_num, self.usr_num],
+                "dur": self.duration,
+                "perf": self.performed,
+                "time": self.model_time.time if self.model_time else None,
+                "blocks": [s.block_count for s in self.stgs],
+                "queues": queues,
+                "queue_total": sum(queues),
+                "sync": self.get_sync_count(),
+                "stat": self.get_stat(),
+                "net": self.get_net_stat(),
+                "messages": self.accountant.messages if self.accountant is not None else self.messages}
+
+    def save_manifest(self, sync: bool = False):
+        """
+        Атомарная запись сводки (MANIFEST) - пишется последней, после HEAD-файлов узлов и MODEL
+        :param sync: синхронизировать файл с диском
+        """
+        store.replace_file(os.path.join(self.path, MANIFEST_F), json.dumps(self.manifest()), sync)
 
     @staticmethod
-    def load(path_to_dir):
+    def read_manifest(path_to_dir):
+        """
+        :param path_to_dir: путь к дирректории модели
+        :return: сводка модели (Model.manifest) или None, если модель сохранена без неё
+        """
+        path = os.path.join(os.path.abspath(path_to_dir), MANIFEST_F)
+        if not os.path.isfile(path):
+            if not os.path.isfile(os.path.join(os.path.abspath(path_to_dir), MODEL_F)):
+                raise FileNotFoundError(f"There is no blockmesh model in {path_to_dir}")
+            return None
+        with open(path, "r") as file:
+            return json.load(file)
+
+    @staticmethod
+    def load(path_to_dir, arena=None, walk: bool = False):
+        """
+        :param path_to_dir: путь к дирректории модели
+        :param arena: арена блоков в разделяемой памяти (arena.BlockArena)
+        :param walk: обходить цепочки участников и сверять их с HEAD-файлами (см. node.User.load)
+        """
         path_to_dir = os.path.abspath(path_to_dir)
         if path_to_dir is None:
             raise NotADirectoryError(f"Could not load Model: {path_to_dir} does not exist")
         model = None
+        # словарь регистрируется до чтения блоков
+        block_codec = codec.BlockCodec.load(path_to_dir)
         with open(os.path.join(path_to_dir, MODEL_F), "r") as file:
             data = json.load(file)
             model = Model(node.Mod[data["mod"]], path_to_dir, data['num'][0], data['num'][1],
-                          data['dur'][0], data['dur'][1])
+                          data['dur'][0], data['dur'][1], topology.Overlay.loads(data.get('net')))
             model.model_time = ModelTime.loads(data['ts'])
             model.performed = data['perf']
+            model.arena = arena
+            # узлы-хранилища участников (после Balancer отличаются от исходных i % stg_num)
+            usr_stg = data.get('usr_stg') or [i % model.stg_num for i in range(model.usr_num)]
         bar_s = IncrementalBar('Load storages', max=model.stg_num)
-        stg = node.Storage.load(os.path.join(path_to_dir, STG_DIR, f"{STG_NODE}0"), model.model_time)
+        stg = node.Storage.load(os.path.join(path_to_dir, STG_DIR, f"{STG_NODE}0"), model.model_time,
+                                directory=model.directory, arena=model.arena)
         model.stgs.append(stg)
         bar_s.next()
         for i in range(1, model.stg_num):
-            stg = node.Storage.load(os.path.join(path_to_dir, STG_DIR, f"{STG_NODE}{i}"), model.model_time)
+            stg = node.Storage.load(os.path.join(path_to_dir, STG_DIR, f"{STG_NODE}{i}"), model.model_time,
+                                    directory=model.directory, arena=model.arena)
             model.stgs.append(stg)
             model.stgs[i].join_bm(model.stgs[i - 1])
             bar_s.next()
         bar_s.finish()
+        if model.overlay:
+            model.overlay.build(model.stgs)
         bar_u = IncrementalBar('Load users\t', max=model.usr_num)
         for i in range(model.usr_num):
             model.usrs.append(node.User.load(os.path.join(path_to_dir, USR_DIR, f"{USR_NODE}{i}"),
-                                             model.stgs[i % model.stg_num]))
+                                             model.stgs[usr_stg[i]], walk))
             bar_u.next()
         bar_u.finish()
+        model.use_verifier(model.verifier)
+        model.use_codec(block_codec)
+        info = Model.read_manifest(path_to_dir)
+        # сводки, сохранённые до учёта сообщений в MANIFEST, - по MESSAGES.csv
+        model.messages = info["messages"] if info and "messages" in info else accounting.summary(path_to_dir)
         return model
 
-    def run(self):
-        header = list(self.get_stat().keys())
+    def scenario(self):
+        """
+        :return: сценарий {отправитель: [получатели]} - каждый участник взаимодействует с каждым
+        """
         usrs = [u for u in range(self.usr_num)]
+        return {u: [x for i, x in enumerate(usrs) if i != u] for u in usrs}
+
+    def run(self, engine=None):
+        """
+        Моделирование
+        :param engine: событийный движок (engine.EventEngine); None - пошаговое моделирование
+        """
+        if engine is not None:
+            return engine.run(self)
+        self.simulate(self.__iteration)
+
+    def simulate(self, iteration):
+        """
+        Цикл моделирования по итерациям с записью результатов
+        :param iteration: функция одной итерации: iteration(scenario)
+        """
+        header = list(self.get_stat().keys())
         scale = self.usr_num * (self.usr_num - 1)
-        scenario = {u: [x for i, x in enumerate(usrs) if i != u] for u in usrs}
+        scenario = self.scenario()
         cur = self.stgs[0].block_count
         bar = IncrementalBar('Blocks in blockmesh', max=scale+cur)
         bar.next(cur)
@@ -159,10 +459,10 @@ class Model:
                 writer.writeheader()
                 writer.writerow(self.get_stat())
             while scenario or sum([stg.queue_len() for stg in self.stgs]) > 0:
-                self.__usr_step(scenario)
-                self.__stg_step()
+                iteration(scenario)
                 self.performed += 1
                 writer.writerow(self.get_stat())
+                self.persist(csv_file)
                 bar.next(self.stgs[0].block_count - cur)
                 cur = self.stgs[0].block_count
         bar.finish()
@@ -214,6 +514,9 @@ class Model:
     def get_sync_count(self):
         return len(set(self.stgs[0].block_mesh.values())) if self.stg_num > 0 else 0
 
+    def get_net_stat(self):
+        return self.overlay.get_stat() if self.overlay else {"Topology": topology.Topology.Full.name}
+
     def get_stat(self):
         queues = []
         queue_len = 0
@@ -233,21 +536,29 @@ class Model:
                 "Queues": queues,
                 "AvgQueue": queue_len / self.stg_num}
 
-    def __usr_step(self, scenario):
+    def __iteration(self, scenario):
+        self.usr_step(scenario)
+        self.__stg_step()
+
+    def usr_step(self, scenario):
+        """
+        Первый этап итерации: участники генерируют транзакции по сценарию
+        :param scenario: сценарий {отправитель: [получатели]}
+        """
         dur = self.duration[0]
         shallow = scenario.copy()
         for sender in shallow:
             if not shallow[sender]:
                 scenario.pop(sender)
             for receiver in shallow[sender]:
-                if not self.__usr_perform(sender, [receiver]):
+                if not self.usr_perform(sender, [receiver]):
                     break
                 scenario[sender].remove(receiver)
             dur -= 1
             self.model_time.tick()
         self.model_time.tick(dur)
 
-    def __usr_perform(self, sender: int, receivers: list):
+    def usr_perform(self, sender: int, receivers: list):
         allowed = self.usrs[sender].generation_allowed
         res = allowed is None or allowed is True
         if res:
@@ -256,28 +567,83 @@ class Model:
             for recv in receivers:
                 if recv == sender or recv >= len(self.usrs) or recv < 0:
                     raise ValueError(f"Wrong receiver {recv} in {receivers}")
+            if self.recorder is not None:
+                self.recorder.perform(self.model_time.time, sender, receivers)
             self.usrs[sender].perform([self.usrs[i].addr for i in receivers], {"ypos": sender,
                                                                                "info": f"{sender} -> {receivers}"})
         return res
 
-    def __stg_step(self):
+    def stg_rounds(self):
+        """
+        :return: количество раундов консенсуса за итерацию, длительность раунда, остаток второго этапа
+        """
         if self.mod == node.Mod.Classic:
+            return 1, self.duration[1], 0
+        div = 3
+        return self.duration[1] // div, div, self.duration[1] % div
+
+    def __stg_step(self):
+        if self.pipeline is not None:
+            return self.__stg_step_pipelined()
+        rounds, duration, last = self.stg_rounds()
+        for _ in range(rounds):
+            self.trace_round(self.performed + 1)
             for s in self.stgs:
                 s.perform_step_1()
             for s in self.stgs:
                 s.perform_step_2(self.performed + 1)
+            self.round_done()
+            self.model_time.tick(duration)
+        self.model_time.tick(last)
+
+    def __stg_step_pipelined(self):
+        """
+        Второй этап итерации конвейером: раунд из трёх единиц времени - шаг 1 (одна единица) и шаг 2 (две).
+        После заполнения конвейера шаг 1 раунда k+1 идёт во время шага 2 раунда k, и новый раунд
+        начинается каждые две единицы времени. Шаг 1 раунда k+1 выполняется по очередям до шага 2
+        раунда k, его рассылка копится отдельно (__step_1_ahead). Головы блокмеша шаг 1 не читает,
+        шаги 2 раундов выполняются по очереди и видят головы после предыдущего раунда
+        """
+        step = 2
+        rounds, last = divmod(self.duration[1] - 1, step)
+        if rounds < 1:
             self.model_time.tick(self.duration[1])
-        elif self.mod == node.Mod.Modified:
-            div = 3
-            iterations = self.duration[1] // div
-            last = self.duration[1] - (div * iterations)
-            for _ in range(iterations):
-                for s in self.stgs:
-                    s.perform_step_1()
-                for s in self.stgs:
-                    s.perform_step_2(self.performed + 1)
-                self.model_time.tick(div)
-            self.model_time.tick(last)
+            return
+        i = self.performed + 1
+        self.pipeline.clear()
+        for s in self.stgs:
+            s.perform_step_1()
+        self.pipeline.rounds += 1
+        self.model_time.tick()
+        for k in range(rounds):
+            ahead = self.__step_1_ahead() if k + 1 < rounds else None
+            for s in self.stgs:
+                s.perform_step_2(i)
+            self.round_done()
+            if ahead is not None:
+                for s, shared in zip(self.stgs, ahead):
+                    s.shared_blocks = shared
+            self.model_time.tick(step)
+        self.model_time.tick(last)
+
+    def __step_1_ahead(self):
+        """
+        Шаг 1 следующего раунда конвейера до шага 2 текущего: рассылка принимается в новые буферы,
+        у узлов-хранилищ остаются блоки текущего раунда
+        :return: буферы рассылки следующего раунда по узлам-хранилищам
+        """
+        current = [s.shared_blocks for s in self.stgs]
+        for s in self.stgs:
+            s.shared_blocks = type(s.shared_blocks)()
+        self.pipeline.rotate()
+        for s in self.stgs:
+            s.perform_step_1()
+        self.pipeline.rounds += 1
+        self.pipeline.overlapped += 1
+        ahead = [s.shared_blocks for s in self.stgs]
+        for s, shared in zip(self.stgs, current):
+            s.shared_blocks = shared
+        return ahead
 
     def __graph(self):
         bc = {}
@@ -298,9 +664,13 @@ class Model:
             if block_id is None or block_id in edge or block_id == node.GENESIS_BLOCK:
                 continue
             block = stg.load_block(block_id)
+            pos[block_id] = [block.on_iter, block.tx.data['ypos']]
+            if block_id in stg.base:
+                # блоки ниже снимка удалены
+                edge[block_id] = []
+                continue
             queue.extend(list(set(block.parents.values())))
             edge[block_id] = list(block.parents.values())
-            pos[block_id] = [block.on_iter, block.tx.data['ypos']]
 
         p = {hash_node[0:5]: pos[hash_node] for hash_node in pos}
         p.update({user: [self.performed + 1, idx] for idx, user in enumerate(list(self.stgs[i].block_mesh.keys()))})
@@ -1,7 +1,16 @@
 from blockmesh.block import *
+import blockmesh.signature as signature
+import blockmesh.pending as pending
+import blockmesh.accounting as accounting
+import blockmesh.store as store
+from hashlib import sha256
+from contextlib import nullcontext
 from enum import Enum
+import sys
 
 HEAD_FILE = "HEAD"
+ARCHIVE_DIR = "archive"
+NO_LOCK = nullcontext()  # узлы-хранилища в одном потоке: блокировка не нужна
 
 
 def mkdir(path_to_dir):
@@ -13,6 +22,36 @@ def mkdir(path_to_dir):
     return path_to_dir
 
 
+def head_digest(addr: str, head: str, base: str, length: int, base_count: int):
+    """
+    Контрольная сумма метаданных HEAD-файла участника: искажённые метаданные не принимаются на веру
+    :return: sha256 в hex
+    """
+    return sha256(json.dumps([addr, head, base, length, base_count]).encode('utf-8')).hexdigest()
+
+
+def prune(path_to_dir, ids, archive: bool = True):
+    """
+    Удаление файлов блоков старше снимка
+    :param path_to_dir: дирректория узла
+    :param ids: хэши блоков
+    :param archive: перенести в поддиректорию archive вместо удаления
+    :return: количество удалённых файлов
+    """
+    target = mkdir(os.path.join(path_to_dir, ARCHIVE_DIR)) if archive and ids else None
+    count = 0
+    for block_id in ids:
+        path = os.path.join(path_to_dir, block_id)
+        if not os.path.isfile(path):
+            continue
+        if target:
+            os.replace(path, os.path.join(target, block_id))
+        else:
+            os.remove(path)
+        count += 1
+    return count
+
+
 class Mod(Enum):
     """
     Режимы работы узлов и протокола блокмеш
@@ -21,54 +60,145 @@ class Mod(Enum):
     Modified = 2
 
 
+class Directory:
+    """
+    Общий для блокмеша справочник: адрес участника -> узел-участник (и его узел-хранилище).
+    Также хранит общую таблицу хэшей голов: одинаковые головы всех узлов - один объект строки.
+    Таблица живёт всё время жизни модели и растёт с числом внедрённых блоков
+    """
+    __slots__ = ('users', 'keys', 'heads')
+
+    def __init__(self):
+        self.users = {}
+        self.keys = {}   # адрес: ключ подписи (не удаляется при отключении участника)
+        self.heads = {}  # хэш блока: тот же хэш (общий экземпляр)
+
+    def __len__(self):
+        return len(self.users)
+
+    def __contains__(self, addr):
+        return addr in self.users
+
+    def register(self, user):
+        """
+        :param user: UsrNode
+        """
+        self.users[user.addr] = user
+        self.keys[user.addr] = user.sign
+
+    def unregister(self, user):
+        """
+        :param user: UsrNode
+        """
+        if self.users.get(user.addr) is user:
+            self.users.pop(user.addr)
+
+    def lookup(self, addr):
+        """
+        :param addr: адрес участника
+        :return: UsrNode или None
+        """
+        return self.users.get(addr)
+
+    def intern(self, block_id: str):
+        """
+        :param block_id: хэш блока
+        :return: общий для блокмеша экземпляр строки хэша
+        """
+        if block_id is None:
+            return None
+        # сброс таблицы разделил бы головы, внедрённые до и после него, на разные экземпляры
+        return self.heads.setdefault(block_id, block_id)
+
+    def key(self, addr):
+        """
+        :param addr: адрес участника
+        :return: ключ проверки подписи участника или None
+        """
+        return self.keys.get(addr)
+
+    def merge(self, other):
+        """
+        Объединение справочников при присоединении узла к блокмешу
+        :param other: Directory
+        """
+        if other is not self:
+            self.users.update(other.users)
+            self.keys.update(other.keys)
+            self.heads.update(other.heads)
+
+
 class Storage:
     """
     Класс реализующий функционал узлов-хранилищ blockmesh сети
     """
+    __slots__ = ('queue', 'shared_blocks', 'mod', 'path_to_dir', 'stg_list', 'peers', 'overlay', 'link', 'arena',
+                 'writer', 'codec', 'verifier', 'user_map', 'block_mesh', 'block_count', 'base', 'base_count',
+                 'available', 'timeserver', 'directory', 'tracker', 'in_flight', 'accountant', 'lock')
 
-    def __init__(self, mod: Mod, path_to_dir: str, timeserver):
+    def __init__(self, mod: Mod, path_to_dir: str, timeserver, directory: Directory = None):
         """
         :param mod: режим работы
         :param path_to_dir: путь к дирректории в которой будут храниться блоки этого узла
         :type timeserver:
+        :param directory: общий справочник адресов участников
         """
         if mod == Mod.Classic:
             self.queue = set()  # []
             self.shared_blocks = []
         elif mod == Mod.Modified:
-            self.queue = {}
+            self.queue = pending.PendingQueue(timeserver)
             self.shared_blocks = {}
         else:
             raise ValueError(f"Unknown mod: {mod.name}")
         self.mod = mod
         self.path_to_dir = mkdir(path_to_dir)
         self.stg_list = []    # list of StgNodes
+        self.peers = None     # overlay neighbours (None - all of stg_list)
+        self.overlay = None   # topology.Overlay
+        self.link = None      # канал связи с узлами-хранилищами: link(stg, peer, block, count)
+        self.arena = None     # arena.BlockArena - общий для процессов кэш закодированных блоков
+        self.writer = None    # store.BlockWriter - отложенная запись блоков
+        self.codec = None     # codec.BlockCodec - сжатие файлов блоков
+        self.verifier = signature.Verifier()  # проверка подписей (общая для модели - Model.use_verifier)
+        self.tracker = None   # lifecycle.Lifecycle - жизненный цикл блоков
+        self.in_flight = None  # pending.InFlight - блоки предыдущего раунда конвейера (Model.use_pipeline)
+        self.accountant = None  # accounting.Accountant - учёт сообщений протокола
+        self.lock = NO_LOCK   # общее для узлов состояние на шаге 2 в потоках (aio.AsyncRuntime)
         self.user_map = {}    # addr and its UsrNode
         self.block_mesh = {}  # addr and its head
         self.block_count = 1  # genesis at least
+        self.base = set()     # головы снимка: обход блокмеша останавливается на них
+        self.base_count = 0   # количество блоков ниже снимка
         self.available = True
         self.timeserver = timeserver
+        self.directory = directory if directory is not None else Directory()
 
-    def save(self):
+    def save(self, sync: bool = False):
         """
         Запись состояния узла-хранилища в HEAD-файл
-        """
-        with open(os.path.join(self.path_to_dir, HEAD_FILE), "w") as file:
-            json.dump({'mod': self.mod.name,
-                       'heads': self.block_mesh,
-                       'available': self.available,
-                       'queue': [b.dumps() for b in self.queue] if self.mod == Mod.Classic else
-                       {b.dumps(): c for b, c in self.queue.items()},
-                       'blocks': self.block_count}, file)
+        :param sync: синхронизировать файл с диском
+        """
+        store.replace_file(os.path.join(self.path_to_dir, HEAD_FILE),
+                           json.dumps({'mod': self.mod.name,
+                                       'heads': self.block_mesh,
+                                       'available': self.available,
+                                       'queue': [b.dumps() for b in self.queue] if self.mod == Mod.Classic else
+                                       self.queue.dumps(),
+                                       'blocks': self.block_count,
+                                       'base': sorted(self.base),
+                                       'base_count': self.base_count}), sync)
 
     @staticmethod
-    def load(path_to_dir, timeserver, stg_list=None, usr_map=None):
+    def load(path_to_dir, timeserver, stg_list=None, usr_map=None, directory: Directory = None, arena=None):
         """
         Восстановление состояния узла-хранилища из файла
         :param path_to_dir: путь к дирректории
         :param timeserver:
         :param usr_map: словарь {адрес узла-участника: узел участник}
         :param stg_list: список узлов хранилищ
+        :param directory: общий справочник адресов участников
+        :param arena: арена блоков в разделяемой памяти
         :return: StgNode
         """
         path_to_dir = os.path.abspath(path_to_dir)
@@ -77,18 +207,28 @@ class Storage:
         with open(os.path.join(path_to_dir, HEAD_FILE), "r") as file:
             data = json.load(file)
             mod = Mod[data['mod']]
-            stg = Storage(mod, path_to_dir, timeserver)
-            stg.block_mesh = data['heads']
+            stg = Storage(mod, path_to_dir, timeserver, directory)
+            stg.block_mesh = {sys.intern(addr): stg.directory.intern(head) for addr, head in data['heads'].items()}
             if mod == Mod.Classic:
                 stg.queue = set([Block.loads(blocks) for blocks in data['queue']])
             else:
-                stg.queue = {Block.loads(blocks): data['queue'][blocks] for blocks in data['queue']}
+                stg.queue.loads(data['queue'], Block.loads)
+            # до проверки подписей (HMAC) участник подписывал транзакцию своим секретом:
+            # такие блоки очереди не пройдут проверку, модель надо дорабатывать прежней версией
+            if any(isinstance(sign, str) for block in stg.queue for sign in block.tx.signs):
+                raise RuntimeError(f"Could not load StgNode: {path_to_dir} queues blocks signed with "
+                                   f"the pre-HMAC scheme. Drain the queues with the previous version")
             stg.block_count = data['blocks']
+            stg.base = set(data.get('base', []))
+            stg.base_count = data.get('base_count', 0)
+            stg.arena = arena
             bc = stg.index_blocks()
-            if len(bc) != stg.block_count:
-                print(f"Storage broken! IndexBC: {len(bc)} != SelfBC :{stg.block_count}")
+            if len(bc) + stg.base_count != stg.block_count:
+                print(f"Storage broken! IndexBC: {len(bc)} + {stg.base_count} != SelfBC :{stg.block_count}")
             stg.available = data['available']
             stg.user_map = usr_map if usr_map else {}
+            for user in stg.user_map.values():
+                stg.directory.register(user)
             stg.stg_list = []
             if stg_list:
                 stg.stg_list = stg_list
@@ -113,6 +253,9 @@ class Storage:
         self.stg_list.extend(other_stg.stg_list)
         for stg in self.stg_list:
             stg.stg_list.append(self)
+        if self.directory is not other_stg.directory:
+            other_stg.directory.merge(self.directory)
+            self.directory = other_stg.directory
         self.refresh_blocks()
 
     def global_bm_participants(self):
@@ -131,7 +274,7 @@ class Storage:
         """
         :return: Количество блоков в очереди на добавление в блокмеш
         """
-        return len(self.queue) if self.mod == Mod.Classic else sum(self.queue.values())
+        return len(self.queue) if self.mod == Mod.Classic else self.queue.total
 
     def disable(self):
         """
@@ -163,13 +306,19 @@ class Storage:
         if other_stg is None or not other_index:
             raise Warning(f"INFO: Unable to refresh blocks ->"
                           f" no available stg: {self.stg_list}")
+        if self.base != other_stg.base:
+            # блокмеш сделал снимок - более старые блоки не догоняются, локальные удаляются как при снимке
+            self.base = set(other_stg.base)
+            self.base_count = other_stg.base_count
+            prune(self.path_to_dir, self_index - other_index - {GENESIS_BLOCK})
+            self_index &= other_index
         if self_index == other_index:
             return
         check_index = other_index.copy()
         other_index -= self_index
         for index in other_index:
             b = other_stg.load_block(index)
-            b.save(self.path_to_dir)
+            b.save(self.path_to_dir, self.writer, self.codec)
         self.block_mesh = other_stg.block_mesh.copy()
         self_index = self.index_blocks()
         if check_index != self_index:
@@ -177,11 +326,11 @@ class Storage:
             raise RuntimeError(f"Local blockmesh totally broken:\n"
                                f"Self  index: {self_index}\n"
                                f"Check index: {check_index}")
-        self.block_count = len(self_index)
+        self.block_count = len(self_index) + self.base_count
 
     def index_blocks(self):
         """
-        :return: set из хэшей всех блоков в блокмеше
+        :return: set из хэшей всех блоков в блокмеше (начиная со снимка)
         """
         index = {GENESIS_BLOCK}
         queue = list(set(self.block_mesh.values()))
@@ -189,13 +338,46 @@ class Storage:
             block_id = queue.pop(0)
             if block_id is None or block_id in index:
                 continue
+            if block_id in self.base:
+                index.add(block_id)
+                continue
             block = self.load_block(block_id)
             queue.extend(list(set(block.parents.values())))
             index.add(block_id)
         return index
 
+    def snapshot(self, archive: bool = True):
+        """
+        Снимок: текущие головы блокмеша становятся новой базой, более старые блоки удаляются
+        :param archive: перенести удаляемые блоки в поддиректорию archive
+        :return: количество удалённых блоков
+        """
+        index = self.index_blocks()
+        base = set(self.block_mesh.values()) - {GENESIS_BLOCK}
+        self.base_count = self.block_count - len(base | {GENESIS_BLOCK})
+        self.base = base
+        return prune(self.path_to_dir, index - base - {GENESIS_BLOCK}, archive)
+
     def load_block(self, block_id):
-        return Block.load(os.path.join(self.path_to_dir, block_id))
+        if self.writer is not None:
+            data = self.writer.read(os.path.join(self.path_to_dir, block_id))
+            if data is not None:
+                return Block.loads(data)
+        if self.arena is None:
+            return Block.load(os.path.join(self.path_to_dir, block_id))
+        view = self.arena.view(block_id)
+        if view is None:
+            with open(os.path.join(self.path_to_dir, block_id), "rb") as file:
+                data = file.read()
+            disk_count('reads')
+            self.arena.put(block_id, data)
+        else:
+            # разбор прямо из разделяемой памяти, без промежуточной копии bytes
+            try:
+                return Block.loads(view)
+            finally:
+                view.release()
+        return Block.loads(data)
 
     def add_new_block(self, block: Block):
         """
@@ -208,10 +390,13 @@ class Storage:
         if self.mod == Mod.Classic:
             self.queue.add(block)
         elif self.mod == Mod.Modified:
-            self.queue[block] = 1 if block not in self.queue else \
-                                self.queue[block] + 1
+            self.queue.add(block)
         else:
             raise RuntimeError("WTF - add new block")
+        if self.tracker is not None:
+            self.tracker.enqueue(block)
+        if self.accountant is not None:
+            self.accountant.count(self, accounting.SUBMIT, len(block.dumps()))
 
     def connect_user(self, user):
         """
@@ -220,6 +405,7 @@ class Storage:
         """
         if user.addr not in self.user_map:
             self.user_map[user.addr] = user
+            self.directory.register(user)
         if self.user_map[user.addr].head != user.head:
             raise RuntimeError(f"Usr HEAD: {self.user_map[user.addr].head} != new Usr HEAD: {user.head}")
         if user.addr not in self.block_mesh:
@@ -238,15 +424,49 @@ class Storage:
         if user.addr not in self.user_map:
             raise RuntimeError(f"WTF. {user.addr} not in user map")
         self.user_map.pop(user.addr)
+        self.directory.unregister(user)
+
+    def hand_over(self, addr: str, other):
+        """
+        Перенос блоков очереди участника на узел-хранилище, к которому он переведён: в Classic -
+        отправленных им блоков, в Modified - его подтверждений блоков с его участием
+        :param addr: адрес участника
+        :param other: новый узел-хранилище участника
+        :return: количество перенесённых блоков (подтверждений)
+        """
+        moved = 0
+        for block in list(self.queue):
+            if self.mod == Mod.Classic:
+                if block.sender() != addr:
+                    continue
+                self.queue.remove(block)
+                other.queue.add(block)
+            else:
+                if addr not in block.participants():
+                    continue
+                other.queue.add(block, 1, self.queue.take(block))
+            moved += 1
+        return moved
 
-    @staticmethod
-    def check_block(block: Block):
+    def check_block(self, block: Block):
         """
-        WTF должна быть проверка транзакции в блоке
+        Проверка подписей участников транзакции в блоке
         :param block: Block
         :return: Bool
         """
-        return True if block.approved is not False else False
+        if block.approved is False:
+            return False
+        return self.verifier.verify(block, self.directory)
+
+    def check_blocks(self, blocks):
+        """
+        Пакетная проверка блоков очереди
+        :param blocks: список Block
+        :return: {id(block): Bool}
+        """
+        checked = self.verifier.verify_many([b for b in blocks if b.approved is not False], self.directory)
+        checked = iter(checked)
+        return {id(b): next(checked) if b.approved is not False else False for b in blocks}
 
     def perform_step_1(self):
         """
@@ -289,49 +509,95 @@ class Storage:
         return [self.__request_user(user) for user in users]
 
     def __perform_step_1(self):
+        checked = self.check_blocks(self.queue)
         for block in self.queue.copy():
-            if self.check_block(block) is False:
+            if checked[id(block)] is False:
                 block.approved = False
-                self.user_map[block.sender()].receive_from_stg(block)
-                self.queue.pop(block)
+                if self.tracker is not None:
+                    self.tracker.reject(block)
+                self.__reject(block)
+                self.queue.remove(block)
                 continue
             block.approved = True
+            if self.tracker is not None:
+                self.tracker.approve(block)
             self.__block_sending(block)
 
     def __perform_step_1_mod(self):
         to_send = len(self.user_map)
-        for block, count in self.queue.items():
+        order = self.queue.order()
+        if self.in_flight is not None:
+            order = self.in_flight.filter(order)
+        checked = self.check_blocks([block for block, _ in order])
+        for block, count in order:
             if to_send == 0:
                 break
-            if self.check_block(block) is False:
+            if checked[id(block)] is False:
                 block.approved = False
-                self.user_map[block.sender()].receive_from_stg(block)
-                self.queue.pop(block)
+                if self.tracker is not None:
+                    self.tracker.reject(block)
+                self.__reject(block)
+                self.queue.remove(block, False)
                 continue
             block.approved = True
+            if self.tracker is not None:
+                self.tracker.approve(block)
+            if self.in_flight is not None:
+                self.in_flight.add(block)
             self.__block_sending(block, count)
             to_send -= 1
 
+    def __reject(self, block):
+        # блок отклоняет и узел-хранилище получателя: отправитель подключён к другому узлу
+        sender = self.directory.lookup(block.sender())
+        if sender is not None:
+            if self.accountant is not None:
+                self.accountant.count(self, accounting.NOTIFY, len(block.dumps()))
+            sender.receive_from_stg(block)
+
     def __block_sending(self, block, count=None):
+        if self.mod != Mod.Classic and self.mod != Mod.Modified:
+            raise RuntimeError("WTF - send block")
+        # в Modified один объект блока лежит в очередях нескольких узлов:
+        # внедрение меняет его родителей (и хэш), поэтому ключом служит копия
+        self.receive_shared(block if self.mod == Mod.Classic else block.copy(), count)
+        if self.overlay is not None:
+            self.overlay.spread(self, block, count)
+            return
+        for stg in self.stg_list:
+            if stg.available:
+                self.send_shared(stg, block.copy(), count)
+
+    def send_shared(self, peer, block, count=None):
+        """
+        Передача блока, разосланного на шаге 1, другому узлу-хранилищу (напрямую или через канал связи)
+        :param peer: узел-хранилище получатель
+        :param block: блок
+        :param count: количество подтверждений (Modified)
+        """
+        if self.accountant is not None:
+            self.accountant.count(self, accounting.BROADCAST, len(block.dumps()))
+        if self.link is None:
+            peer.receive_shared(block, count)
+        else:
+            self.link(self, peer, block, count)
+
+    def receive_shared(self, block, count=None):
+        """
+        Получение блока, разосланного на шаге 1
+        :param block: блок
+        :param count: количество подтверждений (Modified)
+        """
         if self.mod == Mod.Classic:
             self.shared_blocks.append(block)
-            for stg in self.stg_list:
-                if stg.available:
-                    stg.shared_blocks.append(block.copy())
         elif self.mod == Mod.Modified:
             # возможны ошибки
             if block in self.shared_blocks:
                 self.shared_blocks[block] += count
             else:
                 self.shared_blocks[block] = count
-            for stg in self.stg_list:
-                if stg.available:
-                    if block in stg.shared_blocks:
-                        stg.shared_blocks[block.copy()] += count
-                    else:
-                        stg.shared_blocks[block.copy()] = count
         else:
-            raise RuntimeError("WTF - send block")
+            raise RuntimeError("WTF - receive block")
 
     def __perform_step_2(self, i):
         if not self.shared_blocks:
@@ -356,44 +622,62 @@ class Storage:
             block = blocks.pop(0)
             count = self.shared_blocks.pop(block)
             if len(block.participants()) != count:
+                if self.tracker is not None:
+                    with self.lock:
+                        self.tracker.unconfirmed(block)
                 continue
             cblock = block.copy()
             if not self.__check_and_insert(block, participants, i):
                 continue
             if self.queue and cblock in self.queue:
-                self.queue.pop(cblock)
+                self.queue.remove(cblock)
 
     def __check_and_insert(self, block, participants, i):
         # проверка
         users = block.participants()
         for user in users:
             if user in participants:
+                if self.mod == Mod.Modified and block in self.queue:
+                    self.queue.defer(block)
+                if self.tracker is not None:
+                    with self.lock:
+                        self.tracker.defer(block)
                 return False
         participants.update(users)
         # внедрение в блокмеш
         block.set_parents({usr: self.block_mesh[usr] for usr in users})
         block.on_iter = i
-        fname = block.save(self.path_to_dir)
-        for user in users:
-            self.block_mesh[user] = fname
-            if user in self.user_map:
-                self.user_map[user].receive_from_stg(block)
-        self.block_count += 1
+        # запись файла блока узлы выполняют параллельно, справочник, арена и счётчики у них общие
+        fname = block.save(self.path_to_dir, self.writer, self.codec)
+        if self.arena is not None:
+            # в арене блок в том же виде, что и в файле (сжатый при включённом codec)
+            data = block.dumps().encode() if self.codec is None else self.codec.encode(block.dumps())
+        with self.lock:
+            fname = self.directory.intern(fname)
+            if self.arena is not None:
+                self.arena.put(fname, data)
+            size = len(block.dumps()) if self.accountant is not None else 0
+            for user in users:
+                self.block_mesh[user] = fname
+                if user in self.user_map:
+                    if self.accountant is not None:
+                        self.accountant.count(self, accounting.NOTIFY, size)
+                    self.user_map[user].receive_from_stg(block)
+            self.block_count += 1
+            if self.tracker is not None:
+                self.tracker.insert(block)
         return True
 
     def __request_user(self, user):
         if user in self.user_map:
             return self.user_map[user]
-        flag = False
+        found = self.directory.lookup(user)
+        if found is not None:
+            return found if found.stg.available else None
         for stg in self.stg_list:
             if not stg.available:
                 # print(f"INFO: {stg.path_to_dir} is unavailable cant request user")
-                flag = True
-                continue
-            if user in stg.user_map:
-                return stg.user_map[user]
-        if flag:
-            return None
+                return None
         raise RuntimeError(f"There is no such user: {user}")
 
 
@@ -401,6 +685,8 @@ class User:
     """
     Класс реализующий функционал узлов-участников blockmesh сети
     """
+    __slots__ = ('generation_allowed', 'mod', 'path_to_dir', 'addr', 'sign', 'stg', 'inited', 'head', 'block_count',
+                 'length', 'base', 'base_count', 'link', 'writer', 'codec')
 
     def __init__(self, mod: Mod, path_to_dir: str, addr: str, sign: str, stg: Storage = None, head: str = None):
         """
@@ -424,24 +710,36 @@ class User:
         self.inited = False
         self.head = head
         self.block_count = 0
+        self.length = 1  # размер index_blocks(): цепочка от головы до базы вместе с генезисом и базой
+        self.base = GENESIS_BLOCK  # голова снимка: обход цепочки останавливается на ней
+        self.base_count = 0        # количество блоков ниже снимка
+        self.link = None  # канал связи с узлами-хранилищами: link(user, stg, block)
+        self.writer = None  # store.BlockWriter - отложенная запись блоков
+        self.codec = None   # codec.BlockCodec - сжатие файлов блоков
         stg.connect_user(self)
 
-    def save(self):
+    def save(self, sync: bool = False):
         """
         Сохранить состояние узла в HEAD-файл
+        :param sync: синхронизировать файл с диском
         """
         if not self.inited or not self.head:
             raise RuntimeError(f"Unable to save {self.addr} UsrNode: "
                                f"not inited [{self.inited}] or has no head [{self.head}]")
-        with open(os.path.join(self.path_to_dir, HEAD_FILE), "w") as f:
-            json.dump({"head": self.head, "addr": self.addr, "sign": self.sign, "mod": self.mod.name}, f)
+        store.replace_file(os.path.join(self.path_to_dir, HEAD_FILE),
+                           json.dumps({"head": self.head, "addr": self.addr, "sign": self.sign, "mod": self.mod.name,
+                                       "base": self.base, "base_count": self.base_count, "length": self.length,
+                                       "digest": head_digest(self.addr, self.head, self.base, self.length,
+                                                             self.base_count)}), sync)
 
     @staticmethod
-    def load(path_to_dir, stg: Storage):
+    def load(path_to_dir, stg: Storage, walk: bool = False):
         """
-        Восстановление состояния узла-участника из файла
+        Восстановление состояния узла-участника из файла. Длина цепочки берётся из HEAD-файла,
+        если его контрольная сумма верна и блок головы на месте, иначе цепочка обходится
         :param path_to_dir: путь к дирректории
         :param stg: Узел-хранилище
+        :param walk: всегда обходить цепочку и сверять её с HEAD-файлом
         :return: UsrNode
         """
         path_to_dir = os.path.abspath(path_to_dir)
@@ -449,8 +747,24 @@ class User:
             raise RuntimeError(f"Could not load UsrNode: {path_to_dir} does not exist")
         with open(os.path.join(path_to_dir, HEAD_FILE), "r") as f:
             data = json.load(f)
-            node = User(Mod[data['mod']], path_to_dir, data['addr'], data['sign'], stg, data['head'])
-            node.block_count = len(node.index_blocks())
+            node = User(Mod[data['mod']], path_to_dir, sys.intern(data['addr']), data['sign'], stg,
+                        stg.directory.intern(data['head']))
+            node.base = data.get('base', GENESIS_BLOCK)
+            node.base_count = data.get('base_count', 0)
+            length = data.get('length')
+            if length is not None and \
+                    data.get('digest') != head_digest(node.addr, node.head, node.base, length, node.base_count):
+                length = None
+            if length is None or walk or \
+                    node.head not in (GENESIS_BLOCK, node.base) and not os.path.isfile(os.path.join(path_to_dir,
+                                                                                                node.head)):
+                walked = len(node.index_blocks())
+                if walk and length is not None and length != walked:
+                    raise RuntimeError(f"HEAD of {node.addr} does not match its chain: "
+                                       f"{length} blocks in HEAD, {walked} in chain")
+                length = walked
+            node.length = length
+            node.block_count = length + node.base_count
             return node
 
     def change_stg(self, new_stg: Storage):
@@ -466,35 +780,53 @@ class User:
 
     def sign_tx(self, tx: Transaction):
         """
-        Подписание транзакции
+        Подписание транзакции: HMAC дайджеста транзакции ключом участника
         :param tx: Транзакция
-        :return: хэш родительского блока
+        :return: подписанная транзакция
         """
         if not self.inited:
             raise RuntimeError("UsrNode not inited in his StgNode")
-        tx.sign(self.addr, self.sign)
-        return self.head
+        tx.sign(self.addr, signature.sign(self.sign, tx.digest()))
+        return tx
 
     def receive_from_stg(self, block: Block):
         """
         Продолжение второго этапа работы blockmesh - внедрение блока
         :param block: блок для внедрения в локальную цепочку
         """
+        if block.approved is False:
+            # отклонённый блок не внедряется, но отправитель в Modified снова может создавать транзакции
+            if self.mod == Mod.Modified and self.addr == block.sender():
+                self.generation_allowed = True
+            return
         if block.approved is True and self.check_chain(block):
-            self.head = block.save(self.path_to_dir)
+            self.head = self.stg.directory.intern(block.save(self.path_to_dir, self.writer, self.codec))
             if self.mod == Mod.Modified and self.addr == block.sender():
                 self.generation_allowed = True
             self.block_count += 1
+            self.length += 1
 
     def index_blocks(self):
-        index = {GENESIS_BLOCK}
+        index = {GENESIS_BLOCK, self.base}
         parent_hash = self.head
-        while parent_hash != GENESIS_BLOCK:
+        while parent_hash != GENESIS_BLOCK and parent_hash != self.base:
             index.add(parent_hash)
-            block = Block.load(os.path.join(self.path_to_dir, parent_hash))
+            block = Block.load(os.path.join(self.path_to_dir, parent_hash), self.writer)
             parent_hash = block.parents[self.addr]
         return index
 
+    def snapshot(self, archive: bool = True):
+        """
+        Снимок: текущая голова становится новой базой цепочки, более старые блоки удаляются
+        :param archive: перенести удаляемые блоки в поддиректорию archive
+        :return: количество удалённых блоков
+        """
+        index = self.index_blocks()
+        self.base_count += len(index) - len({GENESIS_BLOCK, self.head})
+        self.base = self.head
+        self.length = len({GENESIS_BLOCK, self.head})
+        return prune(self.path_to_dir, index - {GENESIS_BLOCK, self.head}, archive)
+
     def check_chain(self, block: Block):
         """
         Проверка локальной цепочки блокмеш
@@ -505,9 +837,9 @@ class User:
             raise RuntimeError(f"Check chain error:[ Block parent hash: {block.parents[self.addr]} "
                                f"!= Usr parent hash: {self.head} ]")
         parent_hash = self.head
-        while parent_hash != GENESIS_BLOCK:
+        while parent_hash != GENESIS_BLOCK and parent_hash != self.base:
             try:
-                read_block = Block.load(os.path.join(self.path_to_dir, parent_hash))
+                read_block = Block.load(os.path.join(self.path_to_dir, parent_hash), self.writer)
             except Exception as e:
                 # print("INFO:", e)
                 return False
@@ -534,26 +866,38 @@ class User:
             if res:
                 block, receivers = res
                 for receiver in receivers:
-                    receiver.stg.add_new_block(block)
+                    self.__submit(receiver.stg, block)
                 self.generation_allowed = False
 
     def __perform(self, recv_addr: list, data: dict = None):
         tx = self.__create_tx(recv_addr, data)
         receivers = self.stg.get_users(recv_addr)
+        accountant = self.stg.accountant
         for receiver in receivers:
             if receiver is None:
                 print(f"INFO: One of receivers potential unavailable: {recv_addr} -> {receivers}")
                 return None
+            request = len(tx.dumps()) if accountant is not None else 0
             receiver.sign_tx(tx)
+            if accountant is not None:
+                # запрос подписи и ответ с подписанной транзакцией
+                accountant.count(self.stg, accounting.SIGN, request + len(tx.dumps()), 2)
             if receiver.stg.available is False:
                 raise RuntimeError(f"{receiver.addr} is not available!")
         block = self.__create_block(tx)
-        self.stg.add_new_block(block)
+        self.__submit(self.stg, block)
         return block, receivers
 
+    def __submit(self, stg: Storage, block: Block):
+        if self.link is None:
+            stg.add_new_block(block)
+        else:
+            self.link(self, stg, block)
+
     def __create_tx(self, receivers: list, data: dict = None):
-        return Transaction(sender_addr=self.addr, sender_sign=self.sign,
-                           receivers=receivers, data=data if data else {})
+        tx = Transaction(sender_addr=self.addr, sender_sign=NOT_SIGNED,
+                         receivers=receivers, data=data if data else {})
+        return self.sign_tx(tx)
 
     def __create_block(self, tx: Transaction):
         if tx.sender != self.addr:
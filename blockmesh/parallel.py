@@ -0,0 +1,390 @@
+from blockmesh.block import DISK, Block
+from blockmesh.pending import PendingQueue
+import multiprocessing
+
+WRITER_COUNTERS = ('writes', 'coalesced', 'flushes', 'fsyncs', 'read_hits', 'read_misses')
+ARENA_COUNTERS = ('hits', 'misses', 'overflow')
+
+
+def counters(writer, arena):
+    """
+    Счётчики ввода-вывода процесса: шард возвращает их приращение вместе с изменениями состояния
+    :param writer: store.BlockWriter или None
+    :param arena: arena.BlockArena или None
+    :return: {имя: значение}
+    """
+    values = {f"disk_{k}": v for k, v in DISK.items()}
+    if writer is not None:
+        values.update({f"writer_{k}": getattr(writer, k) for k in WRITER_COUNTERS})
+    if arena is not None:
+        values.update({f"arena_{k}": getattr(arena, k) for k in ARENA_COUNTERS})
+    return values
+
+
+def build(txs, desc):
+    """
+    Блок по описанию (ShardedExecutor.describe) в процессе шарда
+    :param txs: {номер: транзакция}, известные шарду
+    :param desc: описание блока
+    :return: Block
+    """
+    seq, timestamp, parents, approved, on_iter = desc
+    block = Block(txs[seq], timestamp, dict(parents))
+    block.approved = approved
+    block.on_iter = on_iter
+    return block
+
+
+def user_state(user):
+    """
+    :return: состояние участника, которое меняет шаг 2: голова, блоки, длина цепочки, разрешение генерации
+    """
+    return user.head, user.block_count, user.length, user.generation_allowed
+
+
+class ShardedExecutor:
+    """
+    Многопроцессное выполнение шага 2: узлы-хранилища (и подключённые к ним участники)
+    разбиваются на шарды, у каждого шарда свой процесс на всё моделирование. Процесс получает
+    копию модели один раз при запуске, дальше по pipe передаются только изменения раунда:
+    в шард - новые транзакции (каждая один раз), описания разосланных блоков, изменения очередей
+    и участников, сделанные основным процессом;
+    из шарда - головы, длина блокмеша, внедрённые блоки очередей, состояние участников
+    и приращения счётчиков ввода-вывода (DISK, BlockWriter, BlockArena). Изменения применяются
+    в основном процессе, поэтому результат совпадает с однопроцессным моделированием.
+    Шаг 1 остаётся в основном процессе: рассылка пишет в буферы узлов всех шардов и уведомляет
+    отправителей отклонённых блоков на других узлах, а проверку подписей распараллеливает Verifier
+    """
+
+    def __init__(self, workers: int = None):
+        """
+        :param workers: количество процессов (None - по числу ядер)
+        """
+        if workers is not None and workers < 1:
+            raise ValueError(f"Workers must be > 0: {workers}")
+        self.workers = workers if workers else multiprocessing.cpu_count()
+        self.model = None
+        self.forks = 0
+        self.rounds = 0
+        self.procs = []
+        self.queues = {}   # индекс узла-хранилища -> {id(блок): [номер, блок, подтверждения]}, известные шарду
+        self.members = {}  # индекс узла-хранилища -> адреса участников, известные шарду
+        self.users = {}    # адрес -> состояние участника, известное шарду
+        self.txs = {}      # id(транзакция) -> [номер, транзакция] блоков в очередях, известные шардам
+        self.backlog = []  # по шардам: ещё не переданные [(номер, транзакция)] и [номер забытых]
+        self.seq = 0
+
+    def get_stat(self):
+        return {"Workers": self.workers,
+                "Forks": self.forks,
+                "ShardRounds": self.rounds}
+
+    def shards(self):
+        """
+        :return: списки индексов узлов-хранилищ по шардам
+        """
+        n = len(self.model.stgs)
+        return [list(range(k, n, self.workers)) for k in range(min(self.workers, n))]
+
+    def run(self, m):
+        """
+        Моделирование сценария модели m
+        :param m: model.Model
+        """
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise RuntimeError("Sharded execution requires 'fork' start method")
+        self.model = m
+        self.start()
+        try:
+            m.simulate(self.__iteration)
+        finally:
+            self.stop()
+
+    def start(self):
+        """
+        Запуск процессов шардов: известное им состояние совпадает с текущим
+        """
+        m = self.model
+        self.sync_txs()
+        for idx, stg in enumerate(m.stgs):
+            self.queues[idx] = {}
+            self.sync_queue(idx)
+            self.members[idx] = set(stg.user_map)
+            self.users.update({addr: user_state(u) for addr, u in stg.user_map.items()})
+        # потоки ввода-вывода не переживают fork - шард пишет сам,
+        # а ещё не записанные блоки основного процесса читает из снимка
+        writer = m.writer.fork() if m.writer is not None else None
+        ctx = multiprocessing.get_context('fork')
+        for shard in self.shards():
+            conn, child = ctx.Pipe()
+            proc = ctx.Process(target=self.worker, args=(child, shard, writer), daemon=True)
+            proc.start()
+            child.close()
+            self.procs.append((proc, conn, shard))
+            self.backlog.append(([], []))
+            self.forks += 1
+
+    def stop(self):
+        """
+        Завершение процессов шардов
+        """
+        for proc, conn, _ in self.procs:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+            conn.close()
+            proc.join()
+        self.procs = []
+        self.backlog = []
+
+    def __iteration(self, scenario):
+        m = self.model
+        m.usr_step(scenario)
+        rounds, duration, last = m.stg_rounds()
+        for _ in range(rounds):
+            m.trace_round(m.performed + 1)
+            for s in m.stgs:
+                s.perform_step_1()
+            self.step_2(m.performed + 1)
+            m.round_done()
+            m.model_time.tick(duration)
+        m.model_time.tick(last)
+
+    def sync_txs(self):
+        """
+        Транзакции блоков в очередях и рассылке: новые получают номер и ставятся в передачу шардам,
+        для покинувших очереди шарды получают номер, чтобы их забыть
+        """
+        live = {}
+        for stg in self.model.stgs:
+            live.update((id(block.tx), block.tx) for block in stg.queue)
+            live.update((id(block.tx), block.tx) for block in stg.shared_blocks)
+        for key in [key for key in self.txs if key not in live]:
+            seq = self.txs.pop(key)[0]
+            for _, gone in self.backlog:
+                gone.append(seq)
+        for key, tx in live.items():
+            if key not in self.txs:
+                self.seq += 1
+                self.txs[key] = [self.seq, tx]
+                for new, _ in self.backlog:
+                    new.append((self.seq, tx))
+
+    def describe(self, block):
+        """
+        :return: описание блока для шарда: номер транзакции и собственные поля блока
+        """
+        return self.txs[id(block.tx)][0], block.timestamp, block.parents, block.approved, block.on_iter
+
+    def sync_queue(self, idx):
+        """
+        Изменения очереди узла-хранилища с прошлой передачи шарду
+        :param idx: индекс узла-хранилища
+        :return: добавленные [(номер, описание блока, подтверждения, время поступления)], удалённые [номер],
+            изменённые [(номер, подтверждения)]
+        """
+        stg = self.model.stgs[idx]
+        known = self.queues[idx]
+        modified = isinstance(stg.queue, PendingQueue)
+        current = {id(block): block for block in stg.queue}
+        removed = [known.pop(key)[0] for key in [key for key in known if key not in current]]
+        added, recounted = [], []
+        for key, block in current.items():
+            count = stg.queue[block] if modified else None
+            if key not in known:
+                self.seq += 1
+                known[key] = [self.seq, block, count]
+                added.append((self.seq, self.describe(block), count, stg.queue.arrived[block] if modified else None))
+            elif known[key][2] != count:
+                known[key][2] = count
+                recounted.append((known[key][0], count))
+        return added, removed, recounted
+
+    def sync_users(self, idx):
+        """
+        Изменения участников узла-хранилища с прошлой передачи шарду (генерация, перераспределение)
+        :param idx: индекс узла-хранилища
+        :return: адреса участников (None - состав не менялся), [(адрес, состояние)]
+        """
+        stg = self.model.stgs[idx]
+        members = None
+        if set(stg.user_map) != self.members[idx]:
+            members = list(stg.user_map)
+            self.members[idx] = set(members)
+        users = []
+        for addr, u in stg.user_map.items():
+            state = user_state(u)
+            if members is not None or self.users.get(addr) != state:
+                self.users[addr] = state
+                users.append((addr, state))
+        return members, users
+
+    def step_2(self, i):
+        """
+        Шаг 2 для всех шардов параллельно
+        :param i: номер итерации
+        """
+        m = self.model
+        self.sync_txs()
+        sent = []
+        for (proc, conn, shard), (new, gone) in zip(self.procs, self.backlog):
+            if not any(m.stgs[idx].shared_blocks for idx in shard):
+                continue
+            changes = [(idx, self.describe_shared(m.stgs[idx]), *self.sync_queue(idx), *self.sync_users(idx))
+                       for idx in shard]
+            conn.send((i, m.model_time.time, new, gone, changes))
+            new.clear()
+            gone.clear()
+            for idx in shard:
+                m.stgs[idx].shared_blocks.clear()
+            sent.append((proc, conn, shard))
+        errors = []
+        for proc, conn, shard in sent:
+            try:
+                delta = conn.recv()
+            except EOFError:
+                delta = None
+            if isinstance(delta, BaseException) or delta is None:
+                errors.append(f"shard {shard}: {delta if delta is not None else f'exit code {proc.exitcode}'}")
+                continue
+            self.apply(*delta)
+        self.rounds += 1
+        if errors:
+            raise RuntimeError(f"Sharded step 2 failed: {'; '.join(errors)}")
+
+    def describe_shared(self, stg):
+        """
+        :return: описания блоков, разосланных узлу-хранилищу на шаге 1 (с подтверждениями в Modified)
+        """
+        if isinstance(stg.shared_blocks, dict):
+            return [(self.describe(block), count) for block, count in stg.shared_blocks.items()]
+        return [self.describe(block) for block in stg.shared_blocks]
+
+    def worker(self, conn, shard, writer=None):
+        """
+        Процесс шарда: по каждому сообщению основного процесса применяет изменения раунда,
+        выполняет шаг 2 и возвращает изменения состояния (None - завершение)
+        """
+        m = self.model
+        usrs = {u.addr: u for u in m.usrs}
+        queues = {idx: {seq: block for seq, block, _ in self.queues[idx].values()} for idx in shard}
+        txs = {seq: tx for seq, tx in self.txs.values()}
+        if writer is not None:
+            for idx in shard:
+                m.stgs[idx].writer = writer
+            for u in m.usrs:
+                u.writer = writer
+        arena = m.stgs[shard[0]].arena
+        try:
+            while True:
+                message = conn.recv()
+                if message is None:
+                    break
+                i, now, new, gone, changes = message
+                m.model_time.time = now
+                txs.update(new)
+                for seq in gone:
+                    txs.pop(seq)
+                before = counters(writer, arena)
+                delta = []
+                for idx, shared, added, removed, recounted, members, users in changes:
+                    stg = m.stgs[idx]
+                    self.receive(stg, queues[idx], txs, added, removed, recounted)
+                    if members is not None:
+                        for addr in members:
+                            if addr not in stg.user_map:
+                                user = usrs[addr]
+                                user.stg.user_map.pop(addr, None)
+                                user.stg = stg
+                                stg.user_map[addr] = user
+                        for addr in [addr for addr in stg.user_map if addr not in members]:
+                            stg.user_map.pop(addr)
+                    for addr, state in users:
+                        user = stg.user_map[addr]
+                        user.head, user.block_count, user.length, user.generation_allowed = state
+                    if isinstance(stg.shared_blocks, dict):
+                        stg.shared_blocks = {build(txs, desc): count for desc, count in shared}
+                    else:
+                        stg.shared_blocks = [build(txs, desc) for desc in shared]
+                    if not stg.available:
+                        continue
+                    heads = dict(stg.block_mesh)
+                    states = {addr: user_state(u) for addr, u in stg.user_map.items()}
+                    deferred = stg.queue.defer_stat() if isinstance(stg.queue, PendingQueue) else None
+                    stg.perform_step_2(i)
+                    left = {id(block) for block in stg.queue}
+                    drained = [seq for seq, block in queues[idx].items() if id(block) not in left]
+                    for seq in drained:
+                        queues[idx].pop(seq)
+                    delta.append((idx,
+                                  stg.block_count,
+                                  drained,
+                                  {addr: head for addr, head in stg.block_mesh.items() if heads.get(addr) != head},
+                                  [(addr, user_state(u)) for addr, u in stg.user_map.items()
+                                   if states[addr] != user_state(u)],
+                                  (deferred, stg.queue.defer_stat()) if deferred is not None else None))
+                if writer is not None:
+                    # основной процесс читает внедрённые блоки с диска: отложенные записи шарда сбрасываются в раунде
+                    writer.flush()
+                after = counters(writer, arena)
+                conn.send((delta, {k: v - before[k] for k, v in after.items() if v != before[k]}))
+        except BaseException as e:
+            conn.send(RuntimeError(repr(e)))
+        finally:
+            conn.close()
+
+    @staticmethod
+    def receive(stg, queue, txs, added, removed, recounted):
+        """
+        Изменения очереди узла-хранилища в процессе шарда (sync_queue)
+        :param stg: узел-хранилище
+        :param queue: {номер: блок} очереди шарда
+        :param txs: {номер: транзакция}, известные шарду
+        """
+        modified = isinstance(stg.queue, PendingQueue)
+        for seq in removed:
+            if modified:
+                stg.queue.remove(queue.pop(seq), False)
+            else:
+                stg.queue.discard(queue.pop(seq))
+        for seq, desc, count, arrived in added:
+            block = queue[seq] = build(txs, desc)
+            if modified:
+                stg.queue.add(block, count, arrived)
+            else:
+                stg.queue.add(block)
+        for seq, count in recounted:
+            stg.queue.add(queue[seq], count - stg.queue[queue[seq]])
+
+    def apply(self, delta, counted=None):
+        """
+        Применение изменений шарда к состоянию основного процесса
+        :param delta: изменения узлов-хранилищ и участников
+        :param counted: {имя: приращение} счётчиков ввода-вывода шарда (counters)
+        """
+        writer, arena = self.model.writer, self.model.stgs[0].arena
+        for name, value in (counted or {}).items():
+            kind, attr = name.split('_', 1)
+            if kind == 'disk':
+                DISK[attr] += value
+            elif kind == 'writer':
+                with writer.lock:
+                    setattr(writer, attr, getattr(writer, attr) + value)
+            else:
+                setattr(arena, attr, getattr(arena, attr) + value)
+        for idx, block_count, drained, heads, users, deferred in delta:
+            stg = self.model.stgs[idx]
+            known = self.queues[idx]
+            keys = {entry[0]: key for key, entry in known.items()}
+            for seq in drained:
+                stg.queue.remove(known.pop(keys[seq])[1])
+            if deferred is not None:
+                stg.queue.merge_defer(*deferred)
+            stg.block_mesh.update({addr: stg.directory.intern(head) for addr, head in heads.items()})
+            stg.block_count = block_count
+            for addr, state in users:
+                user = stg.user_map[addr]
+                user.head = stg.directory.intern(state[0])
+                user.block_count, user.length, user.generation_allowed = state[1:]
+                self.users[addr] = state
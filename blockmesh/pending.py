@@ -0,0 +1,204 @@
+INSERTION = 'insertion'
+OLDEST = 'oldest'
+CONFIRMATIONS = 'confirmations'
+POLICIES = (INSERTION, OLDEST, CONFIRMATIONS)
+
+
+class PendingQueue:
+    """
+    Очередь блоков узла-хранилища в режиме Modified: блок -> количество подтверждений.
+    Общее количество подтверждений поддерживается при изменениях, удаление безопасно
+    при обходе, порядок выборки задаётся политикой:
+    insertion - в порядке поступления; oldest - сначала более старые блоки;
+    confirmations - сначала блоки с наибольшим количеством подтверждений.
+    Отложения блоков очереди из-за конфликта участников на шаге 2 учитываются вместе с ожиданием
+    блока к моменту отложения
+    """
+    __slots__ = ('counts', 'arrived', 'total', 'policy', 'clock', 'drained', 'wait_sum', 'wait_max',
+                 'deferred', 'defer_wait_sum', 'defer_wait_max')
+
+    def __init__(self, clock=None, policy: str = INSERTION):
+        """
+        :param clock: источник модельного времени (ModelTime) для учёта ожидания
+        :param policy: политика выборки
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown drain policy: {policy}")
+        self.counts = {}
+        self.arrived = {}
+        self.total = 0
+        self.policy = policy
+        self.clock = clock
+        self.drained = 0
+        self.wait_sum = 0
+        self.wait_max = 0
+        self.deferred = 0
+        self.defer_wait_sum = 0
+        self.defer_wait_max = 0
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __contains__(self, block):
+        return block in self.counts
+
+    def __getitem__(self, block):
+        return self.counts[block]
+
+    def __iter__(self):
+        return iter(list(self.counts))
+
+    def items(self):
+        return list(self.counts.items())
+
+    def dumps(self):
+        """
+        :return: {сериализованный блок: [подтверждения, время поступления]} для HEAD-файла
+        """
+        return {block.dumps(): [count, self.arrived[block]] for block, count in self.counts.items()}
+
+    def loads(self, data: dict, loads):
+        """
+        Восстановление очереди из HEAD-файла
+        :param data: результат dumps (или {блок: подтверждения} из файлов прежнего формата)
+        :param loads: функция десериализации блока
+        """
+        for blocks, entry in data.items():
+            if isinstance(entry, int):
+                self.add(loads(blocks), entry)
+            else:
+                self.add(loads(blocks), entry[0], entry[1])
+
+    def now(self):
+        return self.clock.time if self.clock is not None else 0
+
+    def add(self, block, count: int = 1, arrived: int = None):
+        """
+        Добавление подтверждений блока
+        :param arrived: модельное время поступления (None - текущее; при восстановлении из файла)
+        """
+        if block in self.counts:
+            self.counts[block] += count
+        else:
+            self.counts[block] = count
+            self.arrived[block] = self.now() if arrived is None else arrived
+        self.total += count
+
+    def remove(self, block, drained: bool = True):
+        """
+        Удаление блока из очереди
+        :param block: блок
+        :param drained: блок внедрён в блокмеш (учитывается время ожидания)
+        :return: количество подтверждений блока
+        """
+        count = self.counts.pop(block)
+        arrived = self.arrived.pop(block)
+        self.total -= count
+        if drained:
+            wait = self.now() - arrived
+            self.drained += 1
+            self.wait_sum += wait
+            self.wait_max = max(self.wait_max, wait)
+        return count
+
+    pop = remove
+
+    def defer(self, block):
+        """
+        Отложение блока очереди на шаге 2 (конфликт участников)
+        """
+        wait = self.now() - self.arrived[block]
+        self.deferred += 1
+        self.defer_wait_sum += wait
+        self.defer_wait_max = max(self.defer_wait_max, wait)
+
+    def defer_stat(self):
+        return self.deferred, self.defer_wait_sum, self.defer_wait_max
+
+    def merge_defer(self, before, after):
+        """
+        Учёт отложений, выполненных копией очереди в другом процессе (parallel.ShardedExecutor)
+        :param before: defer_stat копии до шага 2
+        :param after: defer_stat копии после шага 2
+        """
+        self.deferred += after[0] - before[0]
+        self.defer_wait_sum += after[1] - before[1]
+        self.defer_wait_max = max(self.defer_wait_max, after[2])
+
+    def take(self, block, count: int = 1):
+        """
+        Изъятие подтверждений блока без внедрения (блок удаляется, когда подтверждений не осталось)
+        :return: время поступления блока
+        """
+        arrived = self.arrived[block]
+        if self.counts[block] <= count:
+            self.remove(block, False)
+        else:
+            self.counts[block] -= count
+            self.total -= count
+        return arrived
+
+    def order(self):
+        """
+        :return: [(блок, подтверждения)] в порядке выборки политики
+        """
+        entries = list(self.counts.items())
+        if self.policy == OLDEST:
+            entries.sort(key=lambda entry: entry[0].timestamp)
+        elif self.policy == CONFIRMATIONS:
+            entries.sort(key=lambda entry: -entry[1])
+        return entries
+
+    def get_stat(self):
+        return {"Drained": self.drained,
+                "WaitSum": self.wait_sum,
+                "MaxWait": self.wait_max,
+                "Deferred": self.deferred,
+                "DeferWaitSum": self.defer_wait_sum,
+                "MaxDeferWait": self.defer_wait_max}
+
+
+class InFlight:
+    """
+    Блоки, разосланные на шаге 1 в конвейерном режиме (ключ - дайджест транзакции, общий для копий
+    блока в очередях разных узлов). Шаг 1 раунда k+1 выполняется по очередям до шага 2 раунда k,
+    блоки раунда k в них ещё лежат и всеми узлами-хранилищами пропускаются
+    """
+    __slots__ = ('previous', 'current', 'rounds', 'overlapped', 'skipped')
+
+    def __init__(self):
+        self.previous = set()  # разосланы в предыдущем раунде
+        self.current = set()   # разосланы в текущем раунде
+        self.rounds = 0        # раунды конвейера
+        self.overlapped = 0    # раунды, шаг 1 которых выполнен до шага 2 предыдущего раунда
+        self.skipped = 0       # блоки предыдущего раунда, пропущенные шагом 1
+
+    def __contains__(self, block):
+        return block.tx.digest() in self.previous
+
+    def filter(self, order):
+        """
+        Блоки очереди без разосланных в предыдущем раунде
+        :param order: [(блок, подтверждения)] в порядке выборки
+        :return: отфильтрованный order
+        """
+        left = [(block, count) for block, count in order if block not in self]
+        self.skipped += len(order) - len(left)
+        return left
+
+    def add(self, block):
+        self.current.add(block.tx.digest())
+
+    def rotate(self):
+        """
+        Переход к следующему раунду
+        """
+        self.previous, self.current = self.current, set()
+
+    def clear(self):
+        self.previous, self.current = set(), set()
+
+    def get_stat(self):
+        return {"PipelineRounds": self.rounds,
+                "PipelineOverlapped": self.overlapped,
+                "InFlightSkipped": self.skipped}
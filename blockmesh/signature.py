@@ -0,0 +1,124 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from hashlib import sha256
+import threading
+import hmac
+import time
+
+CACHE_SIZE = 2 ** 16
+
+
+def sign(key: str, digest: str):
+    """
+    Подпись дайджеста транзакции ключом участника (HMAC-SHA256)
+    :param key: секретный ключ участника
+    :param digest: дайджест транзакции (Transaction.digest)
+    :return: подпись в hex
+    """
+    return hmac.new(key.encode('utf-8'), digest.encode('utf-8'), sha256).hexdigest()
+
+
+class Verifier:
+    """
+    Проверка подписей участников транзакций. Результаты проверки кэшируются по содержимому
+    транзакции (вместе с подписями), поэтому общий для модели Verifier проверяет каждый блок
+    один раз, а не на каждом узле-хранилище. Кэш ограничен cache_size записями, давно не
+    использованные результаты вытесняются
+    """
+
+    def __init__(self, workers: int = 0, cache_size: int = CACHE_SIZE):
+        """
+        :param workers: количество потоков пакетной проверки (0 - проверка в вызывающем потоке)
+        :param cache_size: наибольшее количество результатов в кэше
+        """
+        if workers < 0:
+            raise ValueError(f"Workers must be >= 0: {workers}")
+        if cache_size < 1:
+            raise ValueError(f"Cache size must be > 0: {cache_size}")
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="bm-verify") if workers else None
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()  # sha256 транзакции (32 байта): результат проверки, LRU
+        self.cache_size = cache_size
+        self.evictions = 0
+        self.verified = 0
+        self.rejected = 0
+        self.cache_hits = 0
+        self.signatures = 0
+        self.elapsed = 0.0
+
+    def get_stat(self):
+        return {"Verified": self.verified,
+                "Rejected": self.rejected,
+                "VerifyCacheHits": self.cache_hits,
+                "VerifyEvictions": self.evictions,
+                "Signatures": self.signatures,
+                "VerifyTime": round(self.elapsed, 4)}
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    @staticmethod
+    def check(tx, keys):
+        """
+        Проверка всех подписей транзакции без кэша
+        :param tx: Transaction
+        :param keys: справочник ключей участников (node.Directory)
+        :return: Bool
+        """
+        if not tx.is_ready():
+            return False
+        digest = tx.digest()
+        for addr, signature in zip(tx.addrs, tx.signs):
+            key = keys.key(addr)
+            # подписи хранятся байтами (block.pack_sign), иные значения заведомо неверны
+            if key is None or not isinstance(signature, bytes) or \
+                    not hmac.compare_digest(bytes.fromhex(sign(key, digest)), signature):
+                return False
+        return True
+
+    def verify(self, block, keys):
+        """
+        :param block: Block
+        :param keys: справочник ключей участников (node.Directory)
+        :return: Bool - все подписи транзакции блока верны
+        """
+        return self.verify_many([block], keys)[0]
+
+    def verify_many(self, blocks, keys):
+        """
+        Пакетная проверка блоков: непроверенные ранее транзакции проверяются пулом потоков
+        :param blocks: список Block
+        :param keys: справочник ключей участников (node.Directory)
+        :return: список Bool в порядке blocks
+        """
+        start = time.perf_counter()
+        ids = [sha256(block.tx.dumps().encode('utf-8')).digest() for block in blocks]
+        results = {}
+        todo = {}
+        with self.lock:
+            for tx_id, block in zip(ids, blocks):
+                if tx_id in self.cache:
+                    self.cache.move_to_end(tx_id)
+                    results[tx_id] = self.cache[tx_id]
+                    self.cache_hits += 1
+                elif tx_id not in todo:
+                    todo[tx_id] = block.tx
+        if self.executor is not None and len(todo) > 1:
+            checked = self.executor.map(lambda tx: self.check(tx, keys), todo.values())
+        else:
+            checked = [self.check(tx, keys) for tx in todo.values()]
+        checked = dict(zip(todo.keys(), checked))
+        with self.lock:
+            for tx_id, ok in checked.items():
+                self.cache[tx_id] = ok
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+                    self.evictions += 1
+                self.verified += 1
+                self.rejected += not ok
+                self.signatures += len(todo[tx_id].addrs)
+            results.update(checked)
+            self.elapsed += time.perf_counter() - start
+        return [results[tx_id] for tx_id in ids]
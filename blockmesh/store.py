@@ -0,0 +1,287 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+import blockmesh.block as block
+import threading
+import os
+
+NONE = 'none'
+PER_ITERATION = 'per-iteration'
+PER_BLOCK_FSYNC = 'per-block-fsync'
+DURABILITY = (NONE, PER_ITERATION, PER_BLOCK_FSYNC)
+
+TMP_SUFFIX = '.tmp'
+
+
+def write_file(path: str, data: str, sync: bool = False):
+    """
+    Запись файла (с fsync при sync)
+    :param data: str или bytes (сжатый блок)
+    """
+    with open(path, "w" if isinstance(data, str) else "wb") as out:
+        out.write(data)
+        if sync:
+            out.flush()
+            os.fsync(out.fileno())
+    block.disk_count('writes')
+
+
+def is_temp(name: str):
+    """
+    :return: имя временного файла replace_file (оставшегося после сбоя)
+    """
+    return name.endswith(TMP_SUFFIX)
+
+
+def replace_file(path: str, data, sync: bool = False):
+    """
+    Атомарная замена файла состояния: запись во временный файл и os.replace.
+    При sync временный файл и дирректория синхронизируются с диском
+    :param data: содержимое файла (str или bytes)
+    """
+    tmp = f"{path}{TMP_SUFFIX}"
+    with open(tmp, "wb" if isinstance(data, (bytes, bytearray)) else "w") as out:
+        out.write(data)
+        if sync:
+            out.flush()
+            os.fsync(out.fileno())
+    os.replace(tmp, path)
+    if sync:
+        sync_dir(os.path.dirname(path))
+
+
+def sync_dir(path: str):
+    """
+    fsync дирректории - фиксирует на диске создание файлов в ней
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class BlockWriter:
+    """
+    Отложенная запись файлов блоков.
+    none - записи копятся в памяти и сбрасываются в конце итерации без fsync;
+    per-iteration - сброс в конце итерации с fsync файлов и дирректорий;
+    per-block-fsync - каждый блок записывается сразу с fsync
+    """
+
+    def __init__(self, durability: str = NONE):
+        """
+        :param durability: режим надёжности записи
+        """
+        if durability not in DURABILITY:
+            raise ValueError(f"Unknown durability: {durability}")
+        self.durability = durability
+        self.pending = {}    # путь: данные
+        self.inherited = {}  # записи родительского процесса, ещё не попавшие на диск
+        self.writes = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.fsyncs = 0
+        self.read_hits = 0
+        self.read_misses = 0
+        self.lock = threading.Lock()  # шаг 2 узлов-хранилищ может выполняться в потоках (aio --threads)
+
+    def get_stat(self):
+        return {"Durability": self.durability,
+                "Writes": self.writes,
+                "Coalesced": self.coalesced,
+                "Flushes": self.flushes,
+                "Fsyncs": self.fsyncs,
+                "PendingHits": self.read_hits}
+
+    def batched(self):
+        return self.durability != PER_BLOCK_FSYNC
+
+    def write(self, path: str, data):
+        """
+        Запись файла блока
+        :param path: путь к файлу
+        :param data: содержимое
+        """
+        if not self.batched():
+            write_file(path, data, True)
+            sync_dir(os.path.dirname(path))
+            with self.lock:
+                self.writes += 1
+                self.fsyncs += 2
+            return
+        with self.lock:
+            self.writes += 1
+            if path in self.pending:
+                self.coalesced += 1
+            self.pending[path] = data
+
+    def read(self, path: str):
+        """
+        :param path: путь к файлу
+        :return: содержимое ещё не записанного файла или None
+        """
+        data = self.pending.get(path)
+        if data is None:
+            data = self.inherited.get(path)
+        if data is not None:
+            self.read_hits += 1
+        else:
+            self.read_misses += 1
+        return data
+
+    def fork(self):
+        """
+        Писатель для дочернего процесса: пишет сам и синхронно, а ещё не записанные
+        блоки родителя только читает
+        :return: BlockWriter
+        """
+        writer = BlockWriter(self.durability)
+        writer.inherited = self.snapshot()
+        return writer
+
+    def snapshot(self):
+        """
+        :return: все ещё не записанные на диск блоки
+        """
+        data = dict(self.inherited)
+        data.update(self.pending)
+        return data
+
+    def drain(self):
+        """
+        Ожидание фоновых записей (синхронному писателю ждать нечего)
+        """
+        pass
+
+    def close(self):
+        self.flush()
+
+    def flush(self):
+        """
+        Сброс накопленных записей на диск
+        """
+        if not self.pending:
+            return
+        sync = self.durability == PER_ITERATION
+        dirs = set()
+        for path, data in self.pending.items():
+            write_file(path, data, sync)
+            dirs.add(os.path.dirname(path))
+        if sync:
+            for path in dirs:
+                sync_dir(path)
+            self.fsyncs += len(self.pending) + len(dirs)
+        self.pending.clear()
+        self.flushes += 1
+
+
+class AsyncBlockWriter(BlockWriter):
+    """
+    Запись блоков пулом потоков ввода-вывода. Каждая запись возвращает Future,
+    при заполнении очереди пишущий поток ждёт (backpressure), flush дожидается всех записей
+    """
+
+    def __init__(self, durability: str = NONE, workers: int = 4, max_pending: int = 1024):
+        """
+        :param durability: режим надёжности записи
+        :param workers: количество потоков ввода-вывода
+        :param max_pending: максимальное количество незавершённых записей
+        """
+        super().__init__(durability)
+        if workers < 1 or max_pending < 1:
+            raise ValueError(f"Wrong I/O pool size: {workers} workers, {max_pending} pending")
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="bm-io")
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        self.futures = set()
+        self.dirs = set()
+        self.errors = []
+        self.stalls = 0
+
+    def get_stat(self):
+        stat = super().get_stat()
+        stat["Stalls"] = self.stalls
+        return stat
+
+    def write(self, path: str, data):
+        self.submit(path, data)
+
+    def submit(self, path: str, data):
+        """
+        Фоновая запись файла блока
+        :param path: путь к файлу
+        :param data: содержимое
+        :return: Future, результат - путь к файлу
+        """
+        if not self.slots.acquire(blocking=False):
+            self.stalls += 1
+            self.slots.acquire()
+        with self.lock:
+            self.writes += 1
+            if path in self.pending:
+                self.coalesced += 1
+            self.pending[path] = data
+            self.dirs.add(os.path.dirname(path))
+            future = self.executor.submit(self.__job, path, data)
+            self.futures.add(future)
+        future.add_done_callback(self.__done)
+        return future
+
+    def __job(self, path: str, data):
+        write_file(path, data, self.durability != NONE)
+        if self.durability == PER_BLOCK_FSYNC:
+            sync_dir(os.path.dirname(path))
+        return path, data
+
+    def __done(self, future):
+        self.slots.release()
+        with self.lock:
+            self.futures.discard(future)
+            if future.exception() is not None:
+                # блок остаётся доступным для чтения, ошибка поднимется в drain
+                self.errors.append(future.exception())
+                return
+            path, data = future.result()
+            if self.pending.get(path) is data:
+                self.pending.pop(path)
+            if self.durability != NONE:
+                self.fsyncs += 2 if self.durability == PER_BLOCK_FSYNC else 1
+
+    def read(self, path: str):
+        with self.lock:
+            return super().read(path)
+
+    def snapshot(self):
+        with self.lock:
+            return super().snapshot()
+
+    def drain(self):
+        """
+        Ожидание всех фоновых записей
+        """
+        while True:
+            with self.lock:
+                futures = list(self.futures)
+            if not futures:
+                break
+            wait(futures)
+        with self.lock:
+            errors, self.errors = self.errors, []
+        if errors:
+            raise RuntimeError(f"{len(errors)} block writes failed: {errors[0]}")
+
+    def flush(self):
+        """
+        Гарантирует, что все записи попали на диск
+        """
+        self.drain()
+        with self.lock:
+            dirs, self.dirs = self.dirs, set()
+        if self.durability == PER_ITERATION:
+            for path in dirs:
+                sync_dir(path)
+            self.fsyncs += len(dirs)
+        self.flushes += 1
+
+    def close(self):
+        self.flush()
+        self.executor.shutdown()
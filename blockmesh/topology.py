@@ -0,0 +1,178 @@
+from enum import Enum
+import networkx as nx
+import random
+
+
+class Topology(Enum):
+    """
+    Топологии оверлейной сети узлов-хранилищ
+    """
+    Full = 1
+    Ring = 2
+    Regular = 3
+    Hierarchical = 4
+
+
+def ring_edges(n: int, degree: int):
+    """
+    Кольцо: каждый узел связан с degree // 2 соседями с каждой стороны
+    """
+    half = max(1, degree // 2)
+    edges = set()
+    for i in range(n):
+        for j in range(1, half + 1):
+            k = (i + j) % n
+            if k != i:
+                edges.add((min(i, k), max(i, k)))
+    return edges
+
+
+def regular_edges(n: int, degree: int, seed: int):
+    """
+    Случайный связный k-регулярный граф (при degree >= n - 1 - полный граф)
+    """
+    if degree >= n - 1:
+        return {(i, j) for i in range(n) for j in range(i + 1, n)}
+    if (n * degree) % 2:
+        raise ValueError(f"Unable to build {degree}-regular graph on {n} nodes: n * degree must be even")
+    for attempt in range(100):
+        g = nx.random_regular_graph(degree, n, seed=seed + attempt)
+        if nx.is_connected(g):
+            return {(min(a, b), max(a, b)) for a, b in g.edges()}
+    raise RuntimeError(f"Unable to build connected {degree}-regular graph on {n} nodes")
+
+
+def hierarchical_edges(n: int, degree: int):
+    """
+    Иерархия: кластеры по degree узлов (полный граф внутри кластера),
+    первые узлы кластеров образуют полный граф верхнего уровня
+    """
+    size = max(2, degree)
+    edges = set()
+    heads = []
+    for start in range(0, n, size):
+        members = list(range(start, min(start + size, n)))
+        heads.append(members[0])
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                edges.add((a, b))
+    for i, a in enumerate(heads):
+        for b in heads[i + 1:]:
+            edges.add((a, b))
+    return edges
+
+
+class Overlay:
+    """
+    Разреженная оверлейная сеть узлов-хранилищ с многошаговым (gossip) распространением блоков
+    """
+
+    def __init__(self, kind: Topology = Topology.Full, degree: int = 2, fanout: int = None, seed: int = 0):
+        """
+        :param kind: топология
+        :param degree: степень узла (Ring, Regular) или размер кластера (Hierarchical)
+        :param fanout: количество соседей, которым узел пересылает блок за один шаг (None - всем)
+        :param seed: зерно генератора случайных чисел
+        """
+        if degree < 1:
+            raise ValueError(f"Degree must be > 0: {degree}")
+        if fanout is not None and fanout < 1:
+            raise ValueError(f"Fanout must be > 0: {fanout}")
+        self.kind = kind
+        self.degree = degree
+        self.fanout = fanout
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.hops = 0         # максимальное число шагов распространения блока
+        self.messages = 0     # количество отправленных сообщений
+        self.redundant = 0    # сообщения, полученные повторно
+        self.unreached = 0    # доставок, не достигших доступного узла
+        self.peak_fanout = 0  # наибольшее количество сообщений одного узла за шаг распространения
+
+    def dumps(self):
+        return {'kind': self.kind.name, 'degree': self.degree, 'fanout': self.fanout, 'seed': self.seed,
+                'stat': [self.hops, self.messages, self.redundant, self.unreached, self.peak_fanout]}
+
+    @staticmethod
+    def loads(data):
+        if not data:
+            return None
+        overlay = Overlay(Topology[data['kind']], data['degree'], data['fanout'], data['seed'])
+        stat = data.get('stat', []) + [0] * 5
+        overlay.hops, overlay.messages, overlay.redundant, overlay.unreached, overlay.peak_fanout = stat[:5]
+        return overlay
+
+    def get_stat(self):
+        return {"Topology": self.kind.name,
+                "Hops": self.hops,
+                "Messages": self.messages,
+                "Redundant": self.redundant,
+                "Unreached": self.unreached,
+                "PeakFanout": self.peak_fanout}
+
+    def build(self, stgs: list):
+        """
+        Построение списков соседей узлов-хранилищ
+        :param stgs: список узлов-хранилищ
+        """
+        n = len(stgs)
+        if self.kind == Topology.Full:
+            edges = {(i, j) for i in range(n) for j in range(i + 1, n)}
+        elif self.kind == Topology.Ring:
+            edges = ring_edges(n, self.degree)
+        elif self.kind == Topology.Regular:
+            edges = regular_edges(n, self.degree, self.seed)
+        elif self.kind == Topology.Hierarchical:
+            edges = hierarchical_edges(n, self.degree)
+        else:
+            raise ValueError(f"Unknown topology: {self.kind}")
+        for stg in stgs:
+            stg.peers = []
+            stg.overlay = self
+        for a, b in sorted(edges):
+            stgs[a].peers.append(stgs[b])
+            stgs[b].peers.append(stgs[a])
+
+    def spread(self, origin, block, count=None):
+        """
+        Многошаговое распространение блока от узла-хранилища по оверлейной сети.
+        За один шаг каждый узел, получивший блок, пересылает его не более чем fanout соседям,
+        которым ещё не отправлял, поэтому в связной сети блок доходит до всех доступных узлов
+        :param origin: узел-хранилище источник
+        :param block: блок
+        :param count: количество подтверждений (Modified)
+        :return: количество шагов распространения
+        """
+        total = sum(1 for stg in origin.stg_list if stg.available)
+        reached = {origin}
+        active = {origin: self.__targets(origin)}
+        hops = 0
+        step = 0
+        while active and len(reached) <= total:
+            step += 1
+            informed = []
+            for stg, targets in active.items():
+                sending = targets[:self.fanout] if self.fanout is not None else targets[:]
+                del targets[:len(sending)]
+                self.peak_fanout = max(self.peak_fanout, len(sending))
+                for peer in sending:
+                    self.messages += 1
+                    if peer in reached:
+                        self.redundant += 1
+                        continue
+                    reached.add(peer)
+                    stg.send_shared(peer, block.copy(), count)
+                    informed.append(peer)
+            if informed:
+                hops = step
+            active = {stg: targets for stg, targets in active.items() if targets}
+            active.update({stg: self.__targets(stg) for stg in informed})
+        self.hops = max(self.hops, hops)
+        self.unreached += total + 1 - len(reached)
+        return hops
+
+    def __targets(self, stg):
+        targets = [peer for peer in stg.peers if peer.available]
+        if self.fanout is not None:
+            self.rng.shuffle(targets)
+        return targets
@@ -0,0 +1,204 @@
+from shutil import rmtree
+import blockmesh.model as model
+import blockmesh.store as store
+import blockmesh.topology as topology
+import blockmesh.node as node
+import tempfile
+import struct
+import json
+import time
+
+MAGIC = b'BMTR\x01'
+
+PERFORM = 1  # участник создал транзакцию: отправитель, получатели
+ROUND = 2    # раунд консенсуса: шаг 1 и шаг 2 всех узлов-хранилищ, номер итерации
+ITER = 3     # конец итерации: количество выполненных итераций
+END = 4      # конец записи: итоговые головы и статистика
+
+RECORD = struct.Struct('<BqI')  # вид события, модельное время, аргумент
+COUNT = struct.Struct('<H')
+SIZE = struct.Struct('<I')
+
+
+class TraceWriter:
+    """
+    Запись трассы моделирования в компактный двоичный файл: каждый вызов User.perform
+    (через Model.usr_perform), границы раундов узлов-хранилищ и итераций с модельным временем.
+    Трасса воспроизводится на новой модели (replay) без сценария, CSV результатов и задержек движка
+    """
+
+    def __init__(self, path: str, m):
+        """
+        :param path: путь к файлу трассы
+        :param m: model.Model в исходном состоянии (после init)
+        """
+        if m.performed != 0:
+            raise RuntimeError("Trace recording requires a freshly initialised model")
+        self.path = path
+        self.events = 0
+        self.file = open(path, "wb")
+        header = json.dumps({"mod": m.mod.name,
+                             "num": [m.stg_num, m.usr_num],
+                             "dur": m.duration,
+                             "ts": m.model_time.dumps(),
+                             "net": m.overlay.dumps() if m.overlay else None,
+                             "policy": m.stgs[0].queue.policy if m.mod == node.Mod.Modified else None}).encode()
+        self.file.write(MAGIC + SIZE.pack(len(header)) + header)
+
+    def get_stat(self):
+        return {"TraceEvents": self.events}
+
+    def perform(self, t: int, sender: int, receivers: list):
+        self.events += 1
+        self.file.write(RECORD.pack(PERFORM, t, sender) + COUNT.pack(len(receivers)) +
+                        struct.pack(f'<{len(receivers)}I', *receivers))
+
+    def round(self, t: int, i: int):
+        self.events += 1
+        self.file.write(RECORD.pack(ROUND, t, i))
+
+    def iteration(self, t: int, performed: int):
+        self.events += 1
+        self.file.write(RECORD.pack(ITER, t, performed))
+
+    def close(self, m=None):
+        """
+        Завершение записи
+        :param m: model.Model - итоговое состояние сохраняется для сравнения при воспроизведении
+        """
+        if self.file is None:
+            return
+        if m is not None:
+            footer = json.dumps(summary(m)).encode()
+            self.file.write(RECORD.pack(END, m.model_time.time, len(footer)) + footer)
+        self.file.close()
+        self.file = None
+
+
+def summary(m):
+    """
+    :return: итоговые головы узлов-хранилищ и статистика модели для сравнения трасс
+    """
+    stat = m.get_stat()
+    stat.update(m.get_queue_stat())
+    return {"heads": [s.block_mesh for s in m.stgs], "stat": stat}
+
+
+def read(path: str):
+    """
+    Чтение трассы
+    :param path: путь к файлу трассы
+    :return: (заголовок, список событий (вид, время, аргумент, получатели), итог или None)
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"Not a blockmesh trace: {path}")
+    offset = len(MAGIC)
+    size, = SIZE.unpack_from(data, offset)
+    offset += SIZE.size
+    header = json.loads(data[offset:offset + size])
+    offset += size
+    events = []
+    footer = None
+    while offset < len(data):
+        kind, t, arg = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        receivers = None
+        if kind == PERFORM:
+            n, = COUNT.unpack_from(data, offset)
+            offset += COUNT.size
+            receivers = list(struct.unpack_from(f'<{n}I', data, offset))
+            offset += 4 * n
+        elif kind == END:
+            footer = json.loads(data[offset:offset + arg])
+            offset += arg
+            continue
+        elif kind not in (ROUND, ITER):
+            raise ValueError(f"Unknown trace event {kind} at offset {offset - RECORD.size}")
+        events.append((kind, t, arg, receivers))
+    return header, events, footer
+
+
+def diff(expected: dict, actual: dict):
+    """
+    :return: список расхождений итогов двух прогонов
+    """
+    result = []
+    for i, (heads_1, heads_2) in enumerate(zip(expected["heads"], actual["heads"])):
+        for addr in sorted(set(heads_1) | set(heads_2)):
+            if heads_1.get(addr) != heads_2.get(addr):
+                result.append(f"stg {i} head of {addr}: {heads_1.get(addr)} != {heads_2.get(addr)}")
+    for k in expected["stat"]:
+        if k in actual["stat"] and json.loads(json.dumps(actual["stat"][k])) != expected["stat"][k]:
+            result.append(f"{k}: {expected['stat'][k]} != {actual['stat'][k]}")
+    return result
+
+
+class Replay:
+    """
+    Воспроизведение трассы на новой модели с максимальной скоростью. В режиме memory блоки
+    не записываются на диск, а читаются из буфера BlockWriter
+    """
+
+    def __init__(self, path: str, path_to_dir: str = None, memory: bool = False):
+        """
+        :param path: путь к файлу трассы
+        :param path_to_dir: дирректория новой модели (None - временная, удаляется после воспроизведения)
+        :param memory: не сбрасывать блоки на диск
+        """
+        self.header, self.events, self.footer = read(path)
+        self.path_to_dir = path_to_dir
+        self.memory = memory
+        self.wall = 0.0
+        self.model = None
+
+    def get_stat(self):
+        return {"Events": len(self.events),
+                "ReplayWall": round(self.wall, 4),
+                "Events/s": round(len(self.events) / self.wall, 1) if self.wall else 0}
+
+    def run(self):
+        """
+        :return: список расхождений с итогом записанного прогона (пустой, если итог не записан)
+        """
+        h = self.header
+        tmp = None
+        if self.path_to_dir is None:
+            tmp = self.path_to_dir = tempfile.mkdtemp(prefix="bm-replay-")
+        try:
+            m = model.Model(node.Mod[h["mod"]], self.path_to_dir, h["num"][0], h["num"][1],
+                            h["dur"][0], h["dur"][1], topology.Overlay.loads(h["net"]))
+            m.init(model.ModelTime.loads(h["ts"]))
+            # как bm.py init + run: счётчики узлов после загрузки совпадают с записанным прогоном
+            m.save()
+            m = model.Model.load(self.path_to_dir)
+            m.use_writer(store.BlockWriter())
+            if h["policy"]:
+                m.use_queue_policy(h["policy"])
+            self.model = m
+            start = time.perf_counter()
+            self.execute(m)
+            self.wall = time.perf_counter() - start
+            if tmp is None:
+                m.save()
+            return diff(self.footer, summary(m)) if self.footer else []
+        finally:
+            if tmp is not None:
+                rmtree(tmp, ignore_errors=True)
+
+    def execute(self, m):
+        clock = m.model_time
+        for kind, t, arg, receivers in self.events:
+            clock.advance(t)
+            if kind == PERFORM:
+                m.usr_perform(arg, receivers)
+            elif kind == ROUND:
+                for s in m.stgs:
+                    s.perform_step_1()
+                for s in m.stgs:
+                    s.perform_step_2(arg)
+            elif kind == ITER:
+                m.performed = arg
+                if not self.memory:
+                    m.writer.flush()
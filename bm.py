@@ -1,5 +1,28 @@
+import blockmesh.engine as engine
+import blockmesh.aio as aio
+import blockmesh.arena as arena
+import blockmesh.parallel as parallel
+import blockmesh.store as store
+import blockmesh.signature as signature
+import blockmesh.integrity as integrity
+import blockmesh.codec as codec
+import blockmesh.index as index
+import blockmesh.memory as memory
+import blockmesh.metrics as metrics
+import blockmesh.pending as pending
+import blockmesh.trace as trace
+import blockmesh.analytics as analytics
+import blockmesh.lifecycle as lifecycle
+import blockmesh.generator as generator
+import blockmesh.balancer as balancer
+import blockmesh.accounting as accounting
+import blockmesh.block as block
 import blockmesh.model as model
+import blockmesh.topology as topology
 import argparse
+import json
+import time
+import sys
 import os
 
 
@@ -7,24 +30,42 @@ def bm_status(args):
     """Обработка ветви: bm.py status"""
     path = os.path.join(os.getcwd(), args.dir)
     m = None
+    info = None
     try:
         print("Processing...")
-        m = model.Model.load(path)
+        if not (args.deep or args.walk or args.plot or args.graph):
+            info = model.Model.read_manifest(path)
+        if info is None:
+            m = model.Model.load(path, walk=args.walk)
+            info = m.manifest()
     except NotADirectoryError:
         print(f"Error: There is no such directory: {path}")
     except FileNotFoundError:
         print(f"Error: There is no blockmesh model in {path}. You have to create new.")
-    if m:
+    if info:
         print(f"Info:\n"
-              f"Mod:\t\t{m.mod.name}\n"
-              f"Stg number:\t{m.stg_num}\n"
-              f"Usr number:\t{m.usr_num}")
-        stat = m.get_stat()
+              f"Mod:\t\t{info['mod']}\n"
+              f"Stg number:\t{info['num'][0]}\n"
+              f"Usr number:\t{info['num'][1]}")
+        stat = info['stat']
         for k in stat:
             print(f"{k}:\t{stat[k]}")
-        print(f"Duration 1:\t{m.duration[0]}\n"
-              f"Duration 2:\t{m.duration[1]}\n"
-              f"Sync blocks:\t{m.get_sync_count()}")
+        print(f"Duration 1:\t{info['dur'][0]}\n"
+              f"Duration 2:\t{info['dur'][1]}\n"
+              f"Sync blocks:\t{info['sync']}")
+        net = info['net']
+        for k in net:
+            print(f"{k}:\t{net[k]}")
+        # сводки, сохранённые до учёта сообщений в MANIFEST, - по MESSAGES.csv
+        messages = info['messages'] if 'messages' in info else accounting.summary(path)
+        if messages:
+            for kind, (n, size) in messages['kinds'].items():
+                print(f"{kind} messages:\t{n}\t({size} bytes)")
+            for i, (n, size) in enumerate(messages['storages']):
+                print(f"Stg {i} messages:\t{n}\t({size} bytes)")
+            total = sum(n for n, _ in messages['storages'])
+            print(f"Messages/iter:\t{round(total / messages['iterations'], 2) if messages['iterations'] else 0}")
+    if m:
         if args.plot:
             m.draw_plot()
         if args.graph:
@@ -36,7 +77,10 @@ def bm_init(args):
     path = os.path.join(os.getcwd(), args.dir)
     try:
         print("Initialisation of new blockmesh model...")
-        m = model.Model(model.node.Mod[args.MOD], path, args.N_STG, args.N_USR, args.DUR_1, args.DUR_2)
+        overlay = None
+        if args.topology != topology.Topology.Full.name or args.fanout is not None:
+            overlay = topology.Overlay(topology.Topology[args.topology], args.degree, args.fanout, args.seed)
+        m = model.Model(model.node.Mod[args.MOD], path, args.N_STG, args.N_USR, args.DUR_1, args.DUR_2, overlay)
         m.init()
         m.save()
         print(f"Success!")
@@ -44,14 +88,119 @@ def bm_init(args):
         print(f"Error: {e}")
 
 
+def bm_generate(args):
+    """Обработка ветви: bm.py generate"""
+    path = os.path.join(os.getcwd(), args.dir)
+    try:
+        print("Generation of synthetic blockmesh model...")
+        dur_1 = args.dur_1 if args.dur_1 else args.N_USR
+        gen = generator.Generator(model.node.Mod[args.MOD], path, args.N_STG, args.N_USR, args.BLOCKS,
+                                  dur_1, args.dur_2 if args.dur_2 else dur_1, args.receivers, args.seed, args.workers, args.batch)
+        gen.run()
+        stat = gen.get_stat()
+        if args.check:
+            print("Checking model...")
+            start = time.perf_counter()
+            gen.check()
+            stat["CheckWall"] = round(time.perf_counter() - start, 3)
+        for k in stat:
+            print(f"{k}:\t{stat[k]}")
+        print("Success!")
+    except Exception as e:
+        print(f"Error: {e}")
+
+
 def bm_run(args):
     """Обработка ветви: bm.py run"""
     path = os.path.join(os.getcwd(), args.dir)
+    block_arena = None
+    if args.mem_report:
+        memory.start()
     try:
+        if args.arena:
+            arena.BlockArena.cleanup(path)
+            block_arena = arena.BlockArena.create(args.arena * 2 ** 20, max(1024, args.arena * 2 ** 12))
+            block_arena.register(path)
         print("Loading model...")
-        m = model.Model.load(path)
+        m = model.Model.load(path, block_arena, args.walk)
+        if args.io_threads:
+            m.use_writer(store.AsyncBlockWriter(args.durability, args.io_threads, args.io_queue))
+        else:
+            m.use_writer(store.BlockWriter(args.durability))
+        m.use_verifier(signature.Verifier(args.verify_workers))
+        m.use_queue_policy(args.queue_policy)
+        if args.metrics_file or args.metrics_jsonl:
+            m.use_metrics(metrics.Metrics(args.metrics_file, args.metrics_jsonl, args.metrics_interval))
+        if args.record:
+            if args.engine == "event":
+                raise RuntimeError("Trace recording is not supported by the event engine")
+            m.use_recorder(trace.TraceWriter(os.path.join(os.getcwd(), args.record), m))
+        if args.pipeline:
+            if args.engine != "tick" or args.record:
+                raise RuntimeError("Pipelined rounds are supported by the tick engine without trace recording")
+            m.use_pipeline()
+        if args.balance:
+            if args.record:
+                raise RuntimeError("User rebalancing is not recorded to traces")
+            m.use_balancer(balancer.Balancer(args.balance, args.balance_threshold))
+        if args.lifecycle:
+            if args.engine == "sharded":
+                raise RuntimeError("Block lifecycle tracking is not supported by the sharded engine")
+            m.use_tracker(lifecycle.Lifecycle(m.model_time, m.stgs))
+        if args.messages:
+            if args.engine == "sharded":
+                raise RuntimeError("Message accounting is not supported by the sharded engine")
+            m.use_accountant(accounting.Accountant(m.path, m.stgs))
         print("Running model...")
-        m.run()
+        ev = None
+        if args.engine == "event":
+            links = {}
+            for link in args.links:
+                idx, spec = link.split("=", 1)
+                links[int(idx)] = engine.Latency.parse(spec, args.seed + int(idx) + 1)
+            ev = engine.EventEngine(engine.Latency.parse(args.latency, args.seed), links)
+        elif args.engine == "async":
+            ev = aio.AsyncRuntime(args.delay, args.bandwidth, args.threads)
+        elif args.engine == "sharded":
+            ev = parallel.ShardedExecutor(args.workers)
+        start = time.perf_counter()
+        try:
+            m.run(ev)
+            if m.recorder:
+                m.recorder.close(m)
+        finally:
+            if m.recorder:
+                m.recorder.close()
+            m.writer.close()
+            m.verifier.close()
+            if m.metrics:
+                m.metrics.close()
+            if m.accountant:
+                m.accountant.close()
+        stat = ev.get_stat() if ev else {}
+        stat["RunWall"] = round(time.perf_counter() - start, 3)
+        stat["Pipeline"] = m.pipeline is not None
+        if m.pipeline:
+            stat.update(m.pipeline.get_stat())
+        stat.update(m.writer.get_stat())
+        stat.update(m.verifier.get_stat())
+        stat.update(m.get_queue_stat())
+        if m.recorder:
+            stat.update(m.recorder.get_stat())
+        if m.balancer:
+            stat.update(m.balancer.get_stat())
+        if m.accountant:
+            stat.update(m.accountant.get_stat())
+        if m.tracker:
+            m.tracker.save(m.path, m.mod.name)
+            stat.update(m.tracker.get_stat())
+        if args.mem_report:
+            for k, v in memory.report().items():
+                stat[f"Mem {k}"] = f"{v / 2 ** 20:.2f} MiB"
+        if block_arena:
+            stat.update(block_arena.get_stat())
+        for k in stat:
+            print(f"{k}:\t{stat[k]}")
         print(f"Saving...")
         m.save()
         if args.plot:
@@ -61,16 +210,217 @@ def bm_run(args):
         print("Success!")
     except Exception as e:
         print(f"Error: {e}")
+    finally:
+        if block_arena:
+            block_arena.close()
+            arena.BlockArena.cleanup(path)
+
+
+def bm_verify(args):
+    """Обработка ветви: bm.py verify"""
+    path = os.path.join(os.getcwd(), args.dir)
+    if not os.path.isfile(os.path.join(path, model.MODEL_F)):
+        print(f"Error: There is no blockmesh model in {path}")
+        sys.exit(2)
+    print("Verifying...")
+    checker = integrity.IntegrityChecker(path, args.threads, args.incremental)
+    problems = checker.run()
+    for p in problems:
+        print(f"Corrupt {p.kind}:\t{p.path}: {p.detail}")
+    stat = checker.get_stat()
+    for k in stat:
+        print(f"{k}:\t{stat[k]}")
+    if problems:
+        sys.exit(1)
+    print("Success!")
+
+
+def load_rate(stg):
+    """
+    :return: скорость чтения блоков узла-хранилища через load_block, блоков/с
+    """
+    index = stg.index_blocks() - {block.GENESIS_BLOCK}
+    start = time.perf_counter()
+    for block_id in index:
+        stg.load_block(block_id)
+    return round(len(index) / (time.perf_counter() - start), 1) if index else 0
+
+
+def bm_compress(args):
+    """Обработка ветви: bm.py compress"""
+    path = os.path.join(os.getcwd(), args.dir)
+    try:
+        print("Loading model...")
+        m = model.Model.load(path)
+        files = m.block_files()
+        rate = load_rate(m.stgs[0])
+        if args.off:
+            block_codec = None
+        else:
+            print("Training dictionary...")
+            samples = []
+            for file in files[:args.samples]:
+                with open(file, "rb") as f:
+                    samples.append(codec.decode(f.read()))
+            block_codec = codec.BlockCodec.train(samples, args.dict_size, args.level)
+            # словарь под своим id: при сбое перезаписи блоки читаются старым или новым словарём
+            block_codec.save(path, current=False)
+        print("Rewriting blocks...")
+        before, after = codec.recode(files, block_codec)
+        if block_codec is not None:
+            block_codec.save(path)
+        codec.prune(path, block_codec)
+        m.use_codec(block_codec)
+        print(f"Blocks:\t{len(files)}\n"
+              f"Bytes before:\t{before}\n"
+              f"Bytes after:\t{after}\n"
+              f"Ratio:\t{round(before / after, 2) if after else 0}\n"
+              f"LoadBlock/s before:\t{rate}\n"
+              f"LoadBlock/s after:\t{load_rate(m.stgs[0])}")
+        print("Success!")
+    except Exception as e:
+        print(f"Error: {e}")
+
+
+def bm_snapshot(args):
+    """Обработка ветви: bm.py snapshot"""
+    path = os.path.join(os.getcwd(), args.dir)
+    try:
+        print("Loading model...")
+        m = model.Model.load(path)
+        print("Snapshot...")
+        pruned = m.snapshot(not args.delete)
+        for k in pruned:
+            print(f"Pruned {k}:\t{pruned[k]}")
+        print(f"Base heads:\t{len(m.stgs[0].base)}\n"
+              f"Below base:\t{m.stgs[0].base_count}")
+        print("Success!")
+    except Exception as e:
+        print(f"Error: {e}")
+
+
+def bm_replay(args):
+    """Обработка ветви: bm.py replay"""
+    try:
+        print("Replaying...")
+        replay = trace.Replay(os.path.join(os.getcwd(), args.TRACE),
+                              os.path.join(os.getcwd(), args.dir) if args.dir else None, args.memory)
+        diffs = replay.run()
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(2)
+    stat = replay.get_stat()
+    stat.update(replay.model.writer.get_stat())
+    for k in stat:
+        print(f"{k}:\t{stat[k]}")
+    if replay.footer is None:
+        print("Trace has no recorded result to compare with")
+        return
+    for d in diffs:
+        print(f"Diff:\t{d}")
+    if diffs:
+        sys.exit(1)
+    print("Heads and stats match the recorded run")
+
+
+def bm_report(args):
+    """Обработка ветви: bm.py report"""
+    try:
+        reports = [analytics.Analytics(os.path.join(os.getcwd(), d), args.storage).report() for d in args.dirs or [""]]
+    except FileNotFoundError as e:
+        print(f"Error: There is no blockmesh model or results: {e.filename}")
+        sys.exit(2)
+    out = open(args.output, "w", newline='') if args.output else sys.stdout
+    try:
+        if args.format == "csv":
+            analytics.write_csv(reports, out)
+        else:
+            json.dump(reports, out, indent=2)
+            out.write("\n")
+    finally:
+        if args.output:
+            out.close()
+
+
+def print_rows(rows, keys):
+    """
+    Вывод списка записей таблицей с колонками keys
+    """
+    print("\t".join(keys))
+    for row in rows:
+        print("\t".join(str(row[k]) for k in keys))
+
+
+def bm_query(args):
+    """Обработка ветви: bm.py query"""
+    path = os.path.join(os.getcwd(), args.dir)
+    try:
+        idx = index.BlockIndex(path, args.storage)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(2)
+    try:
+        added = idx.update(args.rebuild)
+        if added and not args.json:
+            print(f"Indexed {added} new blocks")
+        if args.op == "block":
+            result = idx.block(args.HASH)
+        elif args.op == "chain":
+            first, last = None, None
+            if args.range:
+                first, _, last = args.range.partition(":")
+                first, last = int(first) if first else None, int(last) if last else None
+            result = idx.chain(args.ADDR, first, last)
+        elif args.op == "ancestors":
+            if args.contains:
+                result = {"id": idx.resolve(args.HASH), "ancestor": idx.resolve(args.contains),
+                          "is_ancestor": idx.is_ancestor(args.contains, args.HASH)}
+            else:
+                result = idx.ancestors(args.HASH, args.limit)
+        else:
+            result = {"blocks": [idx.resolve(args.HASH_1), idx.resolve(args.HASH_2)],
+                      "common_ancestor": idx.common_ancestor(args.HASH_1, args.HASH_2)}
+    except (ValueError, RuntimeError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        idx.close()
+    if args.json:
+        print(json.dumps(result, indent=2))
+    elif args.op == "chain":
+        print_rows(result, ["seq", "id", "timestamp", "iter", "sender"])
+    elif args.op == "ancestors" and not args.contains:
+        print_rows(result, ["pos", "id"])
+    else:
+        for k in result:
+            print(f"{k}:\t{result[k]}")
 
 
 def parse_args():
     """
     Парсер командной строки. \n
     Использование: \n
-    bm.py [-h] {status,init,run} ... \n
-    bm.py status [-h] [-d dir] [-P] [-G] \n
-    bm.py init [-h] [-d dir] {Classic, Modified} N_STG N_USR DUR_1 DUR_2 \n
-    bm.py run [-h] [-d dir] [-P] [-G] \n
+    bm.py [-h] {status,init,generate,run,verify,compress,snapshot,query,replay,report} ... \n
+    bm.py status [-h] [-d dir] [-P] [-G] [-W] [--deep] \n
+    bm.py init [-h] [-d dir] [-T topology] [-k degree] [-f fanout] [-s seed] {Classic, Modified} N_STG N_USR DUR_1 DUR_2 \n
+    bm.py generate [-h] [-d dir] [-r receivers] [-s seed] [-w workers] [--batch N] [--dur-1 D] [--dur-2 D] [--check]
+    {Classic, Modified} N_STG N_USR BLOCKS \n
+    bm.py run [-h] [-d dir] [-P] [-G] [-W] [-E {tick,event,async,sharded}] [-L latency] [--link IDX=latency] [-s seed]
+    [--delay sec] [--bandwidth bps] [--threads] [-w workers] [-A MB]
+    [-D {none,per-iteration,per-block-fsync}] [--io-threads N] [--io-queue N]
+    [--verify-workers N] [--mem-report] [--metrics-file path] [--metrics-jsonl path] [--metrics-interval sec]
+    [-Q {insertion,oldest,confirmations}] [--record trace] [--lifecycle] [--pipeline]
+    [--balance budget] [--balance-threshold ratio] [--messages] \n
+    bm.py verify [-h] [-d dir] [-t threads] [-i] \n
+    bm.py compress [-h] [-d dir] [--dict-size bytes] [--samples N] [--level L] [--off] \n
+    bm.py snapshot [-h] [-d dir] [--delete] \n
+    bm.py query [-h] [-d dir] [-s storage] [--rebuild] [--json] {block,chain,ancestors,common-ancestor} ... \n
+    bm.py query block HASH \n
+    bm.py query chain [--range A:B] ADDR \n
+    bm.py query ancestors [-n limit] [--contains HASH] HASH \n
+    bm.py query common-ancestor HASH_1 HASH_2 \n
+    bm.py replay [-h] [-d dir] [--memory] TRACE \n
+    bm.py report [-h] [-d dir]... [-s storage] [-F {json,csv}] [-o path] \n
     :return: Распаршенные аргументы командной строки
     """
     parser = argparse.ArgumentParser(description="Command line handle for blockmesh model")
@@ -82,12 +432,23 @@ def parse_args():
                                help="Path to directory containing blockmesh model")
     parser_status.add_argument("-P", "--plot", dest="plot", action='store_true', help="Draw plot")
     parser_status.add_argument("-G", "--graph", dest="graph", action='store_true', help="Draw graph")
+    parser_status.add_argument("-W", "--walk-chains", dest="walk", action='store_true',
+                               help="Walk user chains on load and check them against user HEAD files")
+    parser_status.add_argument("--deep", dest="deep", action='store_true',
+                               help="Load the whole model instead of reading its manifest")
     parser_status.set_defaults(func=bm_status)
 
     # init branch
     parser_init = sub_parser.add_parser("init", help="Initialisation of new blockmesh model")
     parser_init.add_argument("-d", "--dir", dest="dir", metavar="dir", type=str, default="",
                              help="Path to directory containing blockmesh model")
+    parser_init.add_argument("-T", "--topology", dest="topology", choices=[t.name for t in topology.Topology],
+                             default=topology.Topology.Full.name, help="Overlay topology of storage-nodes")
+    parser_init.add_argument("-k", "--degree", dest="degree", type=int, default=2,
+                             help="Node degree (Ring, Regular) or cluster size (Hierarchical)")
+    parser_init.add_argument("-f", "--fanout", dest="fanout", type=int, default=None,
+                             help="Number of peers a block is forwarded to on each gossip hop")
+    parser_init.add_argument("-s", "--seed", dest="seed", type=int, default=0, help="Random seed of overlay")
     parser_init.add_argument("MOD", choices=['Classic', 'Modified'], type=str, help="Mod of blockmesh model")
     parser_init.add_argument("N_STG", type=int, help="Number of storage-nodes. Must be > 0")
     parser_init.add_argument("N_USR", type=int, help="Number of user-nodes. Must be >= N_STG")
@@ -95,14 +456,174 @@ def parse_args():
     parser_init.add_argument("DUR_2", type=int, help="Duration of 2st step")
     parser_init.set_defaults(func=bm_init)
 
+    # generate branch
+    parser_generate = sub_parser.add_parser("generate", help="Write a large synthetic blockmesh model without simulation")
+    parser_generate.add_argument("-d", "--dir", dest="dir", metavar="dir", type=str, default="",
+                                 help="Path to directory for the new blockmesh model")
+    parser_generate.add_argument("-r", "--receivers", dest="receivers", type=int, default=1,
+                                 help="Number of receivers of each transaction")
+    parser_generate.add_argument("-s", "--seed", dest="seed", type=int, default=0, help="Random seed of transactions")
+    parser_generate.add_argument("-w", "--workers", dest="workers", type=int, default=None,
+                                 help="Number of writing processes (default: number of CPUs)")
+    parser_generate.add_argument("--batch", dest="batch", metavar="N", type=int, default=generator.BATCH,
+                                 help="Number of blocks written by one task")
+    parser_generate.add_argument("--dur-1", dest="dur_1", metavar="D", type=int, default=None,
+                                 help="Duration of 1st step for later runs (default: N_USR)")
+    parser_generate.add_argument("--dur-2", dest="dur_2", metavar="D", type=int, default=None,
+                                 help="Duration of 2st step for later runs (default: duration of 1st step)")
+    parser_generate.add_argument("--check", dest="check", action='store_true',
+                                 help="Load the generated model with chain walks and write its manifest")
+    parser_generate.add_argument("MOD", choices=['Classic', 'Modified'], type=str, help="Mod of blockmesh model")
+    parser_generate.add_argument("N_STG", type=int, help="Number of storage-nodes. Must be > 0")
+    parser_generate.add_argument("N_USR", type=int, help="Number of user-nodes. Must be > receivers")
+    parser_generate.add_argument("BLOCKS", type=int, help="Number of blocks in blockmesh")
+    parser_generate.set_defaults(func=bm_generate)
+
     # run branch
     parser_run = sub_parser.add_parser("run", help="Run blockmesh simulation")
     parser_run.add_argument("-d", "--dir", dest="dir", metavar="dir", type=str, default="",
                             help="Path to directory containing blockmesh model")
     parser_run.add_argument("-P", "--plot", dest="plot", action='store_true', help="Draw plot")
     parser_run.add_argument("-G", "--graph", dest="graph", action='store_true', help="Draw graph")
+    parser_run.add_argument("-W", "--walk-chains", dest="walk", action='store_true',
+                            help="Walk user chains on load and check them against user HEAD files")
+    parser_run.add_argument("-E", "--engine", dest="engine", choices=["tick", "event", "async", "sharded"],
+                            default="tick", help="Simulation engine: fixed tick stepping, discrete-event, "
+                                                 "asyncio storage tasks or multi-process storage shards")
+    parser_run.add_argument("-L", "--latency", dest="latency", type=str, default="const:0",
+                            help="Default user->storage latency (event engine): const:A, uniform:A:B, exp:MEAN")
+    parser_run.add_argument("--link", dest="links", metavar="IDX=latency", action="append", default=[],
+                            help="Latency of links to storage IDX (event engine)")
+    parser_run.add_argument("-s", "--seed", dest="seed", type=int, default=0, help="Random seed of latencies")
+    parser_run.add_argument("--delay", dest="delay", type=float, default=0.0,
+                            help="Channel delay in seconds (async engine)")
+    parser_run.add_argument("--bandwidth", dest="bandwidth", type=float, default=None,
+                            help="Channel bandwidth in bytes per second (async engine)")
+    parser_run.add_argument("--threads", dest="threads", action='store_true',
+                            help="Overlap block writes of storages in threads (async engine)")
+    parser_run.add_argument("-w", "--workers", dest="workers", type=int, default=None,
+                            help="Number of worker processes (sharded engine)")
+    parser_run.add_argument("-A", "--arena", dest="arena", metavar="MB", type=int, default=0,
+                            help="Share encoded blocks between storages and worker processes "
+                                 "through a shared-memory arena of MB megabytes")
+    parser_run.add_argument("-D", "--durability", dest="durability", choices=store.DURABILITY, default=store.NONE,
+                            help="Block writes: buffered per iteration without fsync, buffered per iteration "
+                                 "with fsync and checkpoint, or fsync of every block")
+    parser_run.add_argument("--io-threads", dest="io_threads", metavar="N", type=int, default=0,
+                            help="Write blocks in background by a pool of N I/O threads")
+    parser_run.add_argument("--io-queue", dest="io_queue", metavar="N", type=int, default=1024,
+                            help="Max number of unfinished background writes before writers wait")
+    parser_run.add_argument("--verify-workers", dest="verify_workers", metavar="N", type=int, default=0,
+                            help="Verify transaction signatures in batches by a pool of N threads")
+    parser_run.add_argument("--mem-report", dest="mem_report", action='store_true',
+                            help="Print memory usage per subsystem (tracemalloc)")
+    parser_run.add_argument("-Q", "--queue-policy", dest="queue_policy", choices=pending.POLICIES,
+                            default=pending.INSERTION,
+                            help="Order in which Modified storages drain their queues: by arrival, oldest blocks "
+                                 "first or most confirmed blocks first")
+    parser_run.add_argument("--metrics-file", dest="metrics_file", metavar="path", type=str, default=None,
+                            help="Periodically rewrite live metrics to a Prometheus text-format file")
+    parser_run.add_argument("--metrics-jsonl", dest="metrics_jsonl", metavar="path", type=str, default=None,
+                            help="Append live metrics of every iteration as JSON lines")
+    parser_run.add_argument("--metrics-interval", dest="metrics_interval", metavar="sec", type=float, default=1.0,
+                            help="Minimal interval between rewrites of the metrics file")
+    parser_run.add_argument("--record", dest="record", metavar="trace", type=str, default=None,
+                            help="Record user transactions and storage rounds to a binary trace file")
+    parser_run.add_argument("--lifecycle", dest="lifecycle", action='store_true',
+                            help="Track blocks from creation to insertion and write latency histograms "
+                                 f"to {lifecycle.LIFECYCLE_F}")
+    parser_run.add_argument("--pipeline", dest="pipeline", action='store_true',
+                            help="Run step 1 of the next consensus round against the queues before step 2 of the "
+                                 "current one, starting a round every two time units (Modified, tick engine)")
+    parser_run.add_argument("--messages", dest="messages", action='store_true',
+                            help="Count protocol messages and their serialised bytes per storage and iteration "
+                                 f"in {accounting.MESSAGES_F}")
+    parser_run.add_argument("--balance", dest="balance", metavar="budget", type=int, default=None,
+                            help="Move at most budget users per iteration from storages with long queues")
+    parser_run.add_argument("--balance-threshold", dest="balance_threshold", metavar="ratio", type=float,
+                            default=balancer.THRESHOLD,
+                            help="Ratio of the largest queue per user to the mean that starts rebalancing")
     parser_run.set_defaults(func=bm_run)
 
+    # verify branch
+    parser_verify = sub_parser.add_parser("verify", help="Check integrity of stored blocks and heads")
+    parser_verify.add_argument("-d", "--dir", dest="dir", metavar="dir", type=str, default="",
+                               help="Path to directory containing blockmesh model")
+    parser_verify.add_argument("-t", "--threads", dest="threads", type=int, default=None,
+                               help="Number of hashing threads")
+    parser_verify.add_argument("-i", "--incremental", dest="incremental", action='store_true',
+                               help="Re-hash only blocks added since the last successful verification")
+    parser_verify.set_defaults(func=bm_verify)
+
+    # compress branch
+    parser_compress = sub_parser.add_parser("compress", help="Store block files compressed with a shared dictionary")
+    parser_compress.add_argument("-d", "--dir", dest="dir", metavar="dir", type=str, default="",
+                                 help="Path to directory containing blockmesh model")
+    parser_compress.add_argument("--dict-size", dest="dict_size", metavar="bytes", type=int, default=codec.MAX_DICT,
+                                 help="Size of the preset dictionary (at most 32 KiB)")
+    parser_compress.add_argument("--samples", dest="samples", metavar="N", type=int, default=512,
+                                 help="Number of block files to train the dictionary on")
+    parser_compress.add_argument("--level", dest="level", metavar="L", type=int, default=9,
+                                 help="zlib compression level")
+    parser_compress.add_argument("--off", dest="off", action='store_true',
+                                 help="Decompress all block files and disable compression")
+    parser_compress.set_defaults(func=bm_compress)
+
+    # snapshot branch
+    parser_snapshot = sub_parser.add_parser("snapshot", help="Make current heads the new base and prune older blocks")
+    parser_snapshot.add_argument("-d", "--dir", dest="dir", metavar="dir", type=str, default="",
+                                 help="Path to directory containing blockmesh model")
+    parser_snapshot.add_argument("--delete", dest="delete", action='store_true',
+                                 help="Delete pruned blocks instead of moving them to archive directories")
+    parser_snapshot.set_defaults(func=bm_snapshot)
+
+    # query branch
+    parser_query = sub_parser.add_parser("query", help="Query blocks, user chains and ancestry by a persistent index")
+    parser_query.add_argument("-d", "--dir", dest="dir", metavar="dir", type=str, default="",
+                              help="Path to directory containing blockmesh model")
+    parser_query.add_argument("-s", "--storage", dest="storage", type=int, default=0,
+                              help="Index of the storage-node whose blocks are indexed")
+    parser_query.add_argument("--rebuild", dest="rebuild", action='store_true', help="Rebuild the index from scratch")
+    parser_query.add_argument("--json", dest="json", action='store_true', help="Print result as JSON")
+    query_parser = parser_query.add_subparsers(dest="op", required=True, help="Query operations")
+    query_block = query_parser.add_parser("block", help="Header, parents and children of a block")
+    query_block.add_argument("HASH", type=str, help="Block hash or its unique prefix")
+    query_chain = query_parser.add_parser("chain", help="Chain of blocks of a user-node")
+    query_chain.add_argument("ADDR", type=str, help="Address of user-node")
+    query_chain.add_argument("--range", dest="range", metavar="A:B", type=str, default=None,
+                             help="Positions of the first and the last block in the chain (from 1)")
+    query_ancestors = query_parser.add_parser("ancestors", help="Ancestors of a block")
+    query_ancestors.add_argument("HASH", type=str, help="Block hash or its unique prefix")
+    query_ancestors.add_argument("-n", "--limit", dest="limit", type=int, default=None,
+                                 help="Max number of ancestors, nearest first")
+    query_ancestors.add_argument("--contains", dest="contains", metavar="HASH", type=str, default=None,
+                                 help="Only check whether the given block is an ancestor")
+    query_common = query_parser.add_parser("common-ancestor", help="Nearest common ancestor of two blocks")
+    query_common.add_argument("HASH_1", type=str, help="Block hash or its unique prefix")
+    query_common.add_argument("HASH_2", type=str, help="Block hash or its unique prefix")
+    parser_query.set_defaults(func=bm_query)
+
+    # replay branch
+    parser_replay = sub_parser.add_parser("replay", help="Re-execute a recorded trace on a fresh model and compare")
+    parser_replay.add_argument("-d", "--dir", dest="dir", metavar="dir", type=str, default="",
+                               help="Directory for the replayed model (temporary directory if omitted)")
+    parser_replay.add_argument("--memory", dest="memory", action='store_true',
+                               help="Keep blocks in memory instead of writing them to disk")
+    parser_replay.add_argument("TRACE", type=str, help="Path to trace file recorded by run --record")
+    parser_replay.set_defaults(func=bm_replay)
+
+    # report branch
+    parser_report = sub_parser.add_parser("report", help="Throughput, queue depth, forks and convergence of runs")
+    parser_report.add_argument("-d", "--dir", dest="dirs", metavar="dir", type=str, action="append", default=None,
+                               help="Path to directory containing blockmesh model (repeat to compare models)")
+    parser_report.add_argument("-s", "--storage", dest="storage", type=int, default=0,
+                               help="Index of the storage-node whose blocks are analysed")
+    parser_report.add_argument("-F", "--format", dest="format", choices=["json", "csv"], default="json",
+                               help="Output format: full JSON report or one CSV row of summary values per model")
+    parser_report.add_argument("-o", "--output", dest="output", metavar="path", type=str, default=None,
+                               help="Write report to file instead of standard output")
+    parser_report.set_defaults(func=bm_report)
+
     return parser.parse_args()
 
 
@@ -0,0 +1,48 @@
+from blockmesh.node import Mod
+from blockmesh.model import Model
+from blockmesh.accounting import Accountant, summary, KINDS
+from test_engine import prepare
+
+
+def test_accounting(mod):
+    plain = prepare(mod, "test_plain_", 3, 6)
+    plain.run()
+    m = prepare(mod, "test_accounting_", 3, 6)
+    m.use_accountant(Accountant(m.path, m.stgs))
+    m.run()
+    m.accountant.close()
+    # учёт не меняет моделирование
+    assert [s.block_mesh for s in m.stgs] == [s.block_mesh for s in plain.stgs]
+    assert m.performed == plain.performed
+    blocks = 6 * 5
+    stat = m.accountant.get_stat()
+    # один получатель: запрос подписи и ответ на каждую транзакцию
+    assert stat["SignMsgs"] == 2 * blocks
+    # в Modified блок передаётся и в очередь узла-хранилища получателя
+    assert stat["SubmitMsgs"] == blocks * (1 if mod == Mod.Classic else 2)
+    assert stat["BroadcastMsgs"] % (3 - 1) == 0 and stat["BroadcastMsgs"] >= blocks * (3 - 1)
+    assert stat["NotifyMsgs"] == 2 * blocks
+    result = summary(m.path)
+    assert result["iterations"] == m.performed and len(result["storages"]) == 3
+    assert [result["kinds"][kind][0] for kind in KINDS] == [stat[f"{kind}Msgs"] for kind in KINDS]
+    assert sum(size for _, size in result["storages"]) == stat["MsgBytes"]
+    assert summary(plain.path) is None
+    # итоги в сводке модели (bm.py status) совпадают с MESSAGES.csv и накапливаются между запусками
+    m.save()
+    assert Model.read_manifest(m.path)["messages"] == result
+    loaded = Model.load(m.path)
+    assert loaded.manifest()["messages"] == result
+    loaded.use_accountant(Accountant(loaded.path, loaded.stgs))
+    loaded.usr_perform(0, [1])
+    loaded.run()
+    loaded.accountant.close()
+    loaded.save()
+    result = summary(m.path)
+    assert result["iterations"] > m.performed
+    assert Model.read_manifest(m.path)["messages"] == result
+    assert Model.load(m.path).manifest()["messages"] == result
+
+
+if __name__ == '__main__':
+    test_accounting(Mod.Classic)
+    test_accounting(Mod.Modified)
@@ -0,0 +1,30 @@
+import io
+import csv
+from blockmesh.node import Mod
+from blockmesh.analytics import Analytics, write_csv
+from test_engine import prepare
+
+
+def test_report(mod):
+    m = prepare(mod, "test_report_", 3, 5)
+    m.run()
+    m.save()
+    a = Analytics(m.path)
+    report = a.report()
+    assert report["mod"] == mod.name and report["iterations"] == m.performed
+    assert report["blocks"] == m.stgs[0].block_count and report["sync_heads"] == m.get_sync_count()
+    assert round(sum(t["sent"] for t in report["throughput"].values()) * m.performed) == m.stgs[0].block_count - 1
+    assert 0 < report["convergence"] <= m.performed
+    fs = report["fork_sync"]
+    assert fs["forks"] + fs["syncs"] == m.stgs[0].block_count - 1
+    depth = report["queue_depth"]
+    assert len(depth["p50"]) == m.performed + 1 and depth["overall"]["max"] == max(depth["max"])
+    out = io.StringIO()
+    write_csv([report, report], out)
+    rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+    assert len(rows) == 2 and int(rows[0]["blocks"]) == report["blocks"]
+
+
+if __name__ == '__main__':
+    test_report(Mod.Classic)
+    test_report(Mod.Modified)
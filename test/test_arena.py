@@ -0,0 +1,86 @@
+import os
+import sys
+import subprocess
+import multiprocessing
+from multiprocessing import shared_memory
+from blockmesh.arena import BlockArena
+from blockmesh.node import Mod
+from blockmesh.model import Model
+from blockmesh.codec import BlockCodec, is_compressed
+from test_engine import prepare
+
+HASH = "ab" * 32
+
+
+def crashed_reader(name, conn):
+    arena = BlockArena.attach(name)
+    conn.send(bytes(arena.view(HASH)))
+    os._exit(1)
+
+
+def test_arena():
+    arena = BlockArena.create(1024, 16)
+    assert arena.put(HASH, b'{"block": 1}') and arena.put(HASH, b'{"block": 1}')
+    assert len(arena) == 1 and arena.view("cd" * 32) is None
+    ctx = multiprocessing.get_context('fork')
+    recv, send = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=crashed_reader, args=(arena.name, send))
+    proc.start()
+    assert recv.recv() == b'{"block": 1}'
+    proc.join()
+    assert proc.exitcode == 1
+    assert bytes(arena.view(HASH)) == b'{"block": 1}'
+    name = arena.name
+    arena.close()
+    try:
+        shared_memory.SharedMemory(name=name)
+        assert False
+    except FileNotFoundError:
+        pass
+
+
+def test_arena_attach():
+    arena = BlockArena.create(1024, 16)
+    arena.put(HASH, b'{"block": 1}')
+    # отдельный процесс со своим resource_tracker читает арену и завершается штатно
+    reader = "import sys; from blockmesh.arena import BlockArena; " \
+             f"a = BlockArena.attach('{arena.name}'); sys.stdout.write(bytes(a.view('{HASH}')).decode()); a.close()"
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    out = subprocess.run([sys.executable, "-c", reader], env=env, capture_output=True, text=True, check=True)
+    assert out.stdout == '{"block": 1}' and "leaked" not in out.stderr
+    assert bytes(arena.view(HASH)) == b'{"block": 1}'
+    shm = shared_memory.SharedMemory(name=arena.name)
+    shm.close()
+    arena.close()
+
+
+def test_arena_load(mod):
+    m = prepare(mod, "test_arena_", 3, 4)
+    m.run()
+    m.save()
+    arena = BlockArena.create(2 ** 20, 1024)
+    loaded = Model.load(m.path, arena)
+    assert len(arena) == m.stgs[0].block_count - 1
+    assert arena.hits > 0
+    assert [s.block_mesh for s in loaded.stgs] == [s.block_mesh for s in m.stgs]
+    arena.close()
+    # со сжатием арена хранит сжатые блоки, как в файлах, и разбирает их прямо из разделяемой памяти
+    m = prepare(mod, "test_arena_codec_", 3, 4)
+    m.use_codec(BlockCodec.train([b'{"header": {"timestamp": 1}, "tx": {"send": "user0"}}'], 1024))
+    arena = BlockArena.create(2 ** 20, 1024)
+    for s in m.stgs:
+        s.arena = arena
+    m.run()
+    head = m.stgs[0].block_mesh[m.usrs[0].addr]
+    view = arena.view(head)
+    assert is_compressed(view) and view.nbytes == os.path.getsize(os.path.join(m.stgs[0].path_to_dir, head))
+    view.release()
+    assert m.stgs[0].load_block(head).hashs() == head
+    arena.close()
+
+
+if __name__ == '__main__':
+    test_arena()
+    test_arena_attach()
+    test_arena_load(Mod.Classic)
+    test_arena_load(Mod.Modified)
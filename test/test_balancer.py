@@ -0,0 +1,78 @@
+import os
+from blockmesh.node import Mod
+from blockmesh.model import Model
+from blockmesh.balancer import Balancer
+
+
+def test_balancer(mod):
+    m = Model(mod, os.path.join(os.getcwd(), f"test_balancer_{mod.name}"), 3, 9, 9, 9)
+    m.init()
+    # перекос: все участники, кроме двух, на первом узле-хранилище
+    for u in m.usrs[3:]:
+        u.change_stg(m.stgs[0])
+    m.use_balancer(Balancer(2, 1.0))
+    # трафик только внутри первого узла (по кольцу) и один блок от user1 к user0: user0 нагружен больше прочих
+    ring = [0] + list(range(3, 9))
+    for _ in range(2):
+        for sender, receiver in zip(ring, ring[1:] + ring[:1]):
+            m.usr_perform(sender, [receiver])
+        m.model_time.tick()
+    m.usr_perform(0, [3])
+    m.usr_perform(1, [0])
+    moved = m.balancer.rebalance(m)
+    assert 1 <= moved <= 2 and m.balancer.migrations == moved
+    assert m.usrs[0].stg is not m.stgs[0]
+    assert sum(m.balancer.users) == 9 and m.balancer.users[0] == 7 - moved
+    m.run()
+    # блоки первого шага и полного сценария run
+    assert m.stgs[0].block_count > 9 * 8 + 1 and all(s.queue_len() == 0 for s in m.stgs)
+    assert all(s.block_mesh == m.stgs[0].block_mesh and s.block_count == m.stgs[0].block_count for s in m.stgs)
+    assert all(u.block_count == len(u.index_blocks()) - 1 for u in m.usrs)
+    assert m.balancer.migrations <= 2 * m.performed + 2
+    assert all(u.addr in u.stg.user_map for u in m.usrs)
+    assert all(u.head == m.stgs[0].block_mesh[u.addr] for u in m.usrs)
+    m.save()
+    loaded = Model.load(m.path)
+    assert [m.stgs.index(u.stg) for u in m.usrs] == [loaded.stgs.index(u.stg) for u in loaded.usrs]
+    for budget, threshold in ((0, 2.0), (1, 0.5)):
+        try:
+            Balancer(budget, threshold)
+            assert False
+        except ValueError:
+            pass
+
+
+def test_migration(mod):
+    m = Model(mod, os.path.join(os.getcwd(), f"test_migration_{mod.name}"), 3, 9, 9, 9)
+    m.init()
+    balancer = Balancer(3)
+    # трафик между участниками первого узла-хранилища (0, 3, 6) и от остальных участников к user0
+    local = [0, 3, 6]
+    for sender in local:
+        for receiver in local:
+            if receiver != sender:
+                m.usr_perform(sender, [receiver])
+    for _ in range(2):
+        m.usr_perform(0, [3, 6])
+    for sender in (1, 4, 7, 2, 5, 8):
+        m.usr_perform(sender, [0])
+    queued = [s.queue_len() for s in m.stgs]
+    load = Balancer.load(m.stgs[0])["user0"]
+    assert queued[0] > max(queued[1:]) and load > 0
+    assert balancer.rebalance(m) == 1
+    assert m.usrs[0].stg is m.stgs[1] and "user0" in m.stgs[1].user_map and "user0" not in m.stgs[0].user_map
+    assert balancer.users == [2, 4, 3] and balancer.peak > 1
+    # блоки (подтверждения) участника переведены вместе с ним - оценка совпадает с очередями
+    assert [s.queue_len() for s in m.stgs] == [queued[0] - load, queued[1] + load, queued[2]]
+    assert Balancer.load(m.stgs[1])["user0"] == load
+    m.run()
+    assert all(s.queue_len() == 0 for s in m.stgs)
+    assert all(s.block_mesh == m.stgs[0].block_mesh for s in m.stgs)
+    assert all(u.head == m.stgs[0].block_mesh[u.addr] for u in m.usrs)
+
+
+if __name__ == '__main__':
+    test_balancer(Mod.Classic)
+    test_balancer(Mod.Modified)
+    test_migration(Mod.Classic)
+    test_migration(Mod.Modified)
@@ -0,0 +1,49 @@
+import os
+from blockmesh.node import Mod
+from blockmesh.model import Model
+from blockmesh.codec import BlockCodec, CODECS, DICT_F, decode, recode, prune, is_compressed
+from blockmesh.integrity import IntegrityChecker
+from test_engine import prepare
+
+
+def test_codec(mod):
+    m = prepare(mod, "test_codec_", 3, 5)
+    m.run()
+    m.save()
+    files = m.block_files()
+    samples = []
+    for file in files[:16]:
+        with open(file, "rb") as f:
+            samples.append(f.read())
+    codec = BlockCodec.train(samples, 4096)
+    assert len(codec.zdict) <= 4096
+    data = codec.encode(samples[0])
+    assert is_compressed(data) and decode(data) == samples[0] and len(data) < len(samples[0])
+    plain = sum(os.path.getsize(file) for file in files)
+    # перезапись прервана на половине: словарь сохранён только под своим id
+    codec.save(m.path, current=False)
+    recode(files[:len(files) // 2], codec)
+    with open(files[0] + ".tmp", "wb") as file:
+        file.write(b"partial")
+    CODECS.clear()
+    assert Model.load(m.path).codec is None and codec.id in CODECS
+    assert IntegrityChecker(m.path).run() == [] and files[0] + ".tmp" not in Model.load(m.path).block_files()
+    os.remove(files[0] + ".tmp")
+    _, after = recode(files, codec)
+    codec.save(m.path)
+    prune(m.path, codec)
+    assert after < plain and sorted(f for f in os.listdir(m.path) if f.startswith(DICT_F)) == \
+        [DICT_F, f"{DICT_F}.{codec.id.hex()}"]
+    loaded = Model.load(m.path)
+    assert loaded.codec.id == codec.id
+    assert [s.block_mesh for s in loaded.stgs] == [s.block_mesh for s in m.stgs]
+    assert [len(u.index_blocks()) for u in loaded.usrs] == [len(u.index_blocks()) for u in m.usrs]
+    assert IntegrityChecker(m.path).run() == []
+    assert recode(files, None) == (after, plain)
+    prune(m.path)
+    assert Model.load(m.path).codec is None and not [f for f in os.listdir(m.path) if f.startswith(DICT_F)]
+
+
+if __name__ == '__main__':
+    test_codec(Mod.Classic)
+    test_codec(Mod.Modified)
@@ -0,0 +1,120 @@
+import os
+from shutil import rmtree
+from blockmesh.node import Mod
+from blockmesh.model import Model
+from blockmesh.engine import EventEngine, Latency
+from blockmesh.aio import AsyncRuntime
+from blockmesh.parallel import ShardedExecutor
+from blockmesh.model import RESULT_F
+from blockmesh.node import NO_LOCK
+from blockmesh.block import DISK
+from blockmesh.store import BlockWriter
+from blockmesh.accounting import Accountant
+from blockmesh.balancer import Balancer
+
+
+def prepare(mod, d, stg_num, usr_num):
+    pwd = os.path.join(os.getcwd(), f'{d}{mod.name}')
+    try:
+        rmtree(pwd)
+    except FileNotFoundError:
+        pass
+    m = Model(mod, pwd, stg_num, usr_num, 20, 9)
+    m.init()
+    return m
+
+
+def test_event_engine(mod):
+    m = prepare(mod, "test_engine_", 3, 6)
+    ev = EventEngine(Latency('uniform', 0, 4, seed=1), {1: Latency('exp', 8, seed=2)})
+    m.run(ev)
+    assert ev.delivered > 0 and ev.dropped == 0 and ev.shared > 0
+    assert all(s.queue_len() == 0 for s in m.stgs)
+    assert all(s.block_count == 6 * 5 + 1 for s in m.stgs)
+    assert all(u.block_count == 2 * 5 for u in m.usrs)
+    assert m.performed == ev.rounds
+    m.save()
+
+
+def test_share_latency(mod):
+    m = prepare(mod, "test_share_", 3, 6)
+    ev = EventEngine(Latency('const', 0), {2: Latency('const', 7)})
+    m.run(ev)
+    # рассылка шага 1 к узлу 2 идёт 7 единиц: шаг 2 раунда ждёт её доставки
+    assert ev.shared > 0 and all(s.block_count == 6 * 5 + 1 for s in m.stgs)
+    assert all(s.block_mesh == m.stgs[0].block_mesh for s in m.stgs)
+    fast = prepare(mod, "test_share_fast_", 3, 6)
+    fast.run(EventEngine(Latency('const', 0)))
+    # шаг 2 последнего раунда наступает через 7 единиц после шага 1, а не через одну
+    assert m.model_time.time >= fast.model_time.time + 7 - 1
+
+
+def test_latency():
+    assert Latency.parse('const:3').sample() == 3
+    lat = Latency.parse('uniform:1:5', seed=1)
+    assert all(1 <= lat.sample() <= 5 for _ in range(100))
+
+
+def test_async_runtime(mod):
+    sync = prepare(mod, "test_sync_", 3, 6)
+    sync.use_writer(BlockWriter())
+    sync.use_accountant(Accountant(sync.path, sync.stgs))
+    sync.run()
+    m = prepare(mod, "test_async_", 3, 6)
+    m.use_writer(BlockWriter())
+    m.use_accountant(Accountant(m.path, m.stgs))
+    rt = AsyncRuntime(delay=0.001, bandwidth=10 ** 6, threads=True)
+    m.run(rt)
+    assert rt.get_stat()["Messages"] > 0
+    for s, a in zip(sync.stgs, m.stgs):
+        assert s.block_mesh == a.block_mesh and s.block_count == a.block_count
+    assert [u.head for u in sync.usrs] == [u.head for u in m.usrs]
+    # счётчики, общие для узлов, изменяемых в потоках, совпадают с последовательным прогоном
+    assert m.writer.get_stat() == sync.writer.get_stat()
+    assert m.accountant.get_stat() == sync.accountant.get_stat()
+    assert all(s.lock is NO_LOCK for s in m.stgs)
+    sync.accountant.close()
+    m.accountant.close()
+
+
+def test_sharded(mod):
+    sync = prepare(mod, "test_sync_", 3, 6)
+    sync.use_writer(BlockWriter())
+    written = DISK['writes']
+    sync.run()
+    written = DISK['writes'] - written
+    m = prepare(mod, "test_sharded_", 3, 6)
+    m.use_writer(BlockWriter())
+    sharded = DISK['writes']
+    executor = ShardedExecutor(2)
+    m.run(executor)
+    for s, p in zip(sync.stgs, m.stgs):
+        assert s.block_mesh == p.block_mesh and s.block_count == p.block_count
+    # записи процессов шардов учтены в основном процессе
+    assert m.writer.writes == sync.writer.writes and DISK['writes'] - sharded == written
+    with open(os.path.join(sync.path, RESULT_F)) as a, open(os.path.join(m.path, RESULT_F)) as b:
+        assert a.read() == b.read()
+    # процессы шардов запускаются один раз на всё моделирование
+    assert executor.forks == 2 and executor.rounds >= m.performed > executor.forks and not executor.procs
+    assert m.get_queue_stat() == sync.get_queue_stat()
+    # участники переводятся между узлами-хранилищами разных шардов
+    runs = []
+    for engine in (None, ShardedExecutor(2)):
+        m = prepare(mod, "test_sharded_balance_", 3, 9)
+        m.use_balancer(Balancer(2, 1.0))
+        m.run(engine)
+        runs.append(([s.block_mesh for s in m.stgs], [u.length for u in m.usrs],
+                     [m.stgs.index(u.stg) for u in m.usrs], m.balancer.migrations))
+    assert runs[0] == runs[1] and runs[0][3] > 0
+
+
+if __name__ == '__main__':
+    test_latency()
+    test_event_engine(Mod.Classic)
+    test_event_engine(Mod.Modified)
+    test_share_latency(Mod.Classic)
+    test_share_latency(Mod.Modified)
+    test_async_runtime(Mod.Classic)
+    test_async_runtime(Mod.Modified)
+    test_sharded(Mod.Classic)
+    test_sharded(Mod.Modified)
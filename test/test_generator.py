@@ -0,0 +1,36 @@
+import os
+from shutil import rmtree
+from blockmesh.node import Mod
+from blockmesh.model import Model
+from blockmesh.generator import Generator
+from blockmesh.integrity import IntegrityChecker
+
+
+def test_generate(mod):
+    paths = [os.path.join(os.getcwd(), f"test_generate_{mod.name}_{w}") for w in (1, 3)]
+    for path in paths:
+        rmtree(path, ignore_errors=True)
+    gens = [Generator(mod, path, 3, 7, 400, 7, 6, 2, seed=5, workers=w, batch=64) for path, w in zip(paths, (1, 3))]
+    for gen in gens:
+        gen.run()
+    assert gens[0].heads == gens[1].heads and gens[0].files == gens[1].files == 400 * (3 + 3)
+    m = gens[1].check()
+    assert [s.block_count for s in m.stgs] == [401] * 3
+    assert all(s.block_mesh == m.stgs[0].block_mesh for s in m.stgs)
+    assert [u.length for u in m.usrs] == gens[1].lengths and sum(gens[1].lengths) == 7 + 400 * 3
+    assert Model.read_manifest(paths[1])["blocks"] == [401] * 3
+    assert IntegrityChecker(paths[1]).run() == []
+    # сгенерированная модель продолжает моделирование
+    m = Model.load(paths[0])
+    m.run()
+    assert m.stgs[0].block_count == 401 + 7 * 6
+    try:
+        Generator(mod, paths[0], 3, 7, 10, 7, 6)
+        assert False
+    except RuntimeError:
+        pass
+
+
+if __name__ == '__main__':
+    test_generate(Mod.Classic)
+    test_generate(Mod.Modified)
@@ -0,0 +1,49 @@
+from blockmesh.node import Mod
+from blockmesh.block import GENESIS_BLOCK
+from blockmesh.index import BlockIndex
+from test_engine import prepare
+
+
+def test_index(mod):
+    m = prepare(mod, "test_index_", 3, 5)
+    m.run()
+    m.save()
+    idx = BlockIndex(m.path)
+    assert idx.update() == m.stgs[0].block_count - 1
+    assert idx.update() == 0
+    user = m.usrs[1]
+    chain = idx.chain(user.addr)
+    assert [c["seq"] for c in chain] == list(range(1, len(user.index_blocks())))
+    assert chain[-1]["id"] == user.head
+    assert {c["id"] for c in chain} | {GENESIS_BLOCK} == user.index_blocks()
+    assert [c["id"] for c in idx.chain(user.addr, 2, 3)] == [c["id"] for c in chain[1:3]]
+    info = idx.block(user.head[:10])
+    assert info["id"] == user.head and info["seq"][user.addr] == len(chain)
+    assert idx.is_ancestor(chain[0]["id"], user.head) and not idx.is_ancestor(user.head, chain[0]["id"])
+    assert idx.common_ancestor(user.head, chain[1]["id"]) == chain[1]["id"]
+    other = m.usrs[2].head
+    common = idx.common_ancestor(user.head, other)
+    assert all(common in {a["id"] for a in idx.ancestors(head)} | {head} for head in (user.head, other))
+    assert len(idx.ancestors(user.head, 3)) == 3
+    idx.close()
+
+    head = user.head
+    m.usr_perform(1, [2])
+    for _ in range(2):
+        for s in m.stgs:
+            s.perform_step_1()
+        for s in m.stgs:
+            s.perform_step_2()
+    m.save()
+    idx = BlockIndex(m.path)
+    assert idx.update() == 1 and not idx.rebuilt
+    assert idx.chain(user.addr)[-1]["id"] == user.head == m.usrs[2].head != head
+    assert idx.is_ancestor(head, user.head)
+    m.snapshot()
+    assert idx.update() == len(m.stgs[0].base) and idx.rebuilt
+    idx.close()
+
+
+if __name__ == '__main__':
+    test_index(Mod.Classic)
+    test_index(Mod.Modified)
@@ -0,0 +1,117 @@
+import os
+import json
+from blockmesh.node import Mod, HEAD_FILE, ARCHIVE_DIR
+from blockmesh.model import Model, MANIFEST_F
+from blockmesh.integrity import IntegrityChecker
+from test_engine import prepare
+
+
+def test_verify(mod):
+    m = prepare(mod, "test_verify_", 3, 5)
+    m.run()
+    m.save()
+    assert IntegrityChecker(m.path, 4).run() == []
+    checker = IntegrityChecker(m.path, 4, incremental=True)
+    assert checker.run() == [] and checker.checked == 0 and checker.skipped > 0
+    stg = m.stgs[1].path_to_dir
+    head = m.usrs[0].head
+    with open(os.path.join(stg, head), "r") as file:
+        data = json.load(file)
+    data['header']['timestamp'] += 1
+    with open(os.path.join(stg, head), "w") as file:
+        json.dump(data, file)
+    os.remove(os.path.join(m.usrs[1].path_to_dir, m.usrs[1].head))
+    # удалённый старый блок: файл, ссылающийся на него, не менялся, но ссылка проверяется
+    older = m.stgs[0].load_block(m.usrs[0].head).parents[m.usrs[0].addr]
+    os.remove(os.path.join(m.stgs[0].path_to_dir, older))
+    checker = IntegrityChecker(m.path, 4, incremental=True)
+    problems = checker.run()
+    assert checker.checked == 1
+    assert any(p.kind == "parent" and older in p.detail and p.path.startswith("Storages") for p in problems)
+    assert (os.path.relpath(os.path.join(stg, head), m.path), "block") in [(p.path, p.kind) for p in problems]
+    assert any(p.kind == "head" and p.path.startswith("Users") for p in problems)
+    with open(os.path.join(m.stgs[2].path_to_dir, HEAD_FILE), "r") as file:
+        data = json.load(file)
+    data['heads'][m.usrs[0].addr] = m.usrs[1].head
+    with open(os.path.join(m.stgs[2].path_to_dir, HEAD_FILE), "w") as file:
+        json.dump(data, file)
+    kinds = {p.kind for p in IntegrityChecker(m.path).run()}
+    assert {"block", "head", "mesh"} <= kinds
+
+
+def test_snapshot(mod):
+    m = prepare(mod, "test_snapshot_", 3, 5)
+    m.run()
+    counts = [s.block_count for s in m.stgs]
+    pruned = m.snapshot()
+    assert pruned["Storages"] > 0 and pruned["Users"] > 0
+    assert len(os.listdir(os.path.join(m.stgs[0].path_to_dir, ARCHIVE_DIR))) == pruned["Storages"] // 3
+    assert all(len(s.index_blocks()) == len(s.base) + 1 for s in m.stgs)
+    loaded = Model.load(m.path)
+    assert [s.block_count for s in loaded.stgs] == counts
+    assert [s.block_mesh for s in loaded.stgs] == [s.block_mesh for s in m.stgs]
+    assert IntegrityChecker(m.path).run() == []
+    loaded.usr_perform(0, [1])
+    for _ in range(2):
+        for s in loaded.stgs:
+            s.perform_step_1()
+        for s in loaded.stgs:
+            s.perform_step_2()
+    assert [s.block_count for s in loaded.stgs] == [c + 1 for c in counts]
+    assert loaded.usrs[1].head != loaded.usrs[1].base
+    loaded.save()
+    assert IntegrityChecker(m.path).run() == []
+
+
+def test_lagging(mod):
+    m = prepare(mod, "test_lagging_", 3, 5)
+    m.run()
+    m.stgs[2].disable()
+    m.usr_perform(0, [1])
+    for _ in range(2):
+        for s in m.stgs:
+            s.perform_step_1()
+        for s in m.stgs:
+            s.perform_step_2()
+    # снимок сделан без отключённого узла: при включении он принимает базу и удаляет старые блоки
+    for s in m.stgs[:2]:
+        s.snapshot()
+    m.stgs[2].enable()
+    assert m.stgs[2].base == m.stgs[0].base and m.stgs[2].block_count == m.stgs[0].block_count
+    assert set(os.listdir(m.stgs[2].path_to_dir)) == set(os.listdir(m.stgs[0].path_to_dir))
+    m.save()
+    assert IntegrityChecker(m.path).run() == []
+    m.usr_perform(1, [2])
+    for _ in range(2):
+        for s in m.stgs:
+            s.perform_step_1()
+        for s in m.stgs:
+            s.perform_step_2()
+    # граф блокмеша строится до базы: все концы рёбер - загруженные блоки
+    edges, pos, _ = m._Model__graph()
+    assert edges and all(parent in pos for _, parent in edges)
+
+
+def test_manifest(mod):
+    m = prepare(mod, "test_manifest_", 3, 5)
+    m.save()
+    os.remove(os.path.join(m.path, MANIFEST_F))
+    assert Model.read_manifest(m.path) is None
+    m.run()
+    m.save()
+    info = Model.read_manifest(m.path)
+    assert info == json.loads(json.dumps(m.manifest()))
+    assert info["perf"] == m.performed and info["stat"]["GlobalBM"] == m.stgs[0].block_count
+    assert info["sync"] == m.get_sync_count() and info["queue_total"] == 0
+    assert info["blocks"] == [s.block_count for s in m.stgs]
+
+
+if __name__ == '__main__':
+    test_verify(Mod.Classic)
+    test_verify(Mod.Modified)
+    test_snapshot(Mod.Classic)
+    test_snapshot(Mod.Modified)
+    test_lagging(Mod.Classic)
+    test_lagging(Mod.Modified)
+    test_manifest(Mod.Classic)
+    test_manifest(Mod.Modified)
@@ -0,0 +1,68 @@
+import os
+import json
+from blockmesh.node import Mod
+from blockmesh.model import ModelTime
+from blockmesh.lifecycle import Lifecycle, Histogram, LIFECYCLE_F
+from test_engine import prepare
+
+
+def test_histogram():
+    h = Histogram()
+    for v in (0, 1, 2, 3, 4, 5, 100):
+        h.add(v)
+    stat = h.get_stat()
+    assert stat["buckets"] == {"<=0": 1, "<=1": 1, "<=2": 1, "<=4": 2, "<=8": 1, "<=128": 1}
+    assert stat["count"] == 7 and stat["max"] == 100 and stat["p50"] == 4 and stat["p99"] == 100
+
+
+class Stub:
+    def __init__(self, digest):
+        self.timestamp = 0
+        self.tx = self
+        self.key = digest
+        self.available = True
+
+    def digest(self):
+        return self.key
+
+
+def test_per_storage():
+    stgs = [Stub(None) for _ in range(3)]
+    tracker = Lifecycle(ModelTime(), stgs)
+    block = Stub(b"block")
+    tracker.enqueue(block)
+    for _ in stgs:
+        tracker.defer(block)
+        tracker.defer(block)
+        tracker.unconfirmed(block)
+    for _ in stgs:
+        tracker.insert(block)
+    # каждый узел отложил блок дважды
+    h = tracker.report()["histograms"]
+    assert h["deferrals"]["max"] == 2 and h["unconfirmed_rounds"]["max"] == 1
+
+
+def test_lifecycle(mod):
+    m = prepare(mod, "test_lifecycle_", 3, 5)
+    tracker = Lifecycle(m.model_time, m.stgs)
+    m.use_tracker(tracker)
+    m.run()
+    report = tracker.report()
+    assert report["blocks"] == m.stgs[0].block_count - 1 and report["in_flight"] == 0
+    h = report["histograms"]
+    assert h["to_mesh"]["mean"] >= h["to_first_insert"]["mean"] > 0
+    assert h["deferrals"]["max"] > 0
+    if mod == Mod.Classic:
+        assert h["unconfirmed_rounds"]["max"] == 0
+    tracker.save(m.path, mod.name)
+    tracker.save(m.path, "Other")
+    with open(os.path.join(m.path, LIFECYCLE_F), "r") as file:
+        data = json.load(file)
+    assert set(data) == {mod.name, "Other"} and data[mod.name]["blocks"] == report["blocks"]
+
+
+if __name__ == '__main__':
+    test_histogram()
+    test_per_storage()
+    test_lifecycle(Mod.Classic)
+    test_lifecycle(Mod.Modified)
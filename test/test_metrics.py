@@ -0,0 +1,88 @@
+import os
+import json
+from blockmesh.node import Mod
+from blockmesh.block import DISK
+from blockmesh.metrics import Metrics
+from blockmesh.parallel import ShardedExecutor
+from blockmesh.store import BlockWriter
+from test_engine import prepare
+
+
+def test_metrics(mod):
+    m = prepare(mod, "test_metrics_", 3, 4)
+    prom = os.path.join(m.path, "metrics.prom")
+    jsonl = os.path.join(m.path, "metrics.jsonl")
+    metrics = Metrics(prom, jsonl, 0)
+    m.use_metrics(metrics)
+    m.run()
+    metrics.close()
+    with open(jsonl, "r") as file:
+        samples = [json.loads(line) for line in file]
+    assert len(samples) == m.performed
+    assert [s["iteration"] for s in samples] == list(range(1, m.performed + 1))
+    assert samples[-1]["blocks"] == m.stgs[0].block_count and samples[-1]["queues"] == [0, 0, 0]
+    assert all(s["disk_writes"] <= t["disk_writes"] for s, t in zip(samples, samples[1:]))
+    with open(prom, "r") as file:
+        text = file.read()
+    assert f"bm_blocks {m.stgs[0].block_count}\n" in text
+    assert f"bm_iteration_seconds_count {m.performed}\n" in text
+    assert 'bm_queue_depth{storage="2"} 0' in text
+    assert not os.path.exists(prom + ".tmp")
+
+
+def test_metrics_rounds(mod):
+    m = prepare(mod, "test_metrics_rounds_", 3, 4)
+    prom = os.path.join(m.path, "metrics.prom")
+    metrics = Metrics(prom, None, 0)
+    m.use_metrics(metrics)
+    m.usr_perform(0, [1])
+    for _ in range(2):
+        for s in m.stgs:
+            s.perform_step_1()
+        for s in m.stgs:
+            s.perform_step_2()
+        m.round_done()
+    # файл обновлён после раунда, до конца итерации
+    with open(prom, "r") as file:
+        assert f"bm_blocks {m.stgs[0].block_count}\n" in file.read() and metrics.iterations == 0
+    metrics.close()
+    # раунды всех движков обновляют метрики
+    for engine in (None, ShardedExecutor(2)):
+        m = prepare(mod, "test_metrics_rounds_", 3, 4)
+        metrics = Metrics(os.path.join(m.path, "metrics.prom"), None, 0)
+        m.use_metrics(metrics)
+        rounds = []
+        refresh = metrics.refresh
+        metrics.refresh = lambda model: rounds.append(model.performed) or refresh(model)
+        m.run(engine)
+        metrics.close()
+        assert m.performed > 0 and len(rounds) >= m.performed
+
+
+def test_metrics_sharded(mod):
+    runs = []
+    for name, engine in (("seq", None), ("sharded", ShardedExecutor(2))):
+        m = prepare(mod, f"test_metrics_{name}_", 3, 4)
+        m.use_writer(BlockWriter())
+        jsonl = os.path.join(m.path, "metrics.jsonl")
+        metrics = Metrics(None, jsonl, 0)
+        m.use_metrics(metrics)
+        start = DISK['writes']
+        m.run(engine)
+        metrics.close()
+        with open(jsonl, "r") as file:
+            samples = [json.loads(line) for line in file]
+        assert samples[-1]["disk_writes"] > start
+        runs.append((DISK['writes'] - start, m.writer.writes, [s["cache_hit_ratio"]["verify"] for s in samples]))
+    # шаг 2 в процессах шардов: их записи учтены в метриках основного процесса
+    # (шард сбрасывает записи в конце раунда, поэтому доля попаданий в отложенные записи иная)
+    assert runs[0] == runs[1]
+
+
+if __name__ == '__main__':
+    test_metrics(Mod.Classic)
+    test_metrics(Mod.Modified)
+    test_metrics_rounds(Mod.Classic)
+    test_metrics_rounds(Mod.Modified)
+    test_metrics_sharded(Mod.Classic)
+    test_metrics_sharded(Mod.Modified)
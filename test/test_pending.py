@@ -0,0 +1,148 @@
+import os
+import json
+from blockmesh.node import Mod, Storage, HEAD_FILE
+from blockmesh.model import ModelTime
+from blockmesh.pending import PendingQueue, InFlight, POLICIES, OLDEST, CONFIRMATIONS
+from test_engine import prepare
+
+
+class Stub:
+    def __init__(self, timestamp):
+        self.timestamp = timestamp
+
+
+def test_queue():
+    t = ModelTime()
+    a, b, c = Stub(3), Stub(1), Stub(2)
+    q = PendingQueue(t)
+    q.add(a)
+    q.add(b, 2)
+    q.add(c)
+    q.add(a, 2)
+    assert q.total == 6 and len(q) == 3 and q[a] == 3
+    assert [x for x, _ in q.order()] == [a, b, c]
+    q.policy = OLDEST
+    assert [x for x, _ in q.order()] == [b, c, a]
+    q.policy = CONFIRMATIONS
+    assert [x for x, _ in q.order()] == [a, b, c]
+    for x in q:
+        if x is b:
+            q.remove(x, False)
+    t.tick(2)
+    q.defer(a)
+    t.tick(3)
+    q.defer(a)
+    assert q.remove(a) == 3 and q.total == 1 and a not in q
+    assert q.get_stat() == {"Drained": 1, "WaitSum": 5, "MaxWait": 5,
+                            "Deferred": 2, "DeferWaitSum": 7, "MaxDeferWait": 5}
+    q.add(b, 2)
+    assert q.take(b) == t.time and q[b] == 1 and q.total == 2
+    q.take(b)
+    assert b not in q and q.total == 1 and q.drained == 1
+
+
+def test_policies():
+    counts = None
+    for policy in POLICIES:
+        m = prepare(Mod.Modified, f"test_policy_{policy}_", 3, 6)
+        m.use_queue_policy(policy)
+        m.run()
+        stat = m.get_queue_stat()
+        assert stat["QueuePolicy"] == policy and stat["Drained"] > 0 and stat["MaxWait"] >= stat["AvgWait"] > 0
+        assert stat["Deferred"] > 0 and stat["MaxDeferWait"] >= stat["AvgDeferWait"] > 0
+        assert all(s.queue_len() == 0 for s in m.stgs)
+        if counts is None:
+            counts = [s.block_count for s in m.stgs]
+        assert [s.block_count for s in m.stgs] == counts
+    m = prepare(Mod.Classic, "test_policy_", 2, 2)
+    try:
+        m.use_queue_policy(OLDEST)
+        assert False
+    except RuntimeError:
+        pass
+
+
+def test_saved_arrival():
+    m = prepare(Mod.Modified, "test_arrival_", 2, 3)
+    m.usr_perform(0, [1])
+    m.model_time.tick(3)
+    m.usr_perform(1, [2])
+    stg = m.usrs[1].stg
+    arrived = dict(stg.queue.arrived)
+    assert len(set(arrived.values())) == 2
+    stg.save()
+    loaded = Storage.load(stg.path_to_dir, m.model_time)
+    # время поступления сохраняется вместе с очередью: ожидание после загрузки не сбрасывается
+    assert sorted(loaded.queue.arrived.values()) == sorted(arrived.values())
+    path = os.path.join(stg.path_to_dir, HEAD_FILE)
+    with open(path, "r") as file:
+        data = json.load(file)
+    data["queue"] = {blocks: entry[0] for blocks, entry in data["queue"].items()}
+    with open(path, "w") as file:
+        json.dump(data, file)
+    # файл прежнего формата: только подтверждения
+    loaded = Storage.load(stg.path_to_dir, m.model_time)
+    assert loaded.queue.total == stg.queue.total
+    assert set(loaded.queue.arrived.values()) == {m.model_time.time}
+
+
+class Watched(InFlight):
+    """
+    InFlight, запоминающий блоки, пропущенные шагом 1 текущего раунда
+    """
+    __slots__ = ('seen',)
+
+    def __init__(self):
+        super().__init__()
+        self.seen = set()
+
+    def filter(self, order):
+        self.seen.update(block.tx.digest() for block, _ in order if block in self)
+        return super().filter(order)
+
+    def rotate(self):
+        super().rotate()
+        self.seen = set()
+
+
+def test_pipeline():
+    barrier = prepare(Mod.Modified, "test_barrier_", 3, 6)
+    barrier.run()
+    m = prepare(Mod.Modified, "test_pipeline_", 3, 6)
+    m.use_pipeline()
+    assert all(isinstance(s.in_flight, InFlight) for s in m.stgs)
+    m.pipeline = Watched()
+    for s in m.stgs:
+        s.in_flight = m.pipeline
+    # после шага 2 раунда k: блоки, которые шаг 1 раунда k+1 видел в очередях и которые внедрены только сейчас
+    pending = []
+    round_done = m.round_done
+
+    def watched_round_done():
+        queued = {block.tx.digest() for s in m.stgs for block in s.queue}
+        pending.append(len(m.pipeline.seen - queued))
+        round_done()
+    m.round_done = watched_round_done
+    m.run()
+    assert all(s.queue_len() == 0 for s in m.stgs)
+    assert [s.block_count for s in m.stgs] == [s.block_count for s in barrier.stgs]
+    # шаг 1 раунда k+1 выполняется до шага 2 раунда k: разосланные блоки ещё не внедрены
+    stat = m.pipeline.get_stat()
+    assert stat["PipelineRounds"] > barrier.performed * barrier.stg_rounds()[0]
+    assert stat["PipelineOverlapped"] == stat["PipelineRounds"] - m.performed
+    assert stat["InFlightSkipped"] >= sum(pending) > 0
+    assert m.model_time.time - barrier.model_time.time == (m.performed - barrier.performed) * sum(m.duration)
+    m.save()
+    m = prepare(Mod.Classic, "test_pipeline_", 2, 2)
+    try:
+        m.use_pipeline()
+        assert False
+    except RuntimeError:
+        pass
+
+
+if __name__ == '__main__':
+    test_queue()
+    test_policies()
+    test_saved_arrival()
+    test_pipeline()
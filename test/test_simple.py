@@ -1,7 +1,9 @@
 import os
 from blockmesh.node import *
 from shutil import rmtree
-from blockmesh.model import ModelTime
+from blockmesh.model import ModelTime, Model
+from blockmesh.parallel import ShardedExecutor
+from blockmesh.signature import Verifier, sign
 
 
 def prepare(mod, d, stg_num, usr_num):
@@ -78,8 +80,144 @@ def test_unavail(mod):
     stg_step(stg, time, 5)
 
 
+def test_directory(mod):
+    stg, usr, time = prepare(mod, "test_directory_", 3, 6)
+    directory = stg[0].directory
+    assert all(s.directory is directory for s in stg)
+    assert len(directory) == 6 and directory.lookup("user4").stg is stg[1]
+    usr[4].change_stg(stg[2])
+    assert directory.lookup("user4").stg is stg[2]
+    usr_step(usr, 0, [4])
+    stg_step(stg, time, 2)
+    assert usr[4].block_count == 1
+    stg[2].disable()
+    assert stg[0].get_users(["user4"]) == [None]
+
+
+def test_signature(mod):
+    stg, usr, t = prepare(mod, "test_signature_", 2, 3)
+    verifier = Verifier(2)
+    for s in stg:
+        s.verifier = verifier
+    usr_step(usr, 0, [1])
+    stg_step(stg, t)
+    assert usr[0].block_count == 1 and usr[1].block_count == 1
+    block = stg[0].load_block(usr[0].head)
+    assert verifier.verified == 1 and verifier.rejected == 0
+    tx = Transaction(sender_addr=usr[2].addr, sender_sign=sign("forged", "x"), receivers=[usr[0].addr])
+    usr[0].sign_tx(tx)
+    forged = Block(tx, t.time)
+    usr[2].stg.add_new_block(forged)
+    assert usr[2].stg.check_block(forged) is False
+    stg_step(stg, t)
+    assert usr[2].block_count == 0 and usr[0].block_count == 1
+    assert forged not in usr[2].stg.queue and verifier.rejected == 1
+    verifier.close()
+    # кэш ограничен: давно не использованный результат вытесняется
+    small = Verifier(cache_size=1)
+    assert small.verify(forged, stg[0].directory) is False and small.verify(block, stg[0].directory) is True
+    assert small.verify(forged, stg[0].directory) is False
+    assert small.evictions == 2 and small.cache_hits == 0 and len(small.cache) == 1
+    # очередь со старым форматом подписей (секрет участника) не загружается
+    tx = Transaction(sender_addr=usr[2].addr, sender_sign="sign2", receivers=[usr[0].addr])
+    tx.sign(usr[0].addr, "sign0")
+    usr[2].stg.add_new_block(Block(tx, t.time))
+    usr[2].stg.save()
+    try:
+        Storage.load(usr[2].stg.path_to_dir, t)
+        assert False
+    except RuntimeError:
+        pass
+
+
+def test_cross_reject(mod):
+    stg, usr, t = prepare(mod, "test_cross_reject_", 2, 2)
+    tx = Transaction(sender_addr=usr[0].addr, sender_sign=sign("forged", "x"), receivers=[usr[1].addr])
+    usr[1].sign_tx(tx)
+    forged = Block(tx, t.time)
+    # блок в очереди узла-хранилища получателя, отправитель подключён к другому узлу
+    usr[1].stg.add_new_block(forged)
+    if mod == Mod.Modified:
+        usr[0].generation_allowed = False
+    stg_step(stg, t)
+    assert forged not in usr[1].stg.queue and usr[0].block_count == 0 and usr[1].block_count == 0
+    assert usr[0].generation_allowed is (True if mod == Mod.Modified else None)
+    usr_step(usr, 0, [1])
+    stg_step(stg, t)
+    assert usr[0].block_count == 1 and usr[1].block_count == 1
+
+
+def test_compact(mod):
+    stg, usr, t = prepare(mod, "test_compact_", 3, 4)
+    usr_step(usr, 0, [1, 2])
+    stg_step(stg, t, 2)
+    assert not any(hasattr(o, '__dict__') for o in stg + usr)
+    head = usr[0].head
+    assert all(s.block_mesh[usr[0].addr] is head for s in stg)
+    block = Block.load(os.path.join(usr[0].path_to_dir, head))
+    assert not hasattr(block, '__dict__') and not hasattr(block.tx, '__dict__')
+    assert all(isinstance(sign, bytes) and len(sign) == 32 for sign in block.tx.signs)
+    assert Transaction.loads(block.tx.dumps()) == block.tx
+    assert list(block.tx.participants) == list(block.participants()) == [u.addr for u in usr[:3]]
+    # головы, не менявшиеся за много внедрений, остаются общими
+    for _ in range(80):
+        usr_step(usr, 1, [2])
+        stg_step(stg, t, 2)
+    # равная строка из другого источника (файл, другой процесс) получает прежний экземпляр
+    assert stg[0].directory.intern(head[:32] + head[32:]) is head
+
+
+def test_user_head(mod):
+    stg, usr, t = prepare(mod, "test_user_head_", 2, 3)
+    usr_step(usr, 0, [1])
+    stg_step(stg, t, 2)
+    usr_step(usr, 1, [2])
+    stg_step(stg, t, 2)
+    save(stg, usr)
+    walked = [len(u.index_blocks()) for u in usr]
+    assert [u.length for u in usr] == walked
+    assert [User.load(u.path_to_dir, u.stg).block_count for u in usr] == walked
+    path = os.path.join(usr[1].path_to_dir, HEAD_FILE)
+    with open(path, "r") as file:
+        data = json.load(file)
+    data["length"] += 5
+    with open(path, "w") as file:
+        json.dump(data, file)
+    # контрольная сумма не сходится - цепочка обходится
+    assert User.load(usr[1].path_to_dir, usr[1].stg).length == walked[1]
+    data["digest"] = head_digest(data["addr"], data["head"], data["base"], data["length"], data["base_count"])
+    with open(path, "w") as file:
+        json.dump(data, file)
+    assert User.load(usr[1].path_to_dir, usr[1].stg).length == walked[1] + 5
+    try:
+        User.load(usr[1].path_to_dir, usr[1].stg, walk=True)
+        assert False
+    except RuntimeError:
+        pass
+    # шаг 2 в процессах шардов: длина цепочки приходит вместе с головой участника
+    pwd = os.path.join(os.getcwd(), f"test_user_head_sharded_{mod.name}")
+    rmtree(pwd, ignore_errors=True)
+    m = Model(mod, pwd, 3, 5, 20, 9)
+    m.init()
+    m.run(ShardedExecutor(2))
+    m.save()
+    walked = [len(u.index_blocks()) for u in m.usrs]
+    assert [u.length for u in m.usrs] == walked and max(walked) > 2
+    assert [User.load(u.path_to_dir, u.stg, walk=True).length for u in m.usrs] == walked
+
+
 if __name__ == '__main__':
     test_simple(Mod.Classic)
     test_simple(Mod.Modified)
     test_unavail(Mod.Classic)
     test_unavail(Mod.Modified)
+    test_directory(Mod.Classic)
+    test_directory(Mod.Modified)
+    test_signature(Mod.Classic)
+    test_signature(Mod.Modified)
+    test_cross_reject(Mod.Classic)
+    test_cross_reject(Mod.Modified)
+    test_compact(Mod.Classic)
+    test_compact(Mod.Modified)
+    test_user_head(Mod.Classic)
+    test_user_head(Mod.Modified)
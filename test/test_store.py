@@ -0,0 +1,82 @@
+import os
+from blockmesh.node import Mod
+from blockmesh.store import BlockWriter, AsyncBlockWriter, NONE, PER_ITERATION, PER_BLOCK_FSYNC
+from blockmesh.parallel import ShardedExecutor
+from blockmesh.model import Model, MODEL_F
+from test_engine import prepare
+
+
+def test_writer(mod):
+    plain = prepare(mod, "test_plain_", 3, 5)
+    plain.run()
+    for durability in [PER_ITERATION, PER_BLOCK_FSYNC]:
+        m = prepare(mod, f"test_{durability}_", 3, 5)
+        writer = BlockWriter(durability)
+        m.use_writer(writer)
+        m.run()
+        assert not writer.pending and writer.writes > 0
+        assert [s.block_mesh for s in m.stgs] == [s.block_mesh for s in plain.stgs]
+        assert [u.head for u in m.usrs] == [u.head for u in plain.usrs]
+        for u in m.usrs:
+            assert os.path.isfile(os.path.join(u.path_to_dir, u.head))
+        # состояние сохраняется на каждой итерации заменой временных файлов
+        assert os.path.isfile(os.path.join(m.path, MODEL_F))
+        assert not [f for _, _, files in os.walk(m.path) for f in files if f.endswith(".tmp")]
+        assert Model.load(m.path).performed == m.performed
+
+
+def test_pending_reads(mod):
+    m = prepare(mod, "test_pending_", 2, 3)
+    writer = BlockWriter()
+    m.use_writer(writer)
+    m.usr_perform(0, [1])
+    m.usr_perform(1, [2])
+    for _ in range(2):
+        for s in m.stgs:
+            s.perform_step_1()
+        for s in m.stgs:
+            s.perform_step_2()
+    head = m.usrs[1].head
+    assert not os.path.isfile(os.path.join(m.usrs[1].path_to_dir, head))
+    assert m.usrs[1].block_count == 2 and writer.read_hits > 0
+    m.save()
+    assert os.path.isfile(os.path.join(m.usrs[1].path_to_dir, head))
+
+
+def test_async_writer(mod):
+    plain = prepare(mod, "test_io_plain_", 3, 5)
+    plain.run()
+    for durability in [NONE, PER_ITERATION, PER_BLOCK_FSYNC]:
+        m = prepare(mod, f"test_io_{durability}_", 3, 5)
+        writer = AsyncBlockWriter(durability, 2, 4)
+        m.use_writer(writer)
+        m.run()
+        writer.close()
+        assert not writer.pending and not writer.futures and writer.writes > 0
+        assert [s.block_mesh for s in m.stgs] == [s.block_mesh for s in plain.stgs]
+        assert [u.head for u in m.usrs] == [u.head for u in plain.usrs]
+        for u in m.usrs:
+            assert os.path.isfile(os.path.join(u.path_to_dir, u.head))
+    m = prepare(mod, "test_io_sharded_", 3, 5)
+    writer = AsyncBlockWriter(workers=2)
+    m.use_writer(writer)
+    m.run(ShardedExecutor(2))
+    writer.close()
+    assert [u.head for u in m.usrs] == [u.head for u in plain.usrs]
+    writer = AsyncBlockWriter(workers=1, max_pending=1)
+    future = writer.submit(os.path.join(m.path, "missing", "block"), "{}")
+    assert future.exception() is not None
+    try:
+        writer.flush()
+        assert False
+    except RuntimeError:
+        pass
+
+
+if __name__ == '__main__':
+    test_writer(Mod.Classic)
+    test_writer(Mod.Modified)
+    test_pending_reads(Mod.Classic)
+    test_pending_reads(Mod.Modified)
+    test_async_writer(Mod.Classic)
+    test_async_writer(Mod.Modified)
@@ -0,0 +1,55 @@
+from blockmesh.node import *
+from blockmesh.topology import Overlay, Topology, regular_edges
+from test_simple import prepare, stg_step, usr_step
+
+
+def run_scenario(mod, d, overlay=None):
+    stg, usr, time = prepare(mod, d, 6, 12)
+    if overlay:
+        overlay.build(stg)
+    usr_step(usr, 0, [1])
+    usr_step(usr, 2, [3])
+    usr_step(usr, 4, [11])
+    time.tick()
+    usr_step(usr, 7, [8])
+    stg_step(stg, time, 3)
+    return stg, usr
+
+
+def test_overlay(mod):
+    full, _ = run_scenario(mod, "test_full_")
+    for kind, degree in [(Topology.Ring, 2), (Topology.Regular, 3), (Topology.Hierarchical, 3)]:
+        overlay = Overlay(kind, degree)
+        stg, usr = run_scenario(mod, f"test_{kind.name}_", overlay)
+        for s in stg:
+            assert s.block_count == full[0].block_count
+            assert len(s.peers) < len(stg) - 1 or kind == Topology.Hierarchical
+        assert overlay.hops > 1 and overlay.unreached == 0
+
+
+def test_fanout(mod):
+    full, _ = run_scenario(mod, "test_full_")
+    for fanout, peak in ((1, 1), (None, 4)):
+        overlay = Overlay(Topology.Regular, 4, fanout=fanout, seed=1)
+        stg, _ = run_scenario(mod, f"test_fanout_{fanout}_", overlay)
+        # узел пересылает блок не более чем fanout соседям за шаг, источник - сразу всем при fanout=None
+        assert overlay.peak_fanout == peak and overlay.unreached == 0
+        assert overlay.messages >= overlay.get_stat()["Hops"] and overlay.messages >= len(stg) - 1
+        for s in stg:
+            assert s.block_mesh == stg[0].block_mesh == full[0].block_mesh
+            assert s.block_count == full[0].block_count
+
+
+def test_regular_edges():
+    for n in (4, 5, 6):
+        for degree in (n - 1, n, n + 3):
+            assert regular_edges(n, degree, 0) == {(i, j) for i in range(n) for j in range(i + 1, n)}
+    assert all(sum(i in e for e in regular_edges(6, 3, 0)) == 3 for i in range(6))
+
+
+if __name__ == '__main__':
+    test_overlay(Mod.Classic)
+    test_overlay(Mod.Modified)
+    test_fanout(Mod.Classic)
+    test_fanout(Mod.Modified)
+    test_regular_edges()
@@ -0,0 +1,39 @@
+import os
+from blockmesh.node import Mod
+from blockmesh.model import Model
+from blockmesh.parallel import ShardedExecutor
+from blockmesh.trace import TraceWriter, Replay, read, ROUND, ITER
+from test_engine import prepare
+
+
+def test_trace(mod):
+    m = prepare(mod, "test_trace_", 3, 5)
+    m.save()
+    m = Model.load(m.path)
+    path = os.path.join(m.path, "trace")
+    m.use_recorder(TraceWriter(path, m))
+    m.run(ShardedExecutor(2))
+    m.recorder.close(m)
+    header, events, footer = read(path)
+    assert header["num"] == [3, 5] and len(events) == m.recorder.events
+    assert sum(kind == ITER for kind, _, _, _ in events) == m.performed
+    assert any(kind == ROUND for kind, _, _, _ in events)
+    assert footer["heads"][0] == m.stgs[0].block_mesh
+    for memory in (False, True):
+        replay = Replay(path, memory=memory)
+        assert replay.run() == []
+        assert replay.model.performed == m.performed
+    replay = Replay(path, os.path.join(os.getcwd(), f"test_replay_{mod.name}"))
+    assert replay.run() == []
+    loaded = Model.load(replay.path_to_dir)
+    assert [s.block_mesh for s in loaded.stgs] == [s.block_mesh for s in m.stgs]
+    try:
+        TraceWriter(path, m)
+        assert False
+    except RuntimeError:
+        pass
+
+
+if __name__ == '__main__':
+    test_trace(Mod.Classic)
+    test_trace(Mod.Modified)